@@ -1,18 +1,65 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 from flask_cors import CORS
+import copy
 import json
+import logging
+import math
 import os
-import requests
-import akshare as ak
-import pandas as pd
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from market_cache import SpotSnapshotCache, DividendIndex, TTLCache
+from trading_calendar import TradingCalendar
+from kline_store import KlineStore
+from ma_table import MATable
+from upstream import DEFAULT_CALL_TIMEOUT, DEFAULT_CALL_TIMEOUTS, UpstreamClient
+from providers import create_provider
+from background import LeaderLock, PeriodicWorker
+from quote_stream import QuoteHub
+from tencent_quote import parse_quotes
+from ma_engine import DEFAULT_MA_WINDOWS, parse_windows, align_closes, moving_averages, latest_moving_averages
+from screener import SCREEN_FIELDS, parse_screen_query, build_columns, range_mask, ma_mask, order_rows
+from backtest import align_close_matrix, run_backtest
+from storage import RecordCollection, DocumentCollection, create_backend
+import metrics
 
 # 加载.env配置文件
 load_dotenv()
 
+# 日志级别可通过 LOG_LEVEL 配置（DEBUG/INFO/WARNING/ERROR），默认 INFO；低于该级别的日志不格式化、不输出
+logging.basicConfig(
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+)
+logger = logging.getLogger('app')
+
 app = Flask(__name__)
-CORS(app)  # 允许跨域请求
+CORS(app, expose_headers=['ETag'])  # 允许跨域请求，前端可以读取 ETag
+
+# 请求计时：按路由模板（而不是实际路径）统计耗时和状态码，并记录正在处理的请求数
+@app.before_request
+def start_request_timer():
+    g.request_started_at = time.perf_counter()
+    metrics.HTTP_IN_FLIGHT.inc()
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.HTTP_REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+    metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - g.request_started_at, method=request.method, route=route)
+    return response
+
+@app.teardown_request
+def finish_request(exception=None):
+    if 'request_started_at' in g:
+        metrics.HTTP_IN_FLIGHT.dec()
+
+# Prometheus 格式的运行指标
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
 
 # 数据存储目录
 DATA_DIR = os.path.join(os.path.dirname(__file__), os.getenv('DATA_DIR', 'data'))
@@ -29,104 +76,232 @@ BLOG_METADATA_FILE = os.path.join(DATA_DIR, 'blog_metadata.json')
 BUDGET_FILE = os.path.join(DATA_DIR, 'budget_settings.json')
 BUDGET_HISTORY_FILE = os.path.join(DATA_DIR, 'budget_history.json')
 
-# 读取JSON文件数据
-def read_json_file(file_path, max_retries=3, retry_delay=1):
-    for attempt in range(max_retries):
-        try:
-            if os.path.exists(file_path):
-                print(f"Reading file: {file_path} (attempt {attempt + 1})")
-                print(f"File exists: {os.path.exists(file_path)}")
-                print(f"File size: {os.path.getsize(file_path)} bytes")
-                
-                # 使用更安全的方式打开文件
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                    print(f"File content length: {len(content)} bytes")
-                    
-                    if not content:
-                        print("File is empty")
-                        return []
-                    
-                    # 尝试解析JSON
-                    try:
-                        return json.loads(content)
-                    except json.JSONDecodeError as json_err:
-                        print(f"JSON decode error on attempt {attempt + 1}: {str(json_err)}")
-                        print(f"First 50 chars: {content[:50]}")
-                        print(f"Last 50 chars: {content[-50:]}")
-                        
-                        # 尝试清理内容
-                        cleaned_content = content.strip()
-                        if not cleaned_content:
-                            return []
-                        
-                        # 如果是简单的JSON数组格式问题，尝试修复
-                        if cleaned_content.startswith('[') and not cleaned_content.endswith(']'):
-                            cleaned_content += ']'
-                            print(f"Fixed JSON by adding closing bracket")
-                            return json.loads(cleaned_content)
-                        elif cleaned_content.startswith('{') and not cleaned_content.endswith('}'):
-                            cleaned_content += '}'
-                            print(f"Fixed JSON by adding closing brace")
-                            return json.loads(cleaned_content)
-                        
-                        # 如果修复失败，继续重试
-                        raise
-            print(f"File not found: {file_path}")
-            return []
-        except Exception as e:
-            print(f"Error reading file {file_path} on attempt {attempt + 1}: {str(e)}")
-            print(f"Exception type: {type(e).__name__}")
-            
-            if attempt < max_retries - 1:
-                print(f"Retrying in {retry_delay} second(s)...")
-                import time
-                time.sleep(retry_delay)
-            else:
-                print(f"Max retries exceeded for file: {file_path}")
-                import traceback
-                traceback.print_exc()
-                return []
-    
-    # 理论上不会到达这里，但为了安全返回空列表
-    return []
+# 所有行情数据请求共用的上游客户端（连接池、超时、并发上限和重试）
+upstream = UpstreamClient(
+    connect_timeout=float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', 3)),
+    read_timeout=float(os.getenv('UPSTREAM_READ_TIMEOUT', 10)),
+    retries=int(os.getenv('UPSTREAM_RETRIES', 2)),
+    backoff=float(os.getenv('UPSTREAM_BACKOFF', 0.5)),
+    pool_size=int(os.getenv('UPSTREAM_POOL_SIZE', 10)),
+    max_per_host=int(os.getenv('UPSTREAM_MAX_PER_HOST', 4)),
+    call_timeout=float(os.getenv('UPSTREAM_CALL_TIMEOUT', DEFAULT_CALL_TIMEOUT)),
+    call_timeouts={'spot': float(os.getenv('UPSTREAM_SPOT_TIMEOUT', DEFAULT_CALL_TIMEOUTS['spot']))}
+)
 
-# 写入JSON文件数据
-def write_json_file(file_path, data):
+# 行情数据源，可通过 MARKET_DATA_PROVIDER=fixture 切换为离线回放数据
+market_data = create_provider(upstream)
+
+# 沪深交易日历，各类行情缓存的有效期由当前交易时段决定
+trading_calendar = TradingCalendar(loader=lambda: market_data.trade_dates())
+
+# 交易时段内实时报价和全市场快照的缓存时间（秒），休市期间缓存到下一次开盘
+QUOTE_CACHE_TTL = int(os.getenv('QUOTE_CACHE_TTL', 5))
+SPOT_CACHE_TTL = int(os.getenv('SPOT_CACHE_TTL', 60))
+
+# 实时报价缓存：带前缀代码 -> 报价
+quote_cache = TTLCache('quotes')
+
+# 全市场A股快照缓存
+spot_cache = SpotSnapshotCache(
+    loader=lambda: market_data.spot(),
+    lifetime=lambda: trading_calendar.quote_ttl(SPOT_CACHE_TTL)
+)
+
+# 全市场分红索引，每个交易日收盘后最多加载一次
+dividend_index = DividendIndex(
+    loader=lambda: market_data.dividends(),
+    lifetime=trading_calendar.daily_ttl
+)
+
+# 本地日K线存储（前复权），每个交易日收盘后同步一次，只下载最后存储日期之后的K线
+kline_store = KlineStore(
+    os.path.join(DATA_DIR, 'kline'),
+    fetcher=lambda code, start_date, end_date: market_data.daily_bars(code, start_date, end_date),
+    last_settle=trading_calendar.last_settle,
+    start_date=os.getenv('KLINE_START_DATE', '20150101')
+)
+
+# 每晚生成的全市场均线表（python ma_table.py），内存映射只读
+ma_table = MATable(os.path.join(DATA_DIR, 'ma_table.bin'))
+
+# 从全市场均线表读取最近一次收盘后已同步股票的均线，表不存在或损坏时返回空
+def precomputed_moving_averages(codes, windows):
     try:
-        # 使用os模块确保目录存在
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        
-        # 使用更安全的写入方式，先写入临时文件，再重命名
-        temp_file = file_path + '.tmp'
-        with open(temp_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        
-        # 原子性重命名，确保文件完整性
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        os.rename(temp_file, file_path)
-        
-        print(f"Successfully wrote to file: {file_path}")
+        return ma_table.fresh_averages(codes, windows, trading_calendar.last_settle().timestamp())
     except Exception as e:
-        print(f"Error writing to file {file_path}: {str(e)}")
-        print(f"Exception type: {type(e).__name__}")
-        import traceback
-        traceback.print_exc()
-        raise
+        logger.error("Error reading moving average table: %s", e)
+        return {}
+
+# 推荐元数据（随机漫步、温故知新）的默认结构
+def default_recommendation_metadata():
+    return {
+        'lastRecommendedId': None,
+        'recommendationCounts': {},
+        'readCounts': {},
+        'readingTimes': {}
+    }
+
+# 预算设置的默认结构
+def default_budgets():
+    return {
+        'monthly': {},
+        'default': {
+            'necessary': {
+                'total': 0
+            },
+            'discretionary': {
+                'total': 0
+            },
+            'categories': {
+                'food': 0,  # 餐饮
+                'gifts': 0,  # 人情
+                'medicalInsurance': 0,  # 医疗保险
+                'transport': 0,  # 交通
+                'housingUtilities': 0,  # 居住水电
+                'entertainment': 0,  # 娱乐
+                'dailyNecessities': 0,  # 生活用品
+                'clothing': 0,  # 服装
+                'pets': 0,  # 宠物
+                'travel': 0  # 旅行
+            },
+            'total': 0
+        }
+    }
+
+# 按日期排序的记录使用的排序键
+def record_date(record):
+    return datetime.strptime(record['date'], '%Y-%m-%d')
+
+# 下个月的第一天（该月日期范围的开区间上界）；9999-12 没有下个月，返回 datetime.max
+def next_month_start(moment):
+    if moment.year == datetime.max.year and moment.month == 12:
+        return datetime.max
+    return datetime(moment.year + moment.month // 12, moment.month % 12 + 1, 1)
+
+# 解析按月份查询的参数：?from=YYYY-MM&to=YYYY-MM（包含首尾两个月）或 ?year=YYYY，可以同时使用；
+# 返回日期范围 [low, high)，没有对应参数的一端为 None，参数不合法时抛出 ValueError
+def parse_month_range(args):
+    low = high = None
+    if args.get('year'):
+        year = int(args['year'])
+        low, high = datetime(year, 1, 1), next_month_start(datetime(year, 12, 1))
+    if args.get('from'):
+        start = datetime.strptime(args['from'], '%Y-%m')
+        low = max(low, start) if low else start
+    if args.get('to'):
+        end = next_month_start(datetime.strptime(args['to'], '%Y-%m'))
+        high = min(high, end) if high else end
+    return low, high
+
+# 带 ETag 的 GET 响应：请求的 If-None-Match 与仓库当前版本相同时返回 304，不再生成响应内容；
+# ETag 在生成内容之前读取，同时有修改时内容只会比 ETag 新，客户端下次请求会拿到完整的新数据
+def conditional_response(store, build):
+    etag = store.etag()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# 按日期范围查询记录，没有查询参数时返回全部记录
+def query_by_month(store):
+    try:
+        low, high = parse_month_range(request.args)
+    except ValueError:
+        return jsonify({'error': 'Invalid query parameters'}), 400
+    if low is None and high is None:
+        return conditional_response(store, store.get)
+    return conditional_response(store, lambda: store.between(low, high))
+
+# 每个数据文件一个仓库，解析后的数据保存在内存中，修改时写穿到存储后端（默认 JSON 文件，见 STORAGE_BACKEND）
+storage_backend = create_backend(DATA_DIR)
+asset_store = RecordCollection(ASSET_FILE, sort_key=record_date, backend=storage_backend)
+stock_store = RecordCollection(STOCK_FILE, backend=storage_backend)
+expense_store = RecordCollection(EXPENSE_FILE, sort_key=record_date, backend=storage_backend)
+random_walk_store = RecordCollection(RANDOM_WALK_FILE, backend=storage_backend)
+random_walk_metadata_store = DocumentCollection(RANDOM_WALK_METADATA_FILE, default_recommendation_metadata, backend=storage_backend)
+blog_store = RecordCollection(BLOG_FILE, backend=storage_backend)
+blog_metadata_store = DocumentCollection(BLOG_METADATA_FILE, default_recommendation_metadata, backend=storage_backend)
+budget_store = DocumentCollection(BUDGET_FILE, default_budgets, backend=storage_backend)
+budget_history_store = RecordCollection(BUDGET_HISTORY_FILE, backend=storage_backend)
+collections = [
+    asset_store, stock_store, expense_store, random_walk_store, random_walk_metadata_store,
+    blog_store, blog_metadata_store, budget_store, budget_history_store
+]
+
+# 整理所有仓库的存储（日志模式下把日志合并进快照，SQLite 下把 WAL 写回数据库文件）
+def compact_storage():
+    for collection in collections:
+        collection.compact()
+
+# 多个 worker 进程共享的后台任务（刷新股票行情、整理存储）只在其中一个进程中执行
+background_leader = LeaderLock(os.path.join(DATA_DIR, 'background.lock'))
+
+# 存储整理的后台任务，间隔（秒）可通过 STORAGE_COMPACT_INTERVAL 配置，0 表示不启用
+storage_compactor = PeriodicWorker(
+    'storage-compactor',
+    interval=int(os.getenv('STORAGE_COMPACT_INTERVAL', 600)),
+    task=compact_storage,
+    run_immediately=False,
+    leader=background_leader
+)
+
+# 支持增量同步的仓库：URL 中的名称 -> 仓库
+change_feeds = {
+    'assets': asset_store,
+    'stocks': stock_store,
+    'expenses': expense_store,
+    'random-walk': random_walk_store,
+    'random-walk/metadata': random_walk_metadata_store,
+    'blogs': blog_store,
+    'blogs/metadata': blog_metadata_store,
+    'budgets': budget_store,
+    'budgets/history': budget_history_store
+}
+
+# 增量同步：GET /api/<仓库>/changes?since=<版本号>&epoch=<epoch> 返回该版本之后新增、修改、删除的 id
+# （对象类仓库为顶层键）以及新增、修改的条目的当前内容，version 为当前版本号，下次同步时作为 since；
+# since 太旧（超出内存中保留的修改记录）或 epoch 不一致（版本号重新计数）时返回 reset，客户端需要重新获取全部数据
+@app.route('/api/<path:collection>/changes', methods=['GET'])
+def get_changes(collection):
+    store = change_feeds.get(collection)
+    if store is None:
+        return jsonify({'error': 'Unknown collection'}), 404
+    try:
+        since = int(request.args['since'])
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Invalid query parameters'}), 400
+
+    version, changes = store.changes_since(since)
+    epoch = request.args.get('epoch')
+    if changes is None or (epoch and epoch != store.epoch):
+        return jsonify({'epoch': store.epoch, 'version': version, 'reset': True})
+
+    ids = {
+        kind: [key for key, change in changes.items() if change == kind]
+        for kind in ('inserted', 'updated', 'deleted')
+    }
+    return jsonify({
+        'epoch': store.epoch,
+        'version': version,
+        'since': since,
+        'reset': False,
+        **ids,
+        'data': store.pick(ids['inserted'] + ids['updated'])
+    })
 
 # 资产记录API
 
-# 获取所有资产记录
+# 获取资产记录，GET /api/assets?from=2025-01&to=2025-06 或 ?year=2025 只返回该范围内的记录
 @app.route('/api/assets', methods=['GET'])
 def get_assets():
-    assets = read_json_file(ASSET_FILE)
-    return jsonify(assets)
+    return query_by_month(asset_store)
 
 # 添加资产记录
 @app.route('/api/assets', methods=['POST'])
 def add_asset():
-    assets = read_json_file(ASSET_FILE)
     data = request.get_json()
     
     new_asset = {
@@ -135,48 +310,37 @@ def add_asset():
         'date': datetime.now().strftime('%Y-%m-%d')  # 格式化为YYYY-MM-DD
     }
     
-    assets.append(new_asset)
-    # 按日期排序
-    assets.sort(key=lambda x: datetime.strptime(x['date'], '%Y-%m-%d'))
-    
-    write_json_file(ASSET_FILE, assets)
+    # 插入后按日期排序
+    assets = asset_store.insert(new_asset)
     return jsonify(assets)
 
 # 删除资产记录
 @app.route('/api/assets/<id>', methods=['DELETE'])
 def delete_asset(id):
-    assets = read_json_file(ASSET_FILE)
-    assets = [asset for asset in assets if asset['id'] != id]
-    
-    write_json_file(ASSET_FILE, assets)
+    assets = asset_store.delete(id)
     return jsonify(assets)
 
 # 清空所有资产记录
 @app.route('/api/assets', methods=['DELETE'])
 def clear_assets():
-    write_json_file(ASSET_FILE, [])
+    asset_store.clear()
     return jsonify([])
 
 # 获取最新资产记录
 @app.route('/api/assets/latest', methods=['GET'])
 def get_latest_asset():
-    assets = read_json_file(ASSET_FILE)
-    if assets:
-        return jsonify(assets[-1])
-    return jsonify(None)
+    return conditional_response(asset_store, lambda: (asset_store.get() or [None])[-1])
 
 # 股票数据API
 
 # 获取所有股票数据
 @app.route('/api/stocks', methods=['GET'])
 def get_stocks():
-    stocks = read_json_file(STOCK_FILE)
-    return jsonify(stocks)
+    return conditional_response(stock_store, stock_store.get)
 
 # 添加股票数据
 @app.route('/api/stocks', methods=['POST'])
 def add_stock():
-    stocks = read_json_file(STOCK_FILE)
     data = request.get_json()
     
     new_stock = {
@@ -185,300 +349,556 @@ def add_stock():
         'addedAt': datetime.now().isoformat()
     }
     
-    stocks.append(new_stock)
-    write_json_file(STOCK_FILE, stocks)
+    stocks = stock_store.insert(new_stock)
     return jsonify(stocks)
 
 # 删除股票数据
 @app.route('/api/stocks/<id>', methods=['DELETE'])
 def delete_stock(id):
-    stocks = read_json_file(STOCK_FILE)
-    stocks = [stock for stock in stocks if stock['id'] != id]
-    
-    write_json_file(STOCK_FILE, stocks)
+    stocks = stock_store.delete(id)
     return jsonify(stocks)
 
 # 更新股票数据
 @app.route('/api/stocks/<id>', methods=['PUT'])
 def update_stock(id):
-    stocks = read_json_file(STOCK_FILE)
     data = request.get_json()
-    
-    for i, stock in enumerate(stocks):
-        if stock['id'] == id:
-            stocks[i] = {
-                **stock,
-                **data
-            }
-            break
-    
-    write_json_file(STOCK_FILE, stocks)
+    stocks = stock_store.update_record(id, data)
     return jsonify(stocks)
 
 # 清空所有股票数据
 @app.route('/api/stocks', methods=['DELETE'])
 def clear_stocks():
-    write_json_file(STOCK_FILE, [])
+    stock_store.clear()
     return jsonify([])
 
-# 获取实时股票数据
-@app.route('/api/stocks/real-time/<symbol>', methods=['GET'])
-def get_real_time_stock_data(symbol):
+# A股代码转换为带市场前缀的代码
+def to_market_symbol(code):
+    if code.startswith('6') or code.startswith('5'):
+        # 沪市股票(6开头)和沪市ETF(5开头)
+        return f'sh{code}'
+    # 深市股票(0开头)和深市ETF(1开头)
+    return f'sz{code}'
+
+# 获取A股实时报价，返回 {带前缀代码: TencentQuote}
+# 优先使用缓存，缓存中没有或已过期的代码合并为一次腾讯接口请求
+def get_quotes(symbols):
+    quotes, misses = quote_cache.get_many(symbols)
+    if misses:
+        fetched = fetch_quotes(misses)
+        quote_cache.put_many(fetched, trading_calendar.quote_ttl(QUOTE_CACHE_TTL))
+        quotes.update(fetched)
+    return quotes
+
+# 使用腾讯财经接口批量获取A股实时报价，返回 {带前缀代码: TencentQuote}
+def fetch_quotes(symbols):
+    # 腾讯接口支持一次查询多个以逗号分隔的代码，响应中每个代码一条记录
+    return parse_quotes(market_data.quotes(symbols))
+
+# 根据已加载的分红索引计算股息率，不会触发分红数据的下载
+def apply_dividend_yield(result, stock_code, dividends):
     try:
-        # 设置请求头
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        # 验证是否为A股代码（纯数字）
-        if not symbol.isdigit():
-            return jsonify({'error': 'Only A-share stock codes are supported'}), 400
-        
-        # A股代码转换
-        if symbol.startswith('6') or symbol.startswith('5'):
-            # 沪市股票(6开头)和沪市ETF(5开头)
-            symbol = f'sh{symbol}'
+        annual_dividend = dividend_index.annual_dividend(stock_code, result['currentPrice'], dividends)
+        if annual_dividend is None:
+            result['dividendYield'] = 0
+            logger.debug("No dividend data found for stock code %s", stock_code)
+        elif result['currentPrice'] > 0:
+            result['dividendYield'] = round((annual_dividend / result['currentPrice']) * 100, 2)
         else:
-            # 深市股票(0开头)和深市ETF(1开头)
-            symbol = f'sz{symbol}'
-        
-        # 1. 获取实时报价
-        # 使用腾讯财经接口获取A股实时报价
-        quote_url = f"http://qt.gtimg.cn/q={symbol}"
-        quote_response = requests.get(quote_url, headers=headers)
-        quote_response.raise_for_status()
-        
-        # 解析腾讯财经实时报价数据
-        quote_data = quote_response.text
-        quote_info = quote_data.split('~')
-        
-        if len(quote_info) < 40:
-            return jsonify({'error': 'Stock not found'}), 404
+            result['dividendYield'] = 0
+    except Exception as e:
+        logger.exception("Error fetching dividend data: %s", e)
+        result['dividendYield'] = 0
+
+# 将快照缓存中的基本面数据（PE、PB、总市值等）写入结果
+def apply_fundamentals(result, stock_fundamental):
+    # 添加基本面数据到结果中，缺失字段按0处理
+    result['pe'] = stock_fundamental.get('市盈率-动态', 0)
+    result['pb'] = stock_fundamental.get('市净率', 0)
+    result['totalMarketValue'] = stock_fundamental.get('总市值', 0)
+    result['circulationMarketValue'] = stock_fundamental.get('流通市值', 0)
+    
+    # 计算总股本（总市值单位是元，总股本=总市值/当前价格）
+    current_price = result['currentPrice']
+    if current_price > 0 and result['totalMarketValue'] > 0:
+        # 总市值是元，当前价格是元/股，所以总股本 = 总市值 / 当前价格
+        result['totalShareCapital'] = round(result['totalMarketValue'] / current_price, 2)
+    else:
+        result['totalShareCapital'] = 0
+        logger.debug("Cannot calculate total share capital: current price or total market value is 0")
+
+# 如果获取基本面数据失败，设置默认值
+def apply_fundamental_defaults(result):
+    result['pe'] = 0
+    result['pb'] = 0
+    result['totalMarketValue'] = 0
+    result['circulationMarketValue'] = 0
+    result['totalShareCapital'] = 0
+    result['dividendYield'] = 0
+
+# 实时报价在时间预算内没有返回
+class QuoteTimeoutError(Exception):
+    pass
+
+# 并发获取数据时使用的线程池，超出时间预算的任务在后台继续执行并预热缓存
+fetch_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('FETCH_WORKERS', 8)),
+    thread_name_prefix='market-fetch'
+)
+
+# 时间预算上限（毫秒），超过时按上限处理
+MAX_REAL_TIME_BUDGET_MS = float(os.getenv('MAX_REAL_TIME_BUDGET_MS', 60000))
+
+# 解析 budget_ms 参数，返回秒数；未指定时使用 REAL_TIME_BUDGET_MS，
+# 0 表示等待全部数据源，但最多等待 MAX_REAL_TIME_BUDGET_MS；
+# 负数、inf、nan 视为无效参数，超过 MAX_REAL_TIME_BUDGET_MS 时按上限处理
+def parse_budget(value):
+    budget_ms = float(value) if value else float(os.getenv('REAL_TIME_BUDGET_MS', 2000))
+    if not math.isfinite(budget_ms) or budget_ms < 0:
+        raise ValueError(f'Invalid budget: {value}')
+    if budget_ms == 0 or budget_ms > MAX_REAL_TIME_BUDGET_MS:
+        budget_ms = MAX_REAL_TIME_BUDGET_MS
+    return budget_ms / 1000
+
+# 批量获取实时股票数据，返回 {股票代码: 结果}
+# 报价、基本面快照、分红索引和每只股票的K线并发获取，总耗时取决于最慢的数据源；
+# 超过时间预算仍未完成的数据源记录在结果的 pendingSources 中，加载失败的分红数据记录在 failedSources 中，对应字段不返回
+def get_real_time_results(codes, windows=DEFAULT_MA_WINDOWS, budget=None):
+    symbols = {code: to_market_symbol(code) for code in codes}
+    
+    # 所有股票共用一次腾讯报价请求
+    quote_future = fetch_executor.submit(get_quotes, list(symbols.values()))
+    spot_future = fetch_executor.submit(lambda: {code: spot_cache.get(code) for code in codes})
+    # 预先加载分红索引，之后只在已加载的索引中按代码查询，不再访问上游
+    dividend_future = fetch_executor.submit(dividend_index.current)
+    # 均线表中已有最新均线的股票不再读取K线
+    precomputed = precomputed_moving_averages(codes, windows)
+    kline_futures = {
+        code: fetch_executor.submit(kline_store.closes, code) for code in codes if code not in precomputed
+    }
+    
+    wait([quote_future, spot_future, dividend_future, *kline_futures.values()], timeout=budget)
+    
+    if not quote_future.done():
+        raise QuoteTimeoutError('Quote source did not respond within the time budget')
+    quotes = quote_future.result()
+    
+    fundamentals = None
+    if spot_future.done():
+        try:
+            fundamentals = spot_future.result()
+        except Exception as e:
+            logger.exception("Error fetching fundamental data for %s: %s", codes, e)
+    
+    dividends = None
+    if dividend_future.done() and dividend_future.exception() is not None:
+        logger.error("Error loading dividend index: %s", dividend_future.exception())
+    elif dividend_future.done():
+        dividends = dividend_future.result()
+    
+    results = {}
+    for code, symbol in symbols.items():
+        if symbol not in quotes:
+            results[code] = {'error': 'Stock not found'}
+            continue
         
         # 构建A股基本结果
-        result = {
-            'symbol': symbol,
-            'name': quote_info[1],  # 股票名称
-            'currentPrice': float(quote_info[3]) if quote_info[3] != '' else 0,  # 当前价格
-            'open': float(quote_info[5]) if quote_info[5] != '' else 0,  # 开盘价
-            'high': float(quote_info[33]) if quote_info[33] != '' else 0,  # 最高价
-            'low': float(quote_info[34]) if quote_info[34] != '' else 0,  # 最低价
-            'previousClose': float(quote_info[4]) if quote_info[4] != '' else 0,  # 昨收价
-            'volume': int(quote_info[36]) if quote_info[36] != '' else 0  # 成交量
-        }
+        result = {'symbol': symbol, **quotes[symbol].to_dict()}
+        pending = []
+        failed = []
+        if not spot_future.done():
+            pending.append('spot')
+        elif fundamentals is None:
+            apply_fundamental_defaults(result)
+        elif fundamentals[code] is not None:
+            apply_fundamentals(result, fundamentals[code])
+            if not dividend_future.done():
+                pending.append('dividend')
+            elif dividends is None:
+                failed.append('dividend')
+            else:
+                apply_dividend_yield(result, code, dividends)
         
-        # 3. 使用AkShare获取更多基本面数据（PE、PB、总市值等）
+        if code in kline_futures and not kline_futures[code].done():
+            pending.append('kline')
+        if pending:
+            result['pendingSources'] = pending
+        if failed:
+            result['failedSources'] = failed
+        results[code] = result
+    
+    # K线已就绪的股票一起计算均线
+    series_by_code = {}
+    for code, result in results.items():
+        if 'error' in result:
+            continue
+        if code in precomputed:
+            result.update(precomputed[code])
+            continue
+        if not kline_futures[code].done():
+            continue
         try:
-            # 获取所有A股的实时数据
-            print(f"Fetching A-share data for {symbol}")
-            a_share_data = ak.stock_zh_a_spot_em()
-            print(f"A-share data columns: {a_share_data.columns.tolist()}")
-            
-            # 获取股票代码（去掉sh/sz前缀）
-            stock_code = symbol[2:]
-            print(f"Looking for stock code: {stock_code}")
-            
-            # 根据股票代码筛选出对应的股票数据
-            stock_fundamental = a_share_data[a_share_data['代码'] == stock_code]
-            print(f"Stock fundamental data found: {not stock_fundamental.empty}")
-            
-            if not stock_fundamental.empty:
-                # 提取基本面数据
-                stock_fundamental = stock_fundamental.iloc[0]
-                print(f"Stock fundamental data: {stock_fundamental.to_dict()}")
-                
-                # 添加基本面数据到结果中
-                # 检查字段是否存在
-                if '市盈率-动态' in stock_fundamental:
-                    result['pe'] = float(stock_fundamental['市盈率-动态']) if stock_fundamental['市盈率-动态'] != '-' else 0
-                    print(f"PE value: {result['pe']}")
-                else:
-                    result['pe'] = 0
-                    print("'市盈率-动态' field not found")
-                
-                if '市净率' in stock_fundamental:
-                    result['pb'] = float(stock_fundamental['市净率']) if stock_fundamental['市净率'] != '-' else 0
-                    print(f"PB value: {result['pb']}")
-                else:
-                    result['pb'] = 0
-                    print("'市净率' field not found")
-                
-                if '总市值' in stock_fundamental:
-                    result['totalMarketValue'] = float(stock_fundamental['总市值']) if stock_fundamental['总市值'] != '-' else 0
-                    print(f"Total Market Value: {result['totalMarketValue']}")
-                else:
-                    result['totalMarketValue'] = 0
-                    print("'总市值' field not found")
-                
-                if '流通市值' in stock_fundamental:
-                    result['circulationMarketValue'] = float(stock_fundamental['流通市值']) if stock_fundamental['流通市值'] != '-' else 0
-                    print(f"Circulation Market Value: {result['circulationMarketValue']}")
-                else:
-                    result['circulationMarketValue'] = 0
-                    print("'流通市值' field not found")
-                
-                # 计算总股本（总市值单位是元，总股本=总市值/当前价格）
-                current_price = result['currentPrice']
-                print(f"Current price: {current_price}")
-                if current_price > 0 and result['totalMarketValue'] > 0:
-                    # 总市值是元，当前价格是元/股，所以总股本 = 总市值 / 当前价格
-                    result['totalShareCapital'] = round(result['totalMarketValue'] / current_price, 2)
-                    print(f"Total Share Capital: {result['totalShareCapital']}")
-                else:
-                    result['totalShareCapital'] = 0
-                    print("Cannot calculate total share capital: current price or total market value is 0")
-                
-                # 尝试获取股息率数据
-                try:
-                    # 获取所有股票的分红数据
-                    dividend_data = ak.stock_history_dividend()
-                    if not dividend_data.empty:
-                        # 根据股票代码筛选
-                        stock_dividend = dividend_data[dividend_data['代码'] == stock_code]
-                        if not stock_dividend.empty:
-                            stock_dividend = stock_dividend.iloc[0]
-                            
-                            # 初始化年均股息
-                            annual_dividend = 0
-                            
-                            # 首先尝试获取年均股息
-                            if '年均股息' in stock_dividend and stock_dividend['年均股息'] != '-':
-                                annual_dividend = float(stock_dividend['年均股息'])
-                            
-                            # 然后检查累计股息和上市日期，如果年均股息不合理则使用累计股息计算
-                            cumulative_dividend = 0
-                            years_listed = 0
-                            
-                            if '累计股息' in stock_dividend and stock_dividend['累计股息'] != '-':
-                                cumulative_dividend = float(stock_dividend['累计股息'])
-                            
-                            if '上市日期' in stock_dividend:
-                                try:
-                                    listing_date = datetime.strptime(stock_dividend['上市日期'], '%Y-%m-%d')
-                                    years_listed = (datetime.now() - listing_date).days / 365.25
-                                except ValueError:
-                                    print(f"Invalid listing date format: {stock_dividend['上市日期']}")
-                            
-                            # 检查年均股息是否合理
-                            # 如果年均股息为0，或者超过当前股价的10%（更严格的阈值），则使用累计股息计算
-                            if annual_dividend == 0 or (result['currentPrice'] > 0 and annual_dividend > result['currentPrice'] * 0.1):
-                                if cumulative_dividend > 0 and years_listed > 0:
-                                    annual_dividend = cumulative_dividend / years_listed
-                                    print(f"Adjusted annual dividend: {annual_dividend} (from cumulative {cumulative_dividend} over {years_listed:.1f} years)")
-                            
-                            # 计算股息率
-                            if result['currentPrice'] > 0:
-                                result['dividendYield'] = round((annual_dividend / result['currentPrice']) * 100, 2)
-                            else:
-                                result['dividendYield'] = 0
-                            
-                            print(f"Dividend Yield: {result['dividendYield']}%")
-                        else:
-                            result['dividendYield'] = 0
-                            print(f"No dividend data found for stock code {stock_code}")
-                    else:
-                        result['dividendYield'] = 0
-                        print("No dividend data found")
-                except Exception as e:
-                    print(f"Error fetching dividend data: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    result['dividendYield'] = 0
+            series_by_code[code] = kline_futures[code].result()
         except Exception as e:
-            print(f"Error fetching fundamental data for {symbol}: {e}")
-            import traceback
-            traceback.print_exc()
-            # 如果获取基本面数据失败，设置默认值
-            result['pe'] = 0
-            result['pb'] = 0
-            result['totalMarketValue'] = 0
-            result['circulationMarketValue'] = 0
-            result['totalShareCapital'] = 0
-            result['dividendYield'] = 0
+            logger.error("Error using AkShare for %s: %s", code, e)
+            # 如果AkShare调用失败，该股票所有均线值设为0
+            series_by_code[code] = []
+    
+    averages = latest_moving_averages(list(series_by_code.values()), windows)
+    for code, values in zip(series_by_code, averages):
+        results[code].update(values)
+    return results
+
+# 获取实时股票数据
+# 可选参数 ma 指定均线窗口，例如 ?ma=20,51,60,120,250,850；
+# budget_ms 指定时间预算（毫秒），例如 ?budget_ms=1500
+@app.route('/api/stocks/real-time/<symbol>', methods=['GET'])
+def get_real_time_stock_data(symbol):
+    try:
+        # 验证是否为A股代码（纯数字）
+        if not symbol.isdigit():
+            return jsonify({'error': 'Only A-share stock codes are supported'}), 400
         
-        # 2. 使用AkShare获取K线数据并计算移动平均线
         try:
-            # 获取最新数据，结束日期设为当前日期
-            end_date = datetime.now().strftime("%Y%m%d")
-            
-            # A股使用stock_zh_a_hist接口
-            ak_symbol = symbol[2:]
-            stock_data = ak.stock_zh_a_hist(
-                symbol=ak_symbol,
-                period="daily",
-                start_date="20150101",
-                end_date=end_date,
-                adjust="qfq"
-            )
-            
-            if not stock_data.empty:
-                # 计算各种移动平均线
-                if len(stock_data) >= 51:
-                    stock_data['ma51'] = stock_data['收盘'].rolling(window=51).mean()
-                    result['ma51'] = round(stock_data['ma51'].iloc[-1], 2)
-                else:
-                    result['ma51'] = 0
-                    
-                if len(stock_data) >= 120:
-                    stock_data['ma120'] = stock_data['收盘'].rolling(window=120).mean()
-                    result['ma120'] = round(stock_data['ma120'].iloc[-1], 2)
-                else:
-                    result['ma120'] = 0
-                    
-                if len(stock_data) >= 250:
-                    stock_data['ma250'] = stock_data['收盘'].rolling(window=250).mean()
-                    result['ma250'] = round(stock_data['ma250'].iloc[-1], 2)
-                else:
-                    result['ma250'] = 0
-                    
-                if len(stock_data) >= 850:
-                    stock_data['ma850'] = stock_data['收盘'].rolling(window=850).mean()
-                    result['ma850'] = round(stock_data['ma850'].iloc[-1], 2)
-                else:
-                    result['ma850'] = 0
-            else:
-                # 如果没有获取到K线数据，所有均线值设为0
-                result['ma51'] = 0
-                result['ma120'] = 0
-                result['ma250'] = 0
-                result['ma850'] = 0
-                
-        except Exception as e:
-            print(f"Error using AkShare for {symbol}: {e}")
-            # 如果AkShare调用失败，所有均线值设为0
-            result['ma51'] = 0
-            result['ma120'] = 0
-            result['ma250'] = 0
-            result['ma850'] = 0
+            windows = parse_windows(request.args.get('ma'))
+            budget = parse_budget(request.args.get('budget_ms'))
+        except ValueError:
+            return jsonify({'error': 'Invalid query parameters'}), 400
         
+        result = get_real_time_results([symbol], windows, budget)[symbol]
+        quote_hub.publish({symbol: result}, STREAM_FIELDS)
+        if 'error' in result:
+            return jsonify(result), 404
         return jsonify(result)
         
+    except QuoteTimeoutError as e:
+        return jsonify({'error': str(e), 'pendingSources': ['quote']}), 504
     except Exception as e:
-        print(f"Error fetching real-time stock data for {symbol}: {e}")
+        logger.error("Error fetching real-time stock data for %s: %s", symbol, e)
         return jsonify({'error': 'Failed to fetch real-time stock data'}), 500
 
+# 批量获取实时股票数据
+# GET /api/stocks/real-time?symbols=600031,000651&ma=51,120,250,850&budget_ms=1500
+@app.route('/api/stocks/real-time', methods=['GET'])
+def get_batch_real_time_stock_data():
+    try:
+        windows = parse_windows(request.args.get('ma'))
+        budget = parse_budget(request.args.get('budget_ms'))
+    except ValueError:
+        return jsonify({'error': 'Invalid query parameters'}), 400
+    
+    # 去除空白和重复代码，保持请求中的顺序
+    codes = []
+    for code in request.args.get('symbols', '').split(','):
+        code = code.strip()
+        if code and code not in codes:
+            codes.append(code)
+    
+    if not codes:
+        return jsonify({'error': 'Query parameter "symbols" is required'}), 400
+    
+    invalid_codes = [code for code in codes if not code.isdigit()]
+    valid_codes = [code for code in codes if code.isdigit()]
+    
+    try:
+        results = get_real_time_results(valid_codes, windows, budget) if valid_codes else {}
+    except QuoteTimeoutError as e:
+        return jsonify({'error': str(e), 'pendingSources': ['quote']}), 504
+    except Exception as e:
+        logger.error("Error fetching real-time stock data for %s: %s", valid_codes, e)
+        return jsonify({'error': 'Failed to fetch real-time stock data'}), 500
+    
+    quote_hub.publish(results, STREAM_FIELDS)
+    for code in invalid_codes:
+        results[code] = {'error': 'Only A-share stock codes are supported'}
+    return jsonify(results)
+
+# 后台刷新时写回股票数据文件的字段
+PORTFOLIO_FIELDS = ['currentPrice', 'ma51', 'ma120', 'ma250', 'ma850', 'pe', 'pb', 'totalShareCapital', 'dividendYield']
+
+# 实时推送的行情字段
+STREAM_FIELDS = ['currentPrice', 'open', 'high', 'low', 'previousClose', 'volume'] + PORTFOLIO_FIELDS[1:]
+
+# 跟踪股票的实时行情推送中心
+quote_hub = QuoteHub()
+
+# 读取股票数据文件中的股票代码，同时更新推送中心跟踪的股票
+def track_portfolio():
+    stocks = stock_store.get()
+    codes = list(dict.fromkeys(str(stock.get('code', '')) for stock in stocks))
+    codes = [code for code in codes if code.isdigit()]
+    quote_hub.set_tracked(codes)
+    return codes
+
+# 批量刷新所有跟踪股票的行情指标，并一次性写回股票数据文件
+def refresh_portfolio():
+    codes = track_portfolio()
+    if not codes:
+        return
+    
+    results = get_real_time_results(codes)
+    quote_hub.publish(results, STREAM_FIELDS)
+    refreshed_at = datetime.now().isoformat()
+    
+    # 行情获取耗时较长，获取完成后在仓库锁内基于最新的股票数据合并，不覆盖期间的其他修改
+    def merge_results(stocks):
+        ops = []
+        for stock in stocks:
+            result = results.get(str(stock.get('code', '')))
+            if not result or 'error' in result:
+                continue
+            # 未返回的字段保留原值
+            changes = {field: result[field] for field in PORTFOLIO_FIELDS if field in result}
+            changes['refreshedAt'] = refreshed_at
+            ops.append(('update', stock['id'], changes))
+        return ops
+    
+    stock_store.update(merge_results)
+    logger.info("Portfolio refreshed: %d stocks", len(codes))
+
+# 股票行情后台刷新任务，间隔（秒）可通过 PORTFOLIO_REFRESH_INTERVAL 配置，0 表示不启用；
+# 第一次刷新在启动一个间隔之后，worker 启动时不加载行情依赖
+portfolio_refresher = PeriodicWorker(
+    'portfolio-refresher',
+    interval=int(os.getenv('PORTFOLIO_REFRESH_INTERVAL', 300)),
+    task=refresh_portfolio,
+    run_immediately=False,
+    leader=background_leader
+)
+
+# 有客户端订阅实时推送时轮询跟踪股票的报价，所有客户端共用一次上游请求
+def poll_stream_quotes():
+    if not quote_hub.has_subscribers():
+        return
+    codes = track_portfolio()
+    if not codes:
+        return
+    symbols = {code: to_market_symbol(code) for code in codes}
+    quotes = get_quotes(list(symbols.values()))
+    quote_hub.publish(
+        {code: quotes[symbol].to_dict() for code, symbol in symbols.items() if symbol in quotes},
+        STREAM_FIELDS
+    )
+
+# 实时推送的报价轮询任务，间隔（秒）可通过 STREAM_POLL_INTERVAL 配置；
+# 推送连接由接受它的 worker 进程持有，每个进程轮询自己的订阅者，没有订阅者的进程不访问上游
+stream_poller = PeriodicWorker(
+    'stream-poller',
+    interval=int(os.getenv('STREAM_POLL_INTERVAL', 5)),
+    task=poll_stream_quotes
+)
+
+# 候选股票的最新均线，返回 {窗口: 与 codes 对齐的数组}
+# 只使用本地已存储的K线，不访问上游，没有本地K线或数据不足的股票为NaN
+def local_moving_averages(codes, windows):
+    series = []
+    for code in codes:
+        bars = kline_store.load(code)
+        series.append(bars['close'] if bars is not None else np.empty(0))
+    averages = moving_averages(align_closes(series), windows, tail=1)
+    return {
+        window: values[:, -1] if values.shape[1] else np.full(len(codes), np.nan)
+        for window, values in averages.items()
+    }
+
+# 全市场选股
+# GET /api/stocks/screen?minPe=0&maxPe=15&minDividendYield=3&aboveMa=250&sort=-dividendYield&limit=20
+# 在全市场快照的列式副本上用向量化比较筛选，均线条件只对通过其余条件的股票查询
+@app.route('/api/stocks/screen', methods=['GET'])
+def screen_stocks():
+    try:
+        query = parse_screen_query(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        table = spot_cache.table()
+        prices = table.columns.get('最新价', np.zeros(len(table)))
+        columns = build_columns(table, dividend_index.annual_dividends(table.codes, prices))
+    except Exception as e:
+        logger.error("Error loading market snapshot for screening: %s", e)
+        return jsonify({'error': 'Failed to load market snapshot'}), 500
+    
+    mask = range_mask(columns, query)
+    averages = {}
+    windows = query.ma_windows()
+    if windows:
+        candidates = np.nonzero(mask)[0]
+        candidate_codes = [table.codes[row] for row in candidates]
+        # 优先使用全市场均线表，表中没有的窗口用本地K线计算
+        try:
+            candidate_averages = ma_table.averages(candidate_codes, windows)
+            missing_windows = [window for window in windows if window not in ma_table.windows]
+        except Exception as e:
+            logger.error("Error reading moving average table: %s", e)
+            candidate_averages, missing_windows = {}, windows
+        if missing_windows:
+            candidate_averages.update(local_moving_averages(candidate_codes, missing_windows))
+        for window in windows:
+            averages[window] = np.full(len(table), np.nan)
+            averages[window][candidates] = candidate_averages[window]
+        mask &= ma_mask(columns['currentPrice'], averages, query)
+    
+    rows = np.nonzero(mask)[0]
+    results = []
+    for row in order_rows(columns, rows, query).tolist():
+        result = {'code': table.codes[row], 'name': table.names[row]}
+        for field in SCREEN_FIELDS:
+            result[field] = round(float(columns[field][row]), 2)
+        for window, values in averages.items():
+            result[f'ma{window}'] = 0 if np.isnan(values[row]) else round(float(values[row]), 2)
+        results.append(result)
+    
+    return jsonify({'total': int(len(rows)), 'results': results})
+
+# 解析 YYYY-MM-DD 或 YYYYMMDD 格式的日期参数，返回 YYYYMMDD 整数
+def parse_date_param(value):
+    if not value:
+        return None
+    return int(datetime.strptime(value.replace('-', ''), '%Y%m%d').strftime('%Y%m%d'))
+
+def format_date(value):
+    value = str(int(value))
+    return f'{value[:4]}-{value[4:6]}-{value[6:]}'
+
+# 回测持仓组合和买卖点规则
+# GET /api/stocks/backtest?from=2015-01-01&to=2025-12-31
+# 用本地K线构建 交易日×股票 的收盘价矩阵，计算按当前持股数的每日市值和回撤，
+# 以及"收盘价不高于买点买入、不低于卖点卖出"规则触发的成交和累计盈亏
+@app.route('/api/stocks/backtest', methods=['GET'])
+def backtest_stocks():
+    try:
+        start = parse_date_param(request.args.get('from'))
+        end = parse_date_param(request.args.get('to'))
+    except ValueError:
+        return jsonify({'error': 'Invalid date, expected YYYY-MM-DD'}), 400
+    if start and end and start > end:
+        return jsonify({'error': '"from" must not be later than "to"'}), 400
+    
+    stocks = [stock for stock in stock_store.get() if str(stock.get('code', '')).isdigit()]
+    
+    # 并发同步各股票的K线
+    futures = {stock['code']: fetch_executor.submit(kline_store.sync, stock['code']) for stock in stocks}
+    holdings = []
+    series = []
+    missing = []
+    for stock in stocks:
+        try:
+            bars = futures[stock['code']].result()
+        except Exception as e:
+            logger.error("Error loading kline for %s: %s", stock['code'], e)
+            bars = None
+        if bars is None or not len(bars['date']):
+            missing.append(stock['code'])
+            continue
+        holdings.append(stock)
+        series.append((bars['date'], bars['close']))
+    
+    dates, closes = align_close_matrix(series, start, end)
+    result = run_backtest(
+        closes,
+        [stock.get('shares', 0) or 0 for stock in holdings],
+        [stock.get('buyPoint', 0) or 0 for stock in holdings],
+        [stock.get('sellPoint', 0) or 0 for stock in holdings]
+    )
+    
+    values = result['values']
+    drawdowns = result['drawdowns']
+    trade_rows, trade_columns, trade_sides = result['trades']
+    trades = [
+        {
+            'date': format_date(dates[row]),
+            'code': holdings[column]['code'],
+            'name': holdings[column].get('name', ''),
+            'action': 'buy' if side > 0 else 'sell',
+            'price': round(float(closes[row, column]), 3),
+            'shares': holdings[column].get('shares', 0)
+        }
+        for row, column, side in zip(trade_rows.tolist(), trade_columns.tolist(), trade_sides.tolist())
+    ]
+    
+    portfolio = {'values': np.round(values, 2).tolist(), 'drawdowns': np.round(drawdowns * 100, 2).tolist()}
+    if len(dates):
+        worst = int(np.argmin(drawdowns))
+        start_value = float(values[0])
+        portfolio.update({
+            'startValue': round(start_value, 2),
+            'endValue': round(float(values[-1]), 2),
+            'return': round((float(values[-1]) / start_value - 1) * 100, 2) if start_value > 0 else 0,
+            'maxDrawdown': round(float(drawdowns[worst]) * 100, 2),
+            'maxDrawdownDate': format_date(dates[worst])
+        })
+    
+    positions = result['positions'][-1] if len(dates) else np.zeros(len(holdings), dtype=np.int8)
+    return jsonify({
+        'from': format_date(dates[0]) if len(dates) else None,
+        'to': format_date(dates[-1]) if len(dates) else None,
+        'dates': [format_date(date) for date in dates.tolist()],
+        'portfolio': portfolio,
+        'rules': {
+            'pnl': np.round(result['pnl'], 2).tolist(),
+            'trades': trades,
+            'stocks': {
+                stock['code']: {
+                    'pnl': round(float(result['stockPnl'][i]), 2),
+                    'holding': bool(positions[i])
+                }
+                for i, stock in enumerate(holdings)
+            }
+        },
+        'missing': missing
+    })
+
+# 跟踪股票实时行情推送（Server-Sent Events）
+# 连接建立后先推送 snapshot 事件（全部跟踪股票的当前行情），
+# 之后每当行情更新时推送 {代码: 变化字段}
+@app.route('/api/stocks/stream', methods=['GET'])
+def stream_stocks():
+    heartbeat = int(os.getenv('STREAM_HEARTBEAT_INTERVAL', 15))
+    
+    def generate():
+        subscriber = quote_hub.subscribe()
+        try:
+            snapshot = json.dumps(quote_hub.snapshot(), ensure_ascii=False)
+            yield f"event: snapshot\ndata: {snapshot}\n\n"
+            while not subscriber.closed:
+                changes = subscriber.get(timeout=heartbeat)
+                if changes is None:
+                    # 心跳注释，保持连接并及时发现断开的客户端
+                    yield ": heartbeat\n\n"
+                    continue
+                yield f"data: {json.dumps(changes, ensure_ascii=False)}\n\n"
+        finally:
+            quote_hub.unsubscribe(subscriber)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 # 生活费记录API
 
-# 获取所有生活费记录
+# 将 YYYY-MM 转换为该月最后一天的日期
+def month_end_date(month):
+    year, month = month.split('-')
+    # 下个月第一天的前一刻即该月的最后一天
+    date = next_month_start(datetime(int(year), int(month), 1)) - timedelta(microseconds=1)
+    return date.strftime('%Y-%m-%d')
+
+# 获取生活费记录，GET /api/expenses?from=2025-01&to=2025-06 或 ?year=2025 只返回该范围内的记录
 @app.route('/api/expenses', methods=['GET'])
 def get_expenses():
-    expenses = read_json_file(EXPENSE_FILE)
-    return jsonify(expenses)
+    return query_by_month(expense_store)
 
 # 添加生活费记录
 @app.route('/api/expenses', methods=['POST'])
 def add_expense():
-    expenses = read_json_file(EXPENSE_FILE)
     data = request.get_json()
     
     # 处理日期字段
     date = datetime.now().strftime('%Y-%m-%d')  # 默认当前日期
     if 'month' in data:
-        year, month = data['month'].split('-')
-        # 创建该月的最后一天作为日期
-        date = datetime(int(year), int(month), 1).replace(day=28) + timedelta(days=4)
-        date = date - timedelta(days=date.day)
-        date = date.strftime('%Y-%m-%d')
+        date = month_end_date(data['month'])
     
     new_expense = {
         **data,
@@ -486,76 +906,109 @@ def add_expense():
         'date': date
     }
     
-    expenses.append(new_expense)
-    # 按日期排序
-    expenses.sort(key=lambda x: datetime.strptime(x['date'], '%Y-%m-%d'))
-    
-    write_json_file(EXPENSE_FILE, expenses)
+    # 插入后按日期排序
+    expenses = expense_store.insert(new_expense)
     return jsonify(expenses)
 
 # 删除生活费记录
 @app.route('/api/expenses/<id>', methods=['DELETE'])
 def delete_expense(id):
-    expenses = read_json_file(EXPENSE_FILE)
-    expenses = [expense for expense in expenses if expense['id'] != id]
-    
-    write_json_file(EXPENSE_FILE, expenses)
+    expenses = expense_store.delete(id)
     return jsonify(expenses)
 
 # 更新生活费记录
 @app.route('/api/expenses/<id>', methods=['PUT'])
 def update_expense(id):
-    expenses = read_json_file(EXPENSE_FILE)
     data = request.get_json()
     
     # 处理日期字段
     if 'month' in data:
-        year, month = data['month'].split('-')
-        # 创建该月的最后一天作为日期
-        date = datetime(int(year), int(month), 1).replace(day=28) + timedelta(days=4)
-        date = date - timedelta(days=date.day)
-        data['date'] = date.strftime('%Y-%m-%d')
-    
-    for i, expense in enumerate(expenses):
-        if expense['id'] == id:
-            expenses[i] = {
-                **expense,
-                **data
-            }
-            break
-    
-    # 按日期排序
-    expenses.sort(key=lambda x: datetime.strptime(x['date'], '%Y-%m-%d'))
+        data['date'] = month_end_date(data['month'])
     
-    write_json_file(EXPENSE_FILE, expenses)
+    # 更新后按日期排序
+    expenses = expense_store.update_record(id, data)
     return jsonify(expenses)
 
 # 清空所有生活费记录
 @app.route('/api/expenses', methods=['DELETE'])
 def clear_expenses():
-    write_json_file(EXPENSE_FILE, [])
+    expense_store.clear()
     return jsonify([])
 
 # 获取最新生活费记录
 @app.route('/api/expenses/latest', methods=['GET'])
 def get_latest_expense():
-    expenses = read_json_file(EXPENSE_FILE)
-    if expenses:
-        return jsonify(expenses[-1])
-    return jsonify(None)
+    return conditional_response(expense_store, lambda: (expense_store.get() or [None])[-1])
+
+# 随机漫步和温故知新共用的推荐元数据操作
+
+# 新增记录时初始化推荐计数、已读计数和阅读时间
+def init_recommendation_metadata(metadata_store, id):
+    metadata_store.apply(
+        ('set', ['recommendationCounts', id], 0),
+        ('set', ['readCounts', id], 0),
+        ('set', ['readingTimes', id], [])
+    )
+
+# 删除记录时清除对应的元数据
+def remove_recommendation_metadata(metadata_store, id):
+    def remove(metadata):
+        ops = [
+            ('delete', [key, id]) for key in ('recommendationCounts', 'readCounts', 'readingTimes')
+            if id in metadata.get(key, {})
+        ]
+        if metadata.get('lastRecommendedId') == id:
+            ops.append(('set', ['lastRecommendedId'], None))
+        return ops
+    metadata_store.update(remove)
+
+# 随机推荐一条与上次不同的记录，并更新记录的最后推荐时间和推荐计数
+def recommend_record(record_store, metadata_store):
+    records = record_store.get()
+    if not records:
+        return None
+    
+    last_recommended_id = metadata_store.get().get('lastRecommendedId')
+    
+    # 选择与上次不同的记录
+    available_records = [record for record in records if record['id'] != last_recommended_id]
+    if not available_records:
+        # 如果只有一个记录，只能推荐它
+        available_records = records
+    
+    # 随机选择一个记录
+    import random
+    recommended_record = random.choice(available_records)
+    recommended_id = recommended_record['id']
+    
+    # 更新记录的最后推荐时间
+    recommended_record = {**recommended_record, 'lastRecommendedAt': datetime.now().isoformat()}
+    record_store.update_record(recommended_id, {'lastRecommendedAt': recommended_record['lastRecommendedAt']})
+    
+    # 更新元数据
+    metadata_store.apply(
+        ('set', ['lastRecommendedId'], recommended_id),
+        ('incr', ['recommendationCounts', recommended_id], 1)
+    )
+    return recommended_record
+
+# 已读计数加一并记录阅读时间
+def record_reading(metadata_store, id):
+    return metadata_store.apply(
+        ('incr', ['readCounts', id], 1),
+        ('append', ['readingTimes', id], datetime.now().isoformat())
+    )
 
 # 随机漫步记录API
 
 # 获取所有随机漫步记录
 @app.route('/api/random-walk', methods=['GET'])
 def get_random_walk_records():
-    records = read_json_file(RANDOM_WALK_FILE)
-    return jsonify(records)
+    return conditional_response(random_walk_store, random_walk_store.get)
 
 # 添加随机漫步记录
 @app.route('/api/random-walk', methods=['POST'])
 def add_random_walk_record():
-    records = read_json_file(RANDOM_WALK_FILE)
     data = request.get_json()
     
     new_record = {
@@ -565,175 +1018,51 @@ def add_random_walk_record():
         'lastRecommendedAt': None
     }
     
-    records.append(new_record)
-    write_json_file(RANDOM_WALK_FILE, records)
+    records = random_walk_store.insert(new_record)
     
     # 初始化元数据
-    metadata = read_json_file(RANDOM_WALK_METADATA_FILE)
-    if not metadata:
-        metadata = {
-            'lastRecommendedId': None,
-            'recommendationCounts': {},
-            'readCounts': {},
-            'readingTimes': {}
-        }
-    
-    if 'recommendationCounts' not in metadata:
-        metadata['recommendationCounts'] = {}
-    if 'readCounts' not in metadata:
-        metadata['readCounts'] = {}
-    if 'readingTimes' not in metadata:
-        metadata['readingTimes'] = {}
-    
-    metadata['recommendationCounts'][new_record['id']] = 0
-    metadata['readCounts'][new_record['id']] = 0
-    metadata['readingTimes'][new_record['id']] = []
-    
-    write_json_file(RANDOM_WALK_METADATA_FILE, metadata)
+    init_recommendation_metadata(random_walk_metadata_store, new_record['id'])
     
     return jsonify(records)
 
 # 删除随机漫步记录
 @app.route('/api/random-walk/<id>', methods=['DELETE'])
 def delete_random_walk_record(id):
-    records = read_json_file(RANDOM_WALK_FILE)
-    records = [record for record in records if record['id'] != id]
-    write_json_file(RANDOM_WALK_FILE, records)
+    records = random_walk_store.delete(id)
     
     # 删除元数据
-    metadata = read_json_file(RANDOM_WALK_METADATA_FILE)
-    if metadata:
-        if 'recommendationCounts' in metadata and id in metadata['recommendationCounts']:
-            del metadata['recommendationCounts'][id]
-        if 'readCounts' in metadata and id in metadata['readCounts']:
-            del metadata['readCounts'][id]
-        if 'readingTimes' in metadata and id in metadata['readingTimes']:
-            del metadata['readingTimes'][id]
-        if 'lastRecommendedId' in metadata and metadata['lastRecommendedId'] == id:
-            metadata['lastRecommendedId'] = None
-        write_json_file(RANDOM_WALK_METADATA_FILE, metadata)
+    remove_recommendation_metadata(random_walk_metadata_store, id)
     
     return jsonify(records)
 
 # 更新随机漫步记录
 @app.route('/api/random-walk/<id>', methods=['PUT'])
 def update_random_walk_record(id):
-    records = read_json_file(RANDOM_WALK_FILE)
     data = request.get_json()
-    
-    for i, record in enumerate(records):
-        if record['id'] == id:
-            records[i] = {
-                **record,
-                **data
-            }
-            break
-    
-    write_json_file(RANDOM_WALK_FILE, records)
+    records = random_walk_store.update_record(id, data)
     return jsonify(records)
 
 # 获取随机推荐
 @app.route('/api/random-walk/recommend', methods=['GET'])
 def recommend_random_walk():
-    records = read_json_file(RANDOM_WALK_FILE)
-    if not records:
-        return jsonify(None)
-    
-    metadata = read_json_file(RANDOM_WALK_METADATA_FILE)
-    if not metadata:
-        metadata = {
-            'lastRecommendedId': None,
-            'recommendationCounts': {},
-            'readCounts': {},
-            'readingTimes': {}
-        }
-    
-    if 'lastRecommendedId' not in metadata:
-        metadata['lastRecommendedId'] = None
-    if 'recommendationCounts' not in metadata:
-        metadata['recommendationCounts'] = {}
-    
-    last_recommended_id = metadata['lastRecommendedId']
-    
-    # 选择与上次不同的记录
-    available_records = [record for record in records if record['id'] != last_recommended_id]
-    if not available_records:
-        # 如果只有一个记录，只能推荐它
-        available_records = records
-    
-    # 随机选择一个记录
-    import random
-    recommended_record = random.choice(available_records)
-    
-    # 更新元数据
-    metadata['lastRecommendedId'] = recommended_record['id']
-    
-    if recommended_record['id'] not in metadata['recommendationCounts']:
-        metadata['recommendationCounts'][recommended_record['id']] = 0
-    metadata['recommendationCounts'][recommended_record['id']] += 1
-    
-    # 更新记录的最后推荐时间
-    for i, record in enumerate(records):
-        if record['id'] == recommended_record['id']:
-            records[i]['lastRecommendedAt'] = datetime.now().isoformat()
-            break
-    
-    write_json_file(RANDOM_WALK_FILE, records)
-    write_json_file(RANDOM_WALK_METADATA_FILE, metadata)
-    
-    return jsonify(recommended_record)
+    return jsonify(recommend_record(random_walk_store, random_walk_metadata_store))
 
 # 获取元数据（推荐计数、已读计数、阅读时间）
 @app.route('/api/random-walk/metadata', methods=['GET'])
 def get_random_walk_metadata():
-    metadata = read_json_file(RANDOM_WALK_METADATA_FILE)
-    if not metadata:
-        metadata = {
-            'lastRecommendedId': None,
-            'recommendationCounts': {},
-            'readCounts': {},
-            'readingTimes': {}
-        }
-    return jsonify(metadata)
+    return conditional_response(random_walk_metadata_store, random_walk_metadata_store.get)
 
 # 更新已读计数和阅读时间
 @app.route('/api/random-walk/<id>/read', methods=['POST'])
 def update_read_count(id):
-    metadata = read_json_file(RANDOM_WALK_METADATA_FILE)
-    if not metadata:
-        metadata = {
-            'lastRecommendedId': None,
-            'recommendationCounts': {},
-            'readCounts': {},
-            'readingTimes': {}
-        }
-    
-    if 'readCounts' not in metadata:
-        metadata['readCounts'] = {}
-    if 'readingTimes' not in metadata:
-        metadata['readingTimes'] = {}
-    
-    if id not in metadata['readCounts']:
-        metadata['readCounts'][id] = 0
-    metadata['readCounts'][id] += 1
-    
-    if id not in metadata['readingTimes']:
-        metadata['readingTimes'][id] = []
-    metadata['readingTimes'][id].append(datetime.now().isoformat())
-    
-    write_json_file(RANDOM_WALK_METADATA_FILE, metadata)
+    metadata = record_reading(random_walk_metadata_store, id)
     return jsonify(metadata)
 
 # 清空所有随机漫步记录
 @app.route('/api/random-walk', methods=['DELETE'])
 def clear_random_walk_records():
-    write_json_file(RANDOM_WALK_FILE, [])
-    write_json_file(RANDOM_WALK_METADATA_FILE, {
-        'lastRecommendedId': None,
-        'recommendationCounts': {},
-        'readCounts': {},
-        'readingTimes': {}
-    })
+    random_walk_store.clear()
+    random_walk_metadata_store.apply(('set', [], default_recommendation_metadata()))
     return jsonify([])
 
 # 温故知新API
@@ -741,13 +1070,11 @@ def clear_random_walk_records():
 # 获取所有博客数据
 @app.route('/api/blogs', methods=['GET'])
 def get_blogs():
-    blogs = read_json_file(BLOG_FILE)
-    return jsonify(blogs)
+    return conditional_response(blog_store, blog_store.get)
 
 # 添加博客数据
 @app.route('/api/blogs', methods=['POST'])
 def add_blog():
-    blogs = read_json_file(BLOG_FILE)
     data = request.get_json()
     
     new_blog = {
@@ -757,494 +1084,203 @@ def add_blog():
         'lastRecommendedAt': None
     }
     
-    blogs.append(new_blog)
-    write_json_file(BLOG_FILE, blogs)
+    blogs = blog_store.insert(new_blog)
     
     # 初始化元数据
-    metadata = read_json_file(BLOG_METADATA_FILE)
-    if not metadata:
-        metadata = {
-            'lastRecommendedId': None,
-            'recommendationCounts': {},
-            'readCounts': {},
-            'readingTimes': {}
-        }
-    
-    if 'recommendationCounts' not in metadata:
-        metadata['recommendationCounts'] = {}
-    if 'readCounts' not in metadata:
-        metadata['readCounts'] = {}
-    if 'readingTimes' not in metadata:
-        metadata['readingTimes'] = {}
-    
-    metadata['recommendationCounts'][new_blog['id']] = 0
-    metadata['readCounts'][new_blog['id']] = 0
-    metadata['readingTimes'][new_blog['id']] = []
-    
-    write_json_file(BLOG_METADATA_FILE, metadata)
+    init_recommendation_metadata(blog_metadata_store, new_blog['id'])
     
     return jsonify(blogs)
 
 # 删除博客数据
 @app.route('/api/blogs/<id>', methods=['DELETE'])
 def delete_blog(id):
-    blogs = read_json_file(BLOG_FILE)
-    blogs = [blog for blog in blogs if blog['id'] != id]
-    write_json_file(BLOG_FILE, blogs)
+    blogs = blog_store.delete(id)
     
     # 删除元数据
-    metadata = read_json_file(BLOG_METADATA_FILE)
-    if metadata:
-        if 'recommendationCounts' in metadata and id in metadata['recommendationCounts']:
-            del metadata['recommendationCounts'][id]
-        if 'readCounts' in metadata and id in metadata['readCounts']:
-            del metadata['readCounts'][id]
-        if 'readingTimes' in metadata and id in metadata['readingTimes']:
-            del metadata['readingTimes'][id]
-        if 'lastRecommendedId' in metadata and metadata['lastRecommendedId'] == id:
-            metadata['lastRecommendedId'] = None
-        write_json_file(BLOG_METADATA_FILE, metadata)
+    remove_recommendation_metadata(blog_metadata_store, id)
     
     return jsonify(blogs)
 
 # 获取随机推荐博客
 @app.route('/api/blogs/recommend', methods=['GET'])
 def recommend_blog():
-    blogs = read_json_file(BLOG_FILE)
-    if not blogs:
-        return jsonify(None)
-    
-    metadata = read_json_file(BLOG_METADATA_FILE)
-    if not metadata:
-        metadata = {
-            'lastRecommendedId': None,
-            'recommendationCounts': {},
-            'readCounts': {},
-            'readingTimes': {}
-        }
-    
-    if 'lastRecommendedId' not in metadata:
-        metadata['lastRecommendedId'] = None
-    if 'recommendationCounts' not in metadata:
-        metadata['recommendationCounts'] = {}
-    
-    last_recommended_id = metadata['lastRecommendedId']
-    
-    # 选择与上次不同的博客
-    available_blogs = [blog for blog in blogs if blog['id'] != last_recommended_id]
-    if not available_blogs:
-        # 如果只有一个博客，只能推荐它
-        available_blogs = blogs
-    
-    # 随机选择一个博客
-    import random
-    recommended_blog = random.choice(available_blogs)
-    
-    # 更新元数据
-    metadata['lastRecommendedId'] = recommended_blog['id']
-    
-    if recommended_blog['id'] not in metadata['recommendationCounts']:
-        metadata['recommendationCounts'][recommended_blog['id']] = 0
-    metadata['recommendationCounts'][recommended_blog['id']] += 1
-    
-    # 更新博客的最后推荐时间
-    for i, blog in enumerate(blogs):
-        if blog['id'] == recommended_blog['id']:
-            blogs[i]['lastRecommendedAt'] = datetime.now().isoformat()
-            break
-    
-    write_json_file(BLOG_FILE, blogs)
-    write_json_file(BLOG_METADATA_FILE, metadata)
-    
-    return jsonify(recommended_blog)
+    return jsonify(recommend_record(blog_store, blog_metadata_store))
 
 # 更新博客阅读信息
 @app.route('/api/blogs/<id>/read', methods=['POST'])
 def update_blog_read_info(id):
-    metadata = read_json_file(BLOG_METADATA_FILE)
-    if not metadata:
-        metadata = {
-            'lastRecommendedId': None,
-            'recommendationCounts': {},
-            'readCounts': {},
-            'readingTimes': {}
-        }
-    
-    if 'readCounts' not in metadata:
-        metadata['readCounts'] = {}
-    if 'readingTimes' not in metadata:
-        metadata['readingTimes'] = {}
-    
-    if id not in metadata['readCounts']:
-        metadata['readCounts'][id] = 0
-    metadata['readCounts'][id] += 1
-    
-    if id not in metadata['readingTimes']:
-        metadata['readingTimes'][id] = []
-    metadata['readingTimes'][id].append(datetime.now().isoformat())
-    
-    write_json_file(BLOG_METADATA_FILE, metadata)
+    metadata = record_reading(blog_metadata_store, id)
     return jsonify(metadata)
 
 # 清空所有博客数据
 @app.route('/api/blogs', methods=['DELETE'])
 def clear_blogs():
-    write_json_file(BLOG_FILE, [])
-    write_json_file(BLOG_METADATA_FILE, {
-        'lastRecommendedId': None,
-        'recommendationCounts': {},
-        'readCounts': {},
-        'readingTimes': {}
-    })
+    blog_store.clear()
+    blog_metadata_store.apply(('set', [], default_recommendation_metadata()))
     return jsonify([])
 
 # 预算管理API
 
+# 必要消费类别
+NECESSARY_CATEGORIES = ['food', 'gifts', 'medicalInsurance', 'transport', 'housingUtilities']
+
+# 按默认预算创建某个历史月份的预算
+def new_month_budget(default_budget):
+    return {
+        'necessary': {
+            'total': default_budget['necessary']['total']
+        },
+        'discretionary': {
+            'total': default_budget['discretionary']['total']
+        },
+        'categories': default_budget['categories'].copy(),
+        'total': default_budget['total'],
+        'createdAt': datetime.now().isoformat(),
+        'updatedAt': datetime.now().isoformat()
+    }
+
+# 根据分类预算重新计算必要、可选和总预算
+def update_budget_totals(budget):
+    necessaryTotal = sum(budget['categories'][cat] for cat in NECESSARY_CATEGORIES)
+    discretionaryTotal = sum(budget['categories'][cat] for cat in budget['categories'] if cat not in NECESSARY_CATEGORIES)
+    budget['necessary']['total'] = necessaryTotal
+    budget['discretionary']['total'] = discretionaryTotal
+    budget['total'] = necessaryTotal + discretionaryTotal
+
+# 某个月份预算的可修改副本，不存在时按默认预算创建
+def editable_month_budget(budgets, month):
+    if month in budgets['monthly']:
+        return copy.deepcopy(budgets['monthly'][month])
+    return new_month_budget(budgets['default'])
+
 # 获取所有预算设置
 @app.route('/api/budgets', methods=['GET'])
 def get_budgets():
-    budgets = read_json_file(BUDGET_FILE)
-    if not budgets:
-        # 返回默认预算结构
-        return jsonify({
-            'monthly': {},
-            'default': {
-                'necessary': {
-                    'total': 0
-                },
-                'discretionary': {
-                    'total': 0
-                },
-                'categories': {
-                    'food': 0,  # 餐饮
-                    'gifts': 0,  # 人情
-                    'medicalInsurance': 0,  # 医疗保险
-                    'transport': 0,  # 交通
-                    'housingUtilities': 0,  # 居住水电
-                    'entertainment': 0,  # 娱乐
-                    'dailyNecessities': 0,  # 生活用品
-                    'clothing': 0,  # 服装
-                    'pets': 0,  # 宠物
-                    'travel': 0  # 旅行
-                },
-                'total': 0
-            }
-        })
-    return jsonify(budgets)
+    return conditional_response(budget_store, budget_store.get)
 
 # 获取预算历史记录
 @app.route('/api/budgets/history', methods=['GET'])
 def get_budget_history():
-    history = read_json_file(BUDGET_HISTORY_FILE)
-    return jsonify(history)
+    return conditional_response(budget_history_store, budget_history_store.get)
 
 # 设置月度预算
 @app.route('/api/budgets', methods=['POST'])
 def set_monthly_budget():
-    budgets = read_json_file(BUDGET_FILE)
-    if not budgets:
-        budgets = {
-            'monthly': {},
-            'default': {
-                'necessary': {
-                    'total': 0
-                },
-                'discretionary': {
-                    'total': 0
-                },
-                'categories': {
-                    'food': 0,
-                    'gifts': 0,
-                    'medicalInsurance': 0,
-                    'transport': 0,
-                    'housingUtilities': 0,
-                    'entertainment': 0,
-                    'dailyNecessities': 0,
-                    'clothing': 0,
-                    'pets': 0,
-                    'travel': 0
-                },
-                'total': 0
-            }
-        }
-    
     data = request.get_json()
     month = data['month']
     category = data['category']
     amount = data['amount']
     
-    # 必要消费类别
-    necessaryCategories = ['food', 'gifts', 'medicalInsurance', 'transport', 'housingUtilities']
-    categoryType = 'necessary' if category in necessaryCategories else 'discretionary'
-    
     # 获取当前时间和月份
     currentDate = datetime.now()
     currentMonth = f"{currentDate.year}-{currentDate.month:02d}"
     
-    # 初始化预算历史
-    history = read_json_file(BUDGET_HISTORY_FILE)
-    if not history:
-        history = []
-    
-    if month < currentMonth:
-        # 更新历史月份的预算
-        if month not in budgets['monthly']:
-            # 如果该月份没有预算记录，创建一个新的记录
-            budgets['monthly'][month] = {
-                'necessary': {
-                    'total': budgets['default']['necessary']['total']
-                },
-                'discretionary': {
-                    'total': budgets['default']['discretionary']['total']
-                },
-                'categories': budgets['default']['categories'].copy(),
-                'total': budgets['default']['total'],
-                'createdAt': datetime.now().isoformat(),
-                'updatedAt': datetime.now().isoformat()
-            }
+    history_record = {}
+    
+    def change_budget(budgets):
+        if month < currentMonth:
+            # 更新历史月份的预算，该月份没有预算记录时创建一个新的记录
+            budget = editable_month_budget(budgets, month)
+            path = ['monthly', month]
+            change_type = 'historical_budget_change'
+        else:
+            # 更新默认预算（影响当前及未来月份）
+            budget = copy.deepcopy(budgets['default'])
+            path = ['default']
+            change_type = 'default_budget_change'
         
         # 记录旧金额
-        oldAmount = budgets['monthly'][month]['categories'][category] if category in budgets['monthly'][month]['categories'] else 0
-        
-        # 更新分类预算
-        budgets['monthly'][month]['categories'][category] = amount
-        
-        # 更新该月份的总预算
-        necessaryTotal = sum(budgets['monthly'][month]['categories'][cat] for cat in necessaryCategories)
-        discretionaryTotal = sum(budgets['monthly'][month]['categories'][cat] for cat in budgets['monthly'][month]['categories'] if cat not in necessaryCategories)
-        budgets['monthly'][month]['necessary']['total'] = necessaryTotal
-        budgets['monthly'][month]['discretionary']['total'] = discretionaryTotal
-        budgets['monthly'][month]['total'] = necessaryTotal + discretionaryTotal
-        
-        # 更新更新时间
-        budgets['monthly'][month]['updatedAt'] = datetime.now().isoformat()
-        
-        # 记录预算变更历史
-        history.append({
-            'id': str(datetime.now().timestamp()),
-            'month': month,
-            'category': category,
-            'oldAmount': oldAmount,
-            'newAmount': amount,
-            'timestamp': datetime.now().isoformat(),
-            'type': 'historical_budget_change'
-        })
-    else:
-        # 更新默认预算（影响当前及未来月份）
-        oldAmount = budgets['default']['categories'][category] if category in budgets['default']['categories'] else 0
-        
-        # 更新分类预算
-        budgets['default']['categories'][category] = amount
+        oldAmount = budget['categories'][category] if category in budget['categories'] else 0
         
-        # 更新默认总预算
-        necessaryTotal = sum(budgets['default']['categories'][cat] for cat in necessaryCategories)
-        discretionaryTotal = sum(budgets['default']['categories'][cat] for cat in budgets['default']['categories'] if cat not in necessaryCategories)
-        budgets['default']['necessary']['total'] = necessaryTotal
-        budgets['default']['discretionary']['total'] = discretionaryTotal
-        budgets['default']['total'] = necessaryTotal + discretionaryTotal
+        # 更新分类预算和总预算
+        budget['categories'][category] = amount
+        update_budget_totals(budget)
+        if change_type == 'historical_budget_change':
+            budget['updatedAt'] = datetime.now().isoformat()
         
-        # 记录预算变更历史
-        history.append({
+        # 预算变更历史
+        history_record.update({
             'id': str(datetime.now().timestamp()),
             'month': month,
             'category': category,
             'oldAmount': oldAmount,
             'newAmount': amount,
             'timestamp': datetime.now().isoformat(),
-            'type': 'default_budget_change'
+            'type': change_type
         })
+        return [('set', path, budget)]
     
     # 保存预算数据
-    write_json_file(BUDGET_FILE, budgets)
+    budgets = budget_store.update(change_budget)
     # 保存预算历史
-    write_json_file(BUDGET_HISTORY_FILE, history)
+    budget_history_store.insert(history_record)
     
     return jsonify(budgets)
 
 # 清空所有预算数据
 @app.route('/api/budgets', methods=['DELETE'])
 def clear_budgets():
-    write_json_file(BUDGET_FILE, {
-        'monthly': {},
-        'default': {
-            'necessary': {
-                'total': 0
-            },
-            'discretionary': {
-                'total': 0
-            },
-            'categories': {
-                'food': 0,
-                'gifts': 0,
-                'medicalInsurance': 0,
-                'transport': 0,
-                'housingUtilities': 0,
-                'entertainment': 0,
-                'dailyNecessities': 0,
-                'clothing': 0,
-                'pets': 0,
-                'travel': 0
-            },
-            'total': 0
-        }
-    })
-    write_json_file(BUDGET_HISTORY_FILE, [])
-    return jsonify({
-        'monthly': {},
-        'default': {
-            'necessary': {
-                'total': 0
-            },
-            'discretionary': {
-                'total': 0
-            },
-            'categories': {
-                'food': 0,
-                'gifts': 0,
-                'medicalInsurance': 0,
-                'transport': 0,
-                'housingUtilities': 0,
-                'entertainment': 0,
-                'dailyNecessities': 0,
-                'clothing': 0,
-                'pets': 0,
-                'travel': 0
-            },
-            'total': 0
-        }
-    })
+    budget_store.apply(('set', [], default_budgets()))
+    budget_history_store.clear()
+    return jsonify(default_budgets())
 
 # 更新预算历史记录
 @app.route('/api/budgets/history/<id>', methods=['PUT'])
 def update_budget_history_record(id):
-    history = read_json_file(BUDGET_HISTORY_FILE)
-    budgets = read_json_file(BUDGET_FILE)
-    if not budgets:
-        budgets = {
-            'monthly': {},
-            'default': {
-                'necessary': {
-                    'total': 0
-                },
-                'discretionary': {
-                    'total': 0
-                },
-                'categories': {
-                    'food': 0,
-                    'gifts': 0,
-                    'medicalInsurance': 0,
-                    'transport': 0,
-                    'housingUtilities': 0,
-                    'entertainment': 0,
-                    'dailyNecessities': 0,
-                    'clothing': 0,
-                    'pets': 0,
-                    'travel': 0
-                },
-                'total': 0
-            }
-        }
-    
     data = request.get_json()
-    record_index = next((i for i, item in enumerate(history) if str(item['id']) == id), None)
-    
-    if record_index is None:
-        return jsonify({'error': 'Record not found'}), 404
+    updated_record = {}
     
     # 更新历史记录
-    history[record_index] = {
-        **history[record_index],
-        **data,
-        'updatedAt': datetime.now().isoformat()
-    }
+    def change_record(history):
+        record = next((item for item in history if str(item['id']) == id), None)
+        if record is None:
+            return []
+        changes = {**data, 'updatedAt': datetime.now().isoformat()}
+        updated_record.update({**record, **changes})
+        return [('update', record['id'], changes)]
+    
+    budget_history_store.update(change_record)
+    if not updated_record:
+        return jsonify({'error': 'Record not found'}), 404
     
     # 更新预算数据
-    updated_record = history[record_index]
     category = updated_record['category']
     amount = updated_record['newAmount']
-    necessaryCategories = ['food', 'gifts', 'medicalInsurance', 'transport', 'housingUtilities']
-    categoryType = 'necessary' if category in necessaryCategories else 'discretionary'
-    
-    if updated_record['type'] == 'historical_budget_change':
-        month = updated_record['month']
-        if month not in budgets['monthly']:
-            budgets['monthly'][month] = {
-                'necessary': {
-                    'total': budgets['default']['necessary']['total']
-                },
-                'discretionary': {
-                    'total': budgets['default']['discretionary']['total']
-                },
-                'categories': budgets['default']['categories'].copy(),
-                'total': budgets['default']['total'],
-                'createdAt': datetime.now().isoformat(),
-                'updatedAt': datetime.now().isoformat()
-            }
-        
-        budgets['monthly'][month]['categories'][category] = amount
-        
-        # 更新该月份的总预算
-        necessaryTotal = sum(budgets['monthly'][month]['categories'][cat] for cat in necessaryCategories)
-        discretionaryTotal = sum(budgets['monthly'][month]['categories'][cat] for cat in budgets['monthly'][month]['categories'] if cat not in necessaryCategories)
-        budgets['monthly'][month]['necessary']['total'] = necessaryTotal
-        budgets['monthly'][month]['discretionary']['total'] = discretionaryTotal
-        budgets['monthly'][month]['total'] = necessaryTotal + discretionaryTotal
-        budgets['monthly'][month]['updatedAt'] = datetime.now().isoformat()
-    else:
+    
+    def change_budget(budgets):
+        if updated_record['type'] == 'historical_budget_change':
+            month = updated_record['month']
+            budget = editable_month_budget(budgets, month)
+            budget['categories'][category] = amount
+            update_budget_totals(budget)
+            budget['updatedAt'] = datetime.now().isoformat()
+            return [('set', ['monthly', month], budget)]
         # 更新默认预算
-        budgets['default']['categories'][category] = amount
-        
-        # 更新默认总预算
-        necessaryTotal = sum(budgets['default']['categories'][cat] for cat in necessaryCategories)
-        discretionaryTotal = sum(budgets['default']['categories'][cat] for cat in budgets['default']['categories'] if cat not in necessaryCategories)
-        budgets['default']['necessary']['total'] = necessaryTotal
-        budgets['default']['discretionary']['total'] = discretionaryTotal
-        budgets['default']['total'] = necessaryTotal + discretionaryTotal
+        budget = copy.deepcopy(budgets['default'])
+        budget['categories'][category] = amount
+        update_budget_totals(budget)
+        return [('set', ['default'], budget)]
     
-    # 保存数据
-    write_json_file(BUDGET_HISTORY_FILE, history)
-    write_json_file(BUDGET_FILE, budgets)
+    budget_store.update(change_budget)
     
     return jsonify(updated_record)
 
 # 删除预算历史记录
 @app.route('/api/budgets/history/<id>', methods=['DELETE'])
 def delete_budget_history_record(id):
-    history = read_json_file(BUDGET_HISTORY_FILE)
-    budgets = read_json_file(BUDGET_FILE)
-    if not budgets:
-        budgets = {
-            'monthly': {},
-            'default': {
-                'necessary': {
-                    'total': 0
-                },
-                'discretionary': {
-                    'total': 0
-                },
-                'categories': {
-                    'food': 0,
-                    'gifts': 0,
-                    'medicalInsurance': 0,
-                    'transport': 0,
-                    'housingUtilities': 0,
-                    'entertainment': 0,
-                    'dailyNecessities': 0,
-                    'clothing': 0,
-                    'pets': 0,
-                    'travel': 0
-                },
-                'total': 0
-            }
-        }
+    deleted_record = {}
     
-    record_index = next((i for i, item in enumerate(history) if str(item['id']) == id), None)
+    def remove_record(history):
+        record = next((item for item in history if str(item['id']) == id), None)
+        if record is None:
+            return []
+        deleted_record.update(record)
+        return [('delete', record['id'])]
     
-    if record_index is None:
+    history = budget_history_store.update(remove_record)
+    if not deleted_record:
         return jsonify({'error': 'Record not found'}), 404
     
-    deleted_record = history.pop(record_index)
-    
     # 如果删除的是历史月份的预算，需要重新计算该月份的预算
     if deleted_record['type'] == 'historical_budget_change':
         month = deleted_record['month']
@@ -1256,33 +1292,41 @@ def delete_budget_history_record(id):
                            and item['month'] == month 
                            and item['category'] == category]
         
-        if remaining_records:
-            # 使用剩余的最新记录恢复预算
-            remaining_records.sort(key=lambda x: datetime.fromisoformat(x['timestamp']))
-            latest_record = remaining_records[-1]
-            budgets['monthly'][month]['categories'][category] = latest_record['newAmount']
-        else:
-            # 没有剩余记录，使用默认预算
-            if month in budgets['monthly']:
-                budgets['monthly'][month]['categories'][category] = budgets['default']['categories'][category]
-        
-        if month in budgets['monthly']:
+        def restore_budget(budgets):
+            if month not in budgets['monthly']:
+                return []
+            budget = copy.deepcopy(budgets['monthly'][month])
+            if remaining_records:
+                # 使用剩余的最新记录恢复预算
+                latest_record = sorted(remaining_records, key=lambda x: datetime.fromisoformat(x['timestamp']))[-1]
+                budget['categories'][category] = latest_record['newAmount']
+            else:
+                # 没有剩余记录，使用默认预算
+                budget['categories'][category] = budgets['default']['categories'][category]
             # 更新该月份的总预算
-            necessaryCategories = ['food', 'gifts', 'medicalInsurance', 'transport', 'housingUtilities']
-            necessaryTotal = sum(budgets['monthly'][month]['categories'][cat] for cat in necessaryCategories)
-            discretionaryTotal = sum(budgets['monthly'][month]['categories'][cat] for cat in budgets['monthly'][month]['categories'] if cat not in necessaryCategories)
-            budgets['monthly'][month]['necessary']['total'] = necessaryTotal
-            budgets['monthly'][month]['discretionary']['total'] = discretionaryTotal
-            budgets['monthly'][month]['total'] = necessaryTotal + discretionaryTotal
-    
-    # 保存数据
-    write_json_file(BUDGET_HISTORY_FILE, history)
-    write_json_file(BUDGET_FILE, budgets)
+            update_budget_totals(budget)
+            return [('set', ['monthly', month], budget)]
+        
+        budget_store.update(restore_budget)
     
     return jsonify(deleted_record)
 
+# 启动后台任务
+def start_background_tasks():
+    if portfolio_refresher.interval > 0:
+        portfolio_refresher.start()
+    if stream_poller.interval > 0:
+        stream_poller.start()
+    if storage_compactor.interval > 0:
+        storage_compactor.start()
+
+# gunicorn 导入模块时启动后台任务；直接运行时只在调试重载器的子进程中启动，避免重复执行
+if __name__ != '__main__':
+    start_background_tasks()
 
 if __name__ == '__main__':
+    if os.getenv('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_tasks()
     port = int(os.getenv('FLASK_RUN_PORT', 5001))
     host = os.getenv('FLASK_RUN_HOST', '0.0.0.0')
     app.run(debug=True, port=port, host=host)
@@ -0,0 +1,73 @@
+import fcntl
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+# 多个 gunicorn worker 进程中选出一个执行共享的后台任务：持有锁文件排他 flock 的进程为 leader。
+# 锁在进程退出时由操作系统释放，其他进程在下一次尝试时接手
+class LeaderLock:
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    # 不阻塞地尝试成为 leader，已经是 leader 时直接返回 True
+    def acquire(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return True
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            self._fd = fd
+            self._pid = os.getpid()
+            logger.info("Process %d is now running the shared background tasks", self._pid)
+            return True
+
+
+# 后台周期任务
+# 在守护线程中每隔 interval 秒执行一次 task，任务异常只打印不中断循环；
+# 指定 leader 时只在持有 leader 锁的进程中执行，其余进程每个周期尝试接手
+class PeriodicWorker:
+    def __init__(self, name, interval, task, run_immediately=True, leader=None):
+        self.name = name
+        self.interval = interval
+        self.task = task
+        self.run_immediately = run_immediately
+        self.leader = leader
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        try:
+            self.task()
+        except Exception as e:
+            logger.exception("Background task %s failed: %s", self.name, e)
+
+    def _loop(self):
+        if not self.run_immediately:
+            if self._stop.wait(self.interval):
+                return
+        while not self._stop.is_set():
+            if self.leader is None or self.leader.acquire():
+                self.run_once()
+            if self._stop.wait(self.interval):
+                break
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+        logger.info("Background task %s started, interval %ss", self.name, self.interval)
+
+    def stop(self):
+        self._stop.set()
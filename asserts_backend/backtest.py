@@ -0,0 +1,75 @@
+import numpy as np
+
+
+# 将各股票的日K线按日期对齐为二维收盘价矩阵（行：交易日，列：股票）
+# series_list 为 [(日期数组 YYYYMMDD, 收盘价数组), ...]，只保留 [start, end] 范围内的日期；
+# 某只股票停牌或尚未上市的日期用前一个收盘价填充，上市之前为NaN
+def align_close_matrix(series_list, start=None, end=None):
+    all_dates = [np.asarray(dates, dtype=np.int64) for dates, _ in series_list]
+    dates = np.unique(np.concatenate(all_dates)) if all_dates else np.empty(0, dtype=np.int64)
+    if start is not None:
+        dates = dates[dates >= start]
+    if end is not None:
+        dates = dates[dates <= end]
+
+    matrix = np.full((len(dates), len(series_list)), np.nan)
+    for j, (series_dates, closes) in enumerate(series_list):
+        series_dates = np.asarray(series_dates, dtype=np.int64)
+        if not len(series_dates) or not len(dates):
+            continue
+        # 每个交易日取不晚于当天的最后一根K线
+        positions = np.searchsorted(series_dates, dates, side='right') - 1
+        listed = positions >= 0
+        matrix[listed, j] = np.asarray(closes, dtype=np.float64)[positions[listed]]
+    return dates, matrix
+
+
+# 回撤序列（相对历史最高点的跌幅，非正数）
+def drawdown(values):
+    peaks = np.maximum.accumulate(values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(peaks > 0, values / peaks - 1, 0.0)
+
+
+# 按买卖点规则计算每个交易日的持仓状态（1：持有，0：空仓）
+# 收盘价不高于买点时买入，不低于卖点时卖出，期初空仓；
+# 持仓状态等于最近一次出现的信号，通过对信号位置做累计最大值向前填充，无需逐日循环
+def rule_positions(closes, buy_points, sell_points):
+    signals = np.where(closes >= sell_points, -1, np.where(closes <= buy_points, 1, 0))
+    rows = np.arange(len(closes))[:, None]
+    last_signal_row = np.maximum.accumulate(np.where(signals != 0, rows, -1), axis=0)
+    columns = np.arange(closes.shape[1])[None, :]
+    last_signal = np.where(last_signal_row >= 0, signals[np.clip(last_signal_row, 0, None), columns], 0)
+    return (last_signal == 1).astype(np.int8)
+
+
+# 回测持仓组合和买卖点规则
+# closes 为对齐后的收盘价矩阵，shares/buy_points/sell_points 为每只股票的持股数和买卖点；
+# 持仓组合按当前持股数计算每日市值，规则策略每次触发买卖点时按持股数在收盘价成交，
+# 返回每日市值、回撤、规则策略的累计盈亏和成交记录（按日期、股票排序的下标）
+def run_backtest(closes, shares, buy_points, sell_points):
+    shares = np.asarray(shares, dtype=np.float64)
+    buy_points = np.asarray(buy_points, dtype=np.float64)
+    sell_points = np.asarray(sell_points, dtype=np.float64)
+    filled = np.nan_to_num(closes, nan=0.0)
+
+    # 持仓组合市值（尚未上市的股票按0计算）
+    values = filled @ shares
+    drawdowns = drawdown(values)
+
+    # 规则策略：买入时现金流出、卖出时现金流入，盈亏 = 累计现金流 + 持仓市值
+    positions = rule_positions(closes, buy_points, sell_points)
+    changes = np.diff(positions, axis=0, prepend=0)
+    cash_flows = -changes * shares * filled
+    stock_pnl = np.cumsum(cash_flows, axis=0) + positions * shares * filled
+    pnl = stock_pnl.sum(axis=1)
+
+    trade_rows, trade_columns = np.nonzero(changes)
+    return {
+        'values': values,
+        'drawdowns': drawdowns,
+        'positions': positions,
+        'pnl': pnl,
+        'stockPnl': stock_pnl[-1] if len(stock_pnl) else np.zeros(len(shares)),
+        'trades': (trade_rows, trade_columns, changes[trade_rows, trade_columns])
+    }
@@ -0,0 +1,285 @@
+# 实时股票数据接口的延迟与吞吐压测
+#
+# 使用离线回放数据源（合成数据 + 可配置的模拟上游延迟，只替换最底层的 HTTP 请求和 akshare 函数，
+# 请求合并、并发上限、重试和上游指标都照常生效），通过 Flask 测试客户端
+# 在不同并发数和持仓规模下压测 /api/stocks/real-time，输出 JSON 格式的结果，
+# 便于在不同提交之间对比：
+#
+#     python bench_real_time.py --output bench.json
+#     python bench_real_time.py --concurrency 1,10 --portfolio 5,20 --latency-ms 100 --mode batch
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+
+# 生成合成的回放数据：报价、全市场快照、分红数据、日K线
+def make_fixtures(fixture_dir, codes, bars=2600, seed=0):
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.join(fixture_dir, 'kline'), exist_ok=True)
+    end = datetime.now()
+    dates = pd.bdate_range(end=end, periods=bars).strftime('%Y-%m-%d')
+
+    quote_lines = []
+    spot_rows = []
+    dividend_rows = []
+    for code in codes:
+        closes = np.round(10 * np.exp(np.cumsum(rng.normal(0, 0.02, bars))), 2)
+        pd.DataFrame({
+            '日期': dates,
+            '开盘': closes,
+            '收盘': closes,
+            '最高': np.round(closes * 1.01, 2),
+            '最低': np.round(closes * 0.99, 2),
+            '成交量': rng.integers(1000, 100000, bars)
+        }).to_csv(os.path.join(fixture_dir, 'kline', f'{code}.csv'), index=False)
+
+        price = closes[-1]
+        fields = [''] * 50
+        fields[0] = '1'
+        fields[1] = f'股票{code}'
+        fields[2] = code
+        fields[3] = str(price)
+        fields[4] = str(closes[-2])
+        fields[5] = str(closes[-2])
+        fields[33] = str(round(price * 1.01, 2))
+        fields[34] = str(round(price * 0.99, 2))
+        fields[36] = str(int(rng.integers(1000, 100000)))
+        symbol = f'sh{code}' if code.startswith(('6', '5')) else f'sz{code}'
+        quote_lines.append(f'v_{symbol}="' + '~'.join(fields) + '";')
+
+        spot_rows.append({
+            '代码': code,
+            '名称': f'股票{code}',
+            '最新价': price,
+            '市盈率-动态': round(float(rng.uniform(5, 50)), 2),
+            '市净率': round(float(rng.uniform(0.5, 8)), 2),
+            '总市值': float(price * 1e9),
+            '流通市值': float(price * 8e8)
+        })
+        dividend_rows.append({
+            '代码': code,
+            '名称': f'股票{code}',
+            '上市日期': '2005-01-01',
+            '累计股息': round(float(rng.uniform(0, 20)), 2),
+            '年均股息': round(float(rng.uniform(0, 1)), 2),
+            '分红次数': int(rng.integers(0, 20))
+        })
+
+    with open(os.path.join(fixture_dir, 'quotes.txt'), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(quote_lines) + '\n')
+    pd.DataFrame(spot_rows).to_csv(os.path.join(fixture_dir, 'spot.csv'), index=False)
+    pd.DataFrame(dividend_rows).to_csv(os.path.join(fixture_dir, 'dividend.csv'), index=False)
+
+
+def make_codes(count):
+    half = (count + 1) // 2
+    return [f'{600000 + i:06d}' for i in range(half)] + [f'{1 + i:06d}' for i in range(count - half)]
+
+
+# 清空行情缓存和本地K线，使每个场景都从冷缓存开始
+def reset_caches(app):
+    from market_cache import SpotSnapshotCache, DividendIndex, TTLCache
+    app.quote_cache = TTLCache('quotes')
+    app.spot_cache = SpotSnapshotCache(loader=app.spot_cache.loader, lifetime=app.spot_cache.lifetime)
+    app.dividend_index = DividendIndex(loader=app.dividend_index.loader, lifetime=app.dividend_index.lifetime)
+    shutil.rmtree(app.kline_store.base_dir, ignore_errors=True)
+    os.makedirs(app.kline_store.base_dir, exist_ok=True)
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 3) if values else None
+
+
+# 运行一个场景：concurrency 个客户端各自对持仓执行 rounds 轮刷新
+def run_scenario(app, codes, concurrency, rounds, mode, budget_ms):
+    from metrics import UPSTREAM_CALLS, UPSTREAM_RETRIES, UPSTREAM_ERRORS
+    reset_caches(app)
+    provider = app.market_data
+    provider_calls_before = sum(provider.calls.values())
+    upstream_before = (UPSTREAM_CALLS.total(), UPSTREAM_RETRIES.total(), UPSTREAM_ERRORS.total())
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    query = f'budget_ms={budget_ms}' if budget_ms else ''
+
+    def client():
+        test_client = app.app.test_client()
+        local_latencies = []
+        local_errors = 0
+        for _ in range(rounds):
+            if mode == 'batch':
+                urls = [f'/api/stocks/real-time?symbols={",".join(codes)}&{query}']
+            else:
+                urls = [f'/api/stocks/real-time/{code}?{query}' for code in codes]
+            for url in urls:
+                start = time.perf_counter()
+                response = test_client.get(url)
+                local_latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    provider_calls = sum(provider.calls.values()) - provider_calls_before
+    upstream_calls, upstream_retries, upstream_errors = (
+        after - before for after, before in
+        zip((UPSTREAM_CALLS.total(), UPSTREAM_RETRIES.total(), UPSTREAM_ERRORS.total()), upstream_before)
+    )
+    return {
+        'mode': mode,
+        'portfolio': len(codes),
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'elapsedSeconds': round(elapsed, 3),
+        'throughputRps': round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+        'latencyMs': {
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': percentile(latencies, 100)
+        },
+        # 数据源方法的调用次数，以及请求合并后实际发往上游的次数
+        'providerCallsPerRequest': round(provider_calls / len(latencies), 3) if latencies else None,
+        'upstreamCallsPerRequest': round(upstream_calls / len(latencies), 3) if latencies else None,
+        'upstreamRetries': upstream_retries,
+        'upstreamErrors': upstream_errors,
+        # 运行场景的子进程的峰值内存
+        'peakRssMb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+
+# 在 fork 出的子进程中运行一个场景，峰值内存只反映该场景（从导入 app 后的内存开始），
+# 不受之前场景的影响
+def run_isolated(app, *args):
+    receiver, sender = multiprocessing.get_context('fork').Pipe(duplex=False)
+
+    def target():
+        with contextlib.redirect_stdout(sys.stderr):
+            sender.send(run_scenario(app, *args))
+
+    process = multiprocessing.get_context('fork').Process(target=target)
+    process.start()
+    result = receiver.recv()
+    process.join()
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def parse_int_list(value):
+    return [int(item) for item in value.split(',') if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the real-time stock endpoint against offline market data')
+    parser.add_argument('--concurrency', default='1,10,50', help='comma-separated client counts')
+    parser.add_argument('--portfolio', default='5,20,50,200', help='comma-separated portfolio sizes')
+    parser.add_argument('--rounds', type=int, default=3, help='portfolio refreshes per client')
+    parser.add_argument('--mode', choices=['single', 'batch'], default='single',
+                        help='single: one request per symbol, batch: one request per refresh')
+    parser.add_argument('--latency-ms', type=float, default=50, help='simulated upstream latency per call')
+    parser.add_argument('--budget-ms', type=int, default=0, help='budget_ms passed to the endpoint')
+    parser.add_argument('--session', choices=['trading', 'closed'], default='trading',
+                        help='market session used to derive cache lifetimes')
+    parser.add_argument('--output', help='write the JSON report to this file')
+    args = parser.parse_args()
+
+    concurrency_levels = parse_int_list(args.concurrency)
+    portfolio_sizes = parse_int_list(args.portfolio)
+
+    work_dir = tempfile.mkdtemp(prefix='bench_real_time_')
+    fixture_dir = os.path.join(work_dir, 'fixtures')
+    make_fixtures(fixture_dir, make_codes(max(portfolio_sizes)))
+
+    # 导入 app 之前配置离线数据源，并关闭后台任务
+    os.environ.update({
+        'MARKET_DATA_PROVIDER': 'fixture',
+        'MARKET_DATA_FIXTURES': fixture_dir,
+        'FIXTURE_LATENCY_MS': str(args.latency_ms),
+        'DATA_DIR': os.path.join(work_dir, 'data'),
+        'PORTFOLIO_REFRESH_INTERVAL': '0',
+        'STREAM_POLL_INTERVAL': '0'
+    })
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    # 服务端日志输出到 stderr，stdout 只输出 JSON 结果
+    with contextlib.redirect_stdout(sys.stderr):
+        import app
+
+    # 固定交易时段，使缓存有效期与运行时间无关
+    from trading_calendar import SHANGHAI_TZ
+    monday = datetime.now(SHANGHAI_TZ).date()
+    monday -= timedelta(days=monday.weekday())
+    fixed_now = datetime(monday.year, monday.month, monday.day,
+                         10 if args.session == 'trading' else 20, 0, tzinfo=SHANGHAI_TZ)
+    app.trading_calendar.loader = None
+    app.trading_calendar.now = lambda: fixed_now
+
+    results = []
+    try:
+        for portfolio in portfolio_sizes:
+            codes = make_codes(max(portfolio_sizes))[:portfolio]
+            for concurrency in concurrency_levels:
+                result = run_isolated(app, codes, concurrency, args.rounds, args.mode, args.budget_ms)
+                results.append(result)
+                print(f"[{args.mode}] portfolio={portfolio} concurrency={concurrency} "
+                      f"p50={result['latencyMs']['p50']}ms p95={result['latencyMs']['p95']}ms "
+                      f"p99={result['latencyMs']['p99']}ms upstream/req={result['upstreamCallsPerRequest']}",
+                      file=sys.stderr)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'benchmark': 'real_time',
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(),
+        'python': sys.version.split()[0],
+        'config': {
+            'mode': args.mode,
+            'rounds': args.rounds,
+            'latencyMs': args.latency_ms,
+            'budgetMs': args.budget_ms,
+            'session': args.session
+        },
+        'results': results
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
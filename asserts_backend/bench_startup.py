@@ -0,0 +1,120 @@
+# 后端启动时间与空闲内存压测
+#
+# 在全新的子进程中导入 app 并请求一次记账接口，记录导入耗时、首个请求耗时和峰值内存，
+# 对比行情依赖延迟导入（lazy）与在导入 app 之前先导入 akshare/pandas（eager，
+# 即改为延迟导入之前的行为）两种情况；这两种情况关闭了后台任务。
+# default 使用部署时的默认配置（后台任务开启，数据目录为 data/ 的副本，有跟踪的股票），
+# 首个请求后再空闲 --settle 秒，检查后台任务是否在启动后不久就加载了行情依赖。输出 JSON 格式的结果：
+#
+#     python bench_startup.py --output startup.json
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+# 子进程中执行的测量脚本
+CHILD_SCRIPT = '''
+import json, resource, sys, time
+started = time.perf_counter()
+settle = float(sys.argv[2])
+if sys.argv[1] == 'eager':
+    import akshare, pandas
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get('/api/expenses')
+served = time.perf_counter()
+time.sleep(settle)
+print(json.dumps({
+    'importMs': (imported - started) * 1000,
+    'firstRequestMs': (served - imported) * 1000,
+    'readyMs': (served - started) * 1000,
+    'status': response.status_code,
+    'rssMb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'marketDataLoaded': 'akshare' in sys.modules or 'pandas' in sys.modules
+}))
+'''
+
+
+def measure(mode, data_dir, settle=0):
+    env = dict(os.environ)
+    env['DATA_DIR'] = data_dir
+    if mode != 'default':
+        env.update({'PORTFOLIO_REFRESH_INTERVAL': '0', 'STREAM_POLL_INTERVAL': '0'})
+    output = subprocess.check_output(
+        [sys.executable, '-c', CHILD_SCRIPT, mode, str(settle)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stderr=subprocess.DEVNULL
+    )
+    # app 导入时可能有日志输出，测量结果在最后一行
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def summarize(samples):
+    summary = {'runs': len(samples), 'status': samples[-1]['status'],
+               'marketDataLoaded': samples[-1]['marketDataLoaded']}
+    for key in ('importMs', 'firstRequestMs', 'readyMs', 'rssMb'):
+        summary[key] = round(statistics.median(sample[key] for sample in samples), 1)
+    return summary
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark backend startup time and idle memory')
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes per mode (median is reported)')
+    parser.add_argument('--settle', type=float, default=10,
+                        help='seconds to stay idle after the first request in the default configuration')
+    parser.add_argument('--output', help='write the JSON report to this file')
+    args = parser.parse_args()
+
+    source_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.getenv('DATA_DIR', 'data'))
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='bench_startup_') as data_dir:
+        default_dir = os.path.join(data_dir, 'default')
+        shutil.copytree(source_dir, default_dir, ignore=shutil.ignore_patterns('kline', '*.lock', '*.tmp'))
+        for mode in ('lazy', 'eager', 'default'):
+            settle = args.settle if mode == 'default' else 0
+            mode_dir = default_dir if mode == 'default' else data_dir
+            results[mode] = summarize([measure(mode, mode_dir, settle) for _ in range(args.runs)])
+            print(f"[{mode}] import={results[mode]['importMs']}ms ready={results[mode]['readyMs']}ms "
+                  f"rss={results[mode]['rssMb']}MB market data loaded={results[mode]['marketDataLoaded']}",
+                  file=sys.stderr)
+
+    report = {
+        'benchmark': 'startup',
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(),
+        'python': sys.version.split()[0],
+        'results': results,
+        'settleSeconds': args.settle,
+        'savings': {
+            'readyMs': round(results['eager']['readyMs'] - results['lazy']['readyMs'], 1),
+            'rssMb': round(results['eager']['rssMb'] - results['lazy']['rssMb'], 1),
+            # 默认配置下空闲时的内存节省，后台任务在启动后不久加载行情依赖时接近 0
+            'defaultRssMb': round(results['eager']['rssMb'] - results['default']['rssMb'], 1)
+        }
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 日K线按列存储的字段：akshare列名 -> 存储列名
+BAR_COLUMNS = {
+    '开盘': 'open',
+    '收盘': 'close',
+    '最高': 'high',
+    '最低': 'low',
+    '成交量': 'volume'
+}
+
+# 比较前复权收盘价时允许的误差
+PRICE_TOLERANCE = 1e-6
+
+
+# 本地日K线存储
+# 每只股票一个 .npz 列式文件（日期 + 开高低收量），同步时只下载最后存储日期之后的K线；
+# 若重叠K线的前复权价格发生变化（除权除息导致复权因子改变），则重新下载整个序列。
+# last_settle 返回最近一次收盘数据确定的时间，在此之后同步过的股票不再访问上游
+class KlineStore:
+    def __init__(self, base_dir, fetcher, start_date='20150101', last_settle=None):
+        self.base_dir = base_dir
+        self.fetcher = fetcher
+        self.start_date = start_date
+        self.last_settle = last_settle
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        os.makedirs(base_dir, exist_ok=True)
+
+    def _path(self, code):
+        return os.path.join(self.base_dir, f'{code}.npz')
+
+    def _lock(self, code):
+        with self._locks_guard:
+            if code not in self._locks:
+                self._locks[code] = threading.Lock()
+            return self._locks[code]
+
+    # 本地已存储K线的全部股票代码
+    def stored_codes(self):
+        return [name[:-4] for name in os.listdir(self.base_dir) if name.endswith('.npz')]
+
+    # 读取本地存储的K线，不存在时返回None
+    def load(self, code):
+        path = self._path(code)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return {key: data[key] for key in data.files}
+
+    # 先写临时文件再替换，避免读到写了一半的文件；临时文件名按进程和线程区分，多个 worker 同时同步同一只股票时互不影响
+    def _save(self, code, bars):
+        path = self._path(code)
+        temp_file = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_file, 'wb') as f:
+            np.savez(f, **bars)
+        os.replace(temp_file, path)
+
+    # 从上游下载指定日期范围的K线并转换为列数组
+    def _fetch(self, code, start_date, end_date):
+        data = self.fetcher(code, start_date, end_date)
+        if data is None or data.empty:
+            return None
+        # 数据源返回的是 DataFrame，此时 pandas 已经导入
+        import pandas as pd
+        bars = {'date': pd.to_datetime(data['日期']).dt.strftime('%Y%m%d').astype(np.int32).to_numpy()}
+        for column, name in BAR_COLUMNS.items():
+            bars[name] = data[column].to_numpy(dtype=np.float64)
+        return bars
+
+    def _full_sync(self, code, today):
+        bars = self._fetch(code, self.start_date, today)
+        if bars is None:
+            return None
+        bars['synced_at'] = np.array(time.time())
+        self._save(code, bars)
+        return bars
+
+    # 判断本地K线是否已经包含最近一次收盘的数据
+    def is_fresh(self, bars):
+        if 'synced_at' not in bars:
+            return False
+        synced_at = float(bars['synced_at'])
+        if self.last_settle is None:
+            return datetime.fromtimestamp(synced_at).date() == datetime.now().date()
+        return synced_at >= self.last_settle().timestamp()
+
+    # 同步单只股票的K线并返回全部K线
+    def sync(self, code):
+        today = datetime.now().strftime('%Y%m%d')
+        with self._lock(code):
+            stored = self.load(code)
+            if stored is None or len(stored['date']) < 2:
+                logger.info("Kline store: full sync for %s", code)
+                return self._full_sync(code, today)
+
+            # 最近一次收盘之后已经同步过则直接使用本地数据
+            if self.is_fresh(stored):
+                return stored
+
+            # 从倒数第二根K线开始下载：倒数第二根已经收盘，用来检测复权因子是否变化；
+            # 最后一根可能是盘中写入的未完成K线，用新数据覆盖
+            overlap_date = str(int(stored['date'][-2]))
+            fresh = self._fetch(code, overlap_date, today)
+            if fresh is None or fresh['date'][0] != stored['date'][-2]:
+                logger.info("Kline store: overlap bar missing for %s, full sync", code)
+                return self._full_sync(code, today)
+
+            if abs(fresh['close'][0] - stored['close'][-2]) > PRICE_TOLERANCE:
+                logger.info("Kline store: adjustment factor changed for %s, full sync", code)
+                return self._full_sync(code, today)
+
+            bars = {
+                name: np.concatenate([stored[name][:-2], fresh[name]])
+                for name in ['date'] + list(BAR_COLUMNS.values())
+            }
+            bars['synced_at'] = np.array(time.time())
+            self._save(code, bars)
+            logger.debug("Kline store: appended %d bars for %s", max(len(fresh['date']) - 2, 0), code)
+            return bars
+
+    # 同步后返回收盘价序列
+    def closes(self, code):
+        bars = self.sync(code)
+        if bars is None:
+            return np.empty(0, dtype=np.float64)
+        return bars['close']
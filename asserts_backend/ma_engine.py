@@ -0,0 +1,68 @@
+import numpy as np
+
+# 默认计算的均线窗口
+DEFAULT_MA_WINDOWS = (51, 120, 250, 850)
+
+
+# 解析 "20,51,60" 形式的均线窗口参数，返回去重后升序排列的窗口列表
+def parse_windows(value, default=DEFAULT_MA_WINDOWS):
+    if not value:
+        return list(default)
+    windows = set()
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        window = int(item)
+        if window <= 0:
+            raise ValueError(f'Invalid moving average window: {item}')
+        windows.add(window)
+    if not windows:
+        return list(default)
+    return sorted(windows)
+
+
+# 将长度不同的收盘价序列右对齐为二维数组（行：股票，列：交易日），左侧不足部分填充NaN
+def align_closes(series_list):
+    length = max((len(series) for series in series_list), default=0)
+    matrix = np.full((len(series_list), length), np.nan)
+    for i, series in enumerate(series_list):
+        if len(series):
+            matrix[i, length - len(series):] = series
+    return matrix
+
+
+# 基于累加和一次性计算多个窗口的移动平均线
+# closes 为一维或二维收盘价数组（NaN 表示缺失），只返回每个窗口最后 tail 个值，
+# 结果为 {窗口: 形状为 (股票数, tail) 的数组}，数据不足一个窗口时为NaN
+def moving_averages(closes, windows, tail=1):
+    closes = np.atleast_2d(np.asarray(closes, dtype=np.float64))
+    n_symbols, length = closes.shape
+    tail = max(min(tail, length), 0)
+
+    valid = ~np.isnan(closes)
+    sums = np.zeros((n_symbols, length + 1))
+    counts = np.zeros((n_symbols, length + 1), dtype=np.int64)
+    np.cumsum(np.where(valid, closes, 0.0), axis=1, out=sums[:, 1:])
+    np.cumsum(valid, axis=1, out=counts[:, 1:])
+
+    ends = np.arange(length - tail + 1, length + 1)
+    result = {}
+    for window in windows:
+        starts = ends - window
+        clipped = np.clip(starts, 0, None)
+        averages = (sums[:, ends] - sums[:, clipped]) / window
+        incomplete = (counts[:, ends] - counts[:, clipped] < window) | (starts < 0)
+        averages[incomplete] = np.nan
+        result[window] = averages
+    return result
+
+
+# 计算每只股票各窗口最新的均线值，保留两位小数，数据不足时为0
+def latest_moving_averages(series_list, windows):
+    averages = moving_averages(align_closes(series_list), windows, tail=1)
+    latest = [{} for _ in series_list]
+    for window, values in averages.items():
+        for i, value in enumerate(values[:, -1] if values.shape[1] else [np.nan] * len(series_list)):
+            latest[i][f'ma{window}'] = 0 if np.isnan(value) else round(float(value), 2)
+    return latest
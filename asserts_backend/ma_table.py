@@ -0,0 +1,230 @@
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ma_engine import DEFAULT_MA_WINDOWS, parse_windows, align_closes, moving_averages
+
+logger = logging.getLogger(__name__)
+
+# 全市场均线表文件格式（小端）：
+#   8 字节魔数 | 4 字节头部长度 | JSON 头部 | 按 8 字节对齐的各列数据
+# 头部记录股票数量、均线窗口、生成时间和每列的类型与偏移；
+# code 列为按代码排序的定长字节串（S6），其余列为与之对齐的 float64 数组：
+#   ma<窗口>    最新均线值，数据不足一个窗口时为NaN
+#   close      最后一根K线的收盘价
+#   synced_at  该股票K线最后同步的时间（epoch 秒）
+MAGIC = b'MATABLE1'
+CODE_DTYPE = 'S6'
+ALIGNMENT = 8
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+# 写入均线表：columns 为 {列名: 与 codes 对齐的数组}，codes 需已排序
+# 先写临时文件再替换，正在读取旧文件的进程不受影响（旧的内存映射仍然有效）；
+# 临时文件名包含进程号和线程号，多个进程同时重建时不会互相覆盖
+def write_ma_table(path, codes, columns, windows, built_at=None):
+    arrays = {'code': np.asarray(codes, dtype=CODE_DTYPE)}
+    arrays.update({name: np.asarray(values, dtype='<f8') for name, values in columns.items()})
+
+    layout = {}
+    offset = 0
+    for name, values in arrays.items():
+        offset = _align(offset)
+        layout[name] = {'dtype': values.dtype.str, 'offset': offset}
+        offset += values.nbytes
+
+    header = json.dumps({
+        'count': len(codes),
+        'windows': list(windows),
+        'builtAt': built_at if built_at is not None else time.time(),
+        'columns': layout
+    }).encode('utf-8')
+    data_start = _align(len(MAGIC) + 4 + len(header))
+
+    temp_file = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp_file, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(header)) + header)
+        for name, values in arrays.items():
+            f.seek(data_start + layout[name]['offset'])
+            f.write(values.tobytes())
+        f.truncate(data_start + offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
+
+
+# 只读的全市场均线表
+# 整个文件映射到内存，各列直接是映射内存上的 numpy 数组，不复制数据，多个 worker 共享操作系统的页缓存；
+# 每次访问时检查文件是否已被重新生成（inode/修改时间变化），是则重新映射
+class MATable:
+    def __init__(self, path):
+        self.path = path
+        self._signature = None
+        self._mmap = None
+        self._columns = {}
+        self.windows = []
+        self.built_at = 0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return {}
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return self._columns
+        with self._lock:
+            if signature == self._signature:
+                return self._columns
+            with open(self.path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if mapped[:len(MAGIC)] != MAGIC:
+                mapped.close()
+                raise ValueError(f'Invalid moving average table: {self.path}')
+            header_length = struct.unpack('<I', mapped[len(MAGIC):len(MAGIC) + 4])[0]
+            header = json.loads(mapped[len(MAGIC) + 4:len(MAGIC) + 4 + header_length])
+            data_start = _align(len(MAGIC) + 4 + header_length)
+            columns = {
+                name: np.frombuffer(mapped, dtype=spec['dtype'], count=header['count'],
+                                    offset=data_start + spec['offset'])
+                for name, spec in header['columns'].items()
+            }
+            # 旧的映射由仍在使用它的数组保持引用，这里不主动关闭
+            self._mmap = mapped
+            self._columns = columns
+            self.windows = header['windows']
+            self.built_at = header['builtAt']
+            self._signature = signature
+            return columns
+
+    def __len__(self):
+        return len(self._open().get('code', ()))
+
+    # 查找代码所在的行（按排序后的代码列二分查找），不存在的代码为 -1
+    def rows(self, codes):
+        columns = self._open()
+        rows = np.full(len(codes), -1)
+        if not columns or not len(codes) or not len(columns['code']):
+            return columns, rows
+        keys = np.asarray(codes, dtype=CODE_DTYPE)
+        table_codes = columns['code']
+        positions = np.minimum(np.searchsorted(table_codes, keys), len(table_codes) - 1)
+        found = table_codes[positions] == keys
+        rows[found] = positions[found]
+        return columns, rows
+
+    # 返回 {窗口: 与 codes 对齐的均线数组}，表中没有的代码或窗口为NaN
+    def averages(self, codes, windows):
+        columns, rows = self.rows(codes)
+        result = {}
+        for window in windows:
+            values = np.full(len(codes), np.nan)
+            column = columns.get(f'ma{window}')
+            if column is not None:
+                found = rows >= 0
+                values[found] = column[rows[found]]
+            result[window] = values
+        return result
+
+    # 返回 {代码: {'ma<窗口>': 值}}，只包含表中有全部窗口、且K线在 since（epoch 秒）之后同步过的股票；
+    # 与实时计算一致，均线保留两位小数，数据不足时为0
+    def fresh_averages(self, codes, windows, since):
+        columns, rows = self.rows(codes)
+        if not columns or any(f'ma{window}' not in columns for window in windows):
+            return {}
+        result = {}
+        for code, row in zip(codes, rows.tolist()):
+            if row < 0 or columns['synced_at'][row] < since:
+                continue
+            values = {}
+            for window in windows:
+                value = columns[f'ma{window}'][row]
+                values[f'ma{window}'] = 0 if np.isnan(value) else round(float(value), 2)
+            result[code] = values
+        return result
+
+
+# 根据本地K线计算全市场均线表，codes 默认为本地存储的全部股票
+# 每批只保留最长窗口所需的K线，内存占用与股票总数无关
+def build_ma_table(store, path, windows=DEFAULT_MA_WINDOWS, codes=None, batch_size=500):
+    codes = sorted(codes if codes is not None else store.stored_codes())
+    longest = max(windows)
+    columns = {f'ma{window}': np.full(len(codes), np.nan) for window in windows}
+    columns['close'] = np.full(len(codes), np.nan)
+    columns['synced_at'] = np.zeros(len(codes))
+
+    for start in range(0, len(codes), batch_size):
+        batch = codes[start:start + batch_size]
+        series = []
+        for i, code in enumerate(batch, start):
+            bars = store.load(code)
+            if bars is None or not len(bars['close']):
+                series.append(np.empty(0))
+                continue
+            series.append(bars['close'][-longest:])
+            columns['close'][i] = bars['close'][-1]
+            columns['synced_at'][i] = float(bars.get('synced_at', 0))
+        averages = moving_averages(align_closes(series), windows, tail=1)
+        for window, values in averages.items():
+            if values.shape[1]:
+                columns[f'ma{window}'][start:start + len(batch)] = values[:, -1]
+
+    write_ma_table(path, codes, columns, windows)
+    logger.info("MA table written: %d codes, windows %s, %s", len(codes), list(windows), path)
+    return len(codes)
+
+
+# 每晚收盘后运行：python ma_table.py [--sync] [--windows 51,120,250,850]
+# --sync 先按全市场快照的代码列表同步所有股票的K线，否则只使用本地已有的K线
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from kline_store import KlineStore
+    from providers import create_provider
+    from trading_calendar import TradingCalendar
+    from upstream import UpstreamClient
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    parser = argparse.ArgumentParser(description='Build the universe-wide moving average table')
+    parser.add_argument('--sync', action='store_true', help='sync daily bars for every A-share code first')
+    parser.add_argument('--windows', default=os.getenv('MA_TABLE_WINDOWS'), help='comma-separated MA windows')
+    parser.add_argument('--workers', type=int, default=4, help='concurrent bar downloads when syncing')
+    args = parser.parse_args()
+
+    data_dir = os.path.join(os.path.dirname(__file__), os.getenv('DATA_DIR', 'data'))
+    provider = create_provider(UpstreamClient())
+    calendar = TradingCalendar(loader=provider.trade_dates)
+    calendar.refresh()
+    store = KlineStore(
+        os.path.join(data_dir, 'kline'),
+        fetcher=provider.daily_bars,
+        last_settle=calendar.last_settle,
+        start_date=os.getenv('KLINE_START_DATE', '20150101')
+    )
+
+    if args.sync:
+        universe = provider.spot()['代码'].astype(str).tolist()
+        print(f"Syncing daily bars for {len(universe)} codes")
+        failed = 0
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            for code, future in [(code, executor.submit(store.sync, code)) for code in universe]:
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"Error syncing {code}: {e}")
+        print(f"Synced {len(universe) - failed} codes, {failed} failed")
+
+    build_ma_table(store, os.path.join(data_dir, 'ma_table.bin'), parse_windows(args.windows))
@@ -0,0 +1,257 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# A股实时快照中用到的基本面字段
+SPOT_FIELDS = ['市盈率-动态', '市净率', '总市值', '流通市值']
+
+# 快照列式副本中额外保留的数值列
+SPOT_PRICE_FIELD = '最新价'
+
+
+# 将快照中的数值转换为float，'-' 或空值视为0
+def _to_float(value):
+    if value is None or value == '-' or value == '':
+        return 0.0
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    # NaN 与 0 同等处理
+    if value != value:
+        return 0.0
+    return value
+
+
+# 加载失败后等待多少秒再重试，期间的请求不再同步访问上游
+FAILURE_BACKOFF = 30
+
+
+# 索引尚未加载成功，且上次加载失败后仍在等待重试
+class IndexUnavailableError(Exception):
+    pass
+
+
+# 定期刷新的全市场索引基类
+# 首次使用时同步加载，过期后在后台线程刷新，刷新期间继续返回旧数据；
+# lifetime 返回本次加载的数据可以使用多少秒；加载失败后 failure_backoff 秒内不再重试，
+# 尚未加载成功时直接抛出 IndexUnavailableError，已有旧数据时继续返回旧数据
+class RefreshingIndex:
+    name = 'index'
+    cache_name = 'index'
+
+    def __init__(self, loader, lifetime, failure_backoff=FAILURE_BACKOFF):
+        self.loader = loader
+        self.lifetime = lifetime
+        self.failure_backoff = failure_backoff
+        self._index = {}
+        self._loaded_at = 0
+        self._expires_at = 0
+        self._error = None
+        self._retry_at = 0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    # 由子类实现：把上游数据转换为 代码 -> 条目 的索引
+    def _build_index(self):
+        raise NotImplementedError
+
+    def is_expired(self):
+        return time.time() >= self._expires_at
+
+    def refresh(self):
+        try:
+            index = self._build_index()
+        except Exception as e:
+            with self._lock:
+                self._error = e
+                self._retry_at = time.time() + self.failure_backoff
+                self._refreshing = False
+            raise
+        with self._lock:
+            self._index = index
+            self._loaded_at = time.time()
+            self._expires_at = self._loaded_at + self.lifetime()
+            self._error = None
+            self._retry_at = 0
+            self._refreshing = False
+        logger.info("%s refreshed: %d codes", self.name, len(index))
+        return index
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error("Error refreshing %s: %s", self.name, e)
+
+    # 已加载的索引，尚未加载时返回None；不会触发加载
+    def loaded(self):
+        return self._index if self._loaded_at else None
+
+    # 返回当前索引，首次使用时同步加载，过期后触发后台刷新
+    def current(self):
+        if not self._loaded_at:
+            if time.time() < self._retry_at:
+                CACHE_REQUESTS.inc(cache=self.cache_name, result='error')
+                raise IndexUnavailableError(f'{self.name} unavailable: {self._error}')
+            # 首次使用时同步加载
+            CACHE_REQUESTS.inc(cache=self.cache_name, result='miss')
+            self.refresh()
+        elif self.is_expired():
+            CACHE_REQUESTS.inc(cache=self.cache_name, result='stale')
+            with self._lock:
+                start = not self._refreshing and time.time() >= self._retry_at
+                if start:
+                    self._refreshing = True
+            if start:
+                threading.Thread(target=self._refresh_in_background, daemon=True).start()
+        else:
+            CACHE_REQUESTS.inc(cache=self.cache_name, result='hit')
+        return self._index
+
+    # 查询单只股票的条目，返回 None 表示没有数据
+    def get(self, code):
+        return self.current().get(code)
+
+
+# 全市场快照的列式副本：每个字段一个 numpy 数组，代码 -> 行号的哈希索引用于单只股票查询，
+# 选股时直接对整列做向量化比较
+class SpotTable:
+    def __init__(self, codes, names, columns):
+        self.codes = codes
+        self.names = names
+        self.columns = columns
+        self.rows = {code: row for row, code in enumerate(codes)}
+
+    def __len__(self):
+        return len(self.codes)
+
+    # 单只股票的基本面字段，与原来的 代码 -> 字段 索引格式一致
+    def get(self, code):
+        row = self.rows.get(code)
+        if row is None:
+            return None
+        return {field: float(self.columns[field][row]) for field in SPOT_FIELDS if field in self.columns}
+
+
+# 全市场A股实时快照缓存
+# 进程内共享一份快照的列式副本（SpotTable）
+class SpotSnapshotCache(RefreshingIndex):
+    name = 'Spot snapshot'
+    cache_name = 'spot'
+
+    def __init__(self, loader, lifetime):
+        super().__init__(loader, lifetime)
+        self._index = SpotTable([], [], {})
+
+    # 下载全市场快照并只保留需要的列
+    def _build_index(self):
+        data = self.loader()
+        if data is None or data.empty:
+            return SpotTable([], [], {})
+        codes = data['代码'].astype(str).tolist()
+        names = data['名称'].astype(str).tolist() if '名称' in data.columns else [''] * len(codes)
+        columns = {}
+        for field in SPOT_FIELDS + [SPOT_PRICE_FIELD]:
+            if field in data.columns:
+                values = data[field].tolist()
+                columns[field] = np.fromiter((_to_float(value) for value in values), dtype=np.float64, count=len(values))
+        return SpotTable(codes, np.array(names, dtype=object), columns)
+
+    # 当前快照的列式副本
+    def table(self):
+        return self.current()
+
+
+# 全市场分红索引，每个交易日最多加载一次
+# 每只股票预先算好 (年均股息, 累计股息/上市年数)，查询时只需比较和一次除法
+class DividendIndex(RefreshingIndex):
+    name = 'Dividend index'
+    cache_name = 'dividend'
+
+    def _build_index(self):
+        data = self.loader()
+        index = {}
+        if data is None or data.empty:
+            return index
+        now = datetime.now()
+        codes = data['代码'].astype(str).tolist()
+        annuals = data['年均股息'].tolist() if '年均股息' in data.columns else [0] * len(codes)
+        cumulatives = data['累计股息'].tolist() if '累计股息' in data.columns else [0] * len(codes)
+        listing_dates = data['上市日期'].tolist() if '上市日期' in data.columns else [None] * len(codes)
+        for code, annual, cumulative, listing_date in zip(codes, annuals, cumulatives, listing_dates):
+            # 同一代码只保留第一条记录
+            if code in index:
+                continue
+            years_listed = 0
+            if listing_date is not None:
+                try:
+                    listing_date = datetime.strptime(str(listing_date)[:10], '%Y-%m-%d')
+                    years_listed = (now - listing_date).days / 365.25
+                except ValueError:
+                    logger.debug("Invalid listing date format: %s", listing_date)
+            cumulative = _to_float(cumulative)
+            fallback = cumulative / years_listed if cumulative > 0 and years_listed > 0 else 0.0
+            index[code] = (_to_float(annual), fallback)
+        return index
+
+    # 返回已校正的年均股息，没有分红数据时返回None；index 为已加载的索引，未提供时使用当前索引
+    # 年均股息为0或超过当前股价的10%时，改用累计股息/上市年数
+    def annual_dividend(self, code, price, index=None):
+        entry = (self.current() if index is None else index).get(code)
+        if entry is None:
+            return None
+        annual, fallback = entry
+        if annual == 0 or (price > 0 and annual > price * 0.1):
+            if fallback > 0:
+                return fallback
+        return annual
+
+    # annual_dividend 的向量化版本，返回与 codes 对齐的年均股息数组，没有分红数据时为0
+    def annual_dividends(self, codes, prices):
+        index = self.current()
+        entries = np.array([index.get(code, (0.0, 0.0)) for code in codes], dtype=np.float64).reshape(-1, 2)
+        annual, fallback = entries[:, 0], entries[:, 1]
+        use_fallback = ((annual == 0) | ((prices > 0) & (annual > prices * 0.1))) & (fallback > 0)
+        return np.where(use_fallback, fallback, annual)
+
+
+# 按条目过期的缓存，用于实时报价
+class TTLCache:
+    def __init__(self, name='ttl'):
+        self.name = name
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    # 返回 ({键: 值} 中未过期的部分, 缺失或已过期的键列表)
+    def get_many(self, keys):
+        now = time.time()
+        hits = {}
+        misses = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] > now:
+                    hits[key] = entry[0]
+                else:
+                    misses.append(key)
+        CACHE_REQUESTS.inc(len(hits), cache=self.name, result='hit')
+        CACHE_REQUESTS.inc(len(misses), cache=self.name, result='miss')
+        return hits, misses
+
+    def put_many(self, items, ttl):
+        expires_at = time.time() + ttl
+        with self._lock:
+            for key, value in items.items():
+                self._entries[key] = (value, expires_at)
+            # 顺便清理已过期的条目
+            now = time.time()
+            for key in [key for key, entry in self._entries.items() if entry[1] <= now]:
+                del self._entries[key]
@@ -0,0 +1,185 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# 进程内的运行指标，由 GET /metrics 以 Prometheus 文本格式导出
+# 每个 worker 进程各自统计，多 worker 部署时每次抓取得到的是处理该请求的 worker 的数据
+
+# 耗时直方图默认的分桶上限（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+# 指标基类：按标签值分别记录，标签名在创建时确定
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.label_names)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in sorted(items):
+            yield self.name, _format_labels(self.label_names, key), value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(f'{name}{labels} {_format_value(value)}' for name, labels, value in self._samples())
+        return '\n'.join(lines)
+
+
+# 只增不减的计数
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    # 所有标签值的计数之和
+    def total(self):
+        with self._lock:
+            return sum(self._values.values())
+
+
+# 可增可减的当前值
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+# 分布（耗时、大小），记录各分桶的累计数量、总和与次数
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    # 记录 with 块的耗时（秒）
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items()]
+        for key, (counts, total, count) in sorted(items):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield (self.name + '_bucket',
+                       _format_labels(self.label_names, key, [('le', _format_value(bound))]),
+                       cumulative)
+            yield self.name + '_sum', _format_labels(self.label_names, key), total
+            yield self.name + '_count', _format_labels(self.label_names, key), count
+
+
+# 指标注册表
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help, labels=()):
+    return REGISTRY.register(Counter(name, help, labels))
+
+
+def gauge(name, help, labels=()):
+    return REGISTRY.register(Gauge(name, help, labels))
+
+
+def histogram(name, help, labels=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, help, labels, buckets))
+
+
+# Prometheus 文本格式的 Content-Type
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# HTTP 请求
+HTTP_REQUESTS = counter('http_requests_total', 'HTTP requests by route and status', ('method', 'route', 'status'))
+HTTP_REQUEST_SECONDS = histogram('http_request_duration_seconds', 'HTTP request latency', ('method', 'route'))
+HTTP_IN_FLIGHT = gauge('http_requests_in_flight', 'HTTP requests being processed')
+
+# 上游行情接口（tencent、spot、dividend、hist、calendar）
+UPSTREAM_CALLS = counter('upstream_calls_total', 'Upstream calls (after request coalescing)', ('source',))
+UPSTREAM_ERRORS = counter('upstream_errors_total', 'Upstream calls that failed after retries', ('source',))
+UPSTREAM_RETRIES = counter('upstream_retries_total', 'Upstream call retries', ('source',))
+UPSTREAM_SECONDS = histogram('upstream_call_duration_seconds', 'Upstream call latency including retries', ('source',))
+
+# 缓存命中：result 为 hit（命中）、stale（已过期，返回旧数据并后台刷新）或 miss（需要加载）
+CACHE_REQUESTS = counter('cache_requests_total', 'Cache lookups by result', ('cache', 'result'))
+
+# JSON 数据文件读写
+JSON_READ_BYTES = counter('json_read_bytes_total', 'Bytes read from JSON data files', ('file',))
+JSON_READ_SECONDS = histogram('json_read_duration_seconds', 'JSON data file read and parse time', ('file',))
+JSON_WRITE_BYTES = counter('json_write_bytes_total', 'Bytes written to JSON data files', ('file',))
+JSON_WRITE_SECONDS = histogram('json_write_duration_seconds', 'JSON data file serialise and write time', ('file',))
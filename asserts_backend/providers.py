@@ -0,0 +1,243 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from requests import Response
+from requests.adapters import BaseAdapter
+
+from tencent_quote import QUOTE_ENCODING, decode_payload
+
+logger = logging.getLogger(__name__)
+
+# 腾讯财经实时报价接口
+TENCENT_QUOTE_URL = 'http://qt.gtimg.cn/q='
+
+
+# akshare 和 pandas 导入耗时约 1 秒、占用上百MB内存，只有股票接口需要，
+# 因此在第一次访问行情数据时才导入，记账、资产、预算和博客接口启动后即可响应
+def _akshare():
+    import akshare
+    return akshare
+
+
+def _pandas():
+    import pandas
+    return pandas
+
+
+# 行情数据源接口
+# 实时报价、全市场快照、分红数据、日K线和交易日历都通过数据源获取，
+# 便于替换为离线回放的数据源进行压测；calls 记录各方法的调用次数
+class MarketDataProvider:
+    name = 'base'
+
+    def __init__(self):
+        self.calls = Counter()
+        self._calls_lock = threading.Lock()
+
+    def _count(self, method):
+        with self._calls_lock:
+            self.calls[method] += 1
+
+    # 腾讯财经格式的实时报价原文（GBK 编码的 bytes），symbols 为带 sh/sz 前缀的代码列表
+    def quotes(self, symbols):
+        raise NotImplementedError
+
+    # 全市场A股实时快照（stock_zh_a_spot_em 格式）
+    def spot(self):
+        raise NotImplementedError
+
+    # 全市场分红数据（stock_history_dividend 格式）
+    def dividends(self):
+        raise NotImplementedError
+
+    # 前复权日K线（stock_zh_a_hist 格式），日期格式为 YYYYMMDD
+    def daily_bars(self, code, start_date, end_date):
+        raise NotImplementedError
+
+    # 交易日列表（datetime.date）
+    def trade_dates(self):
+        raise NotImplementedError
+
+
+# 在线数据源：腾讯财经接口 + akshare，全部通过上游客户端访问
+class LiveProvider(MarketDataProvider):
+    name = 'live'
+
+    def __init__(self, upstream):
+        super().__init__()
+        self.upstream = upstream
+
+    # akshare 的数据接口函数
+    def _ak(self, name):
+        return getattr(_akshare(), name)
+
+    def quotes(self, symbols):
+        self._count('quotes')
+        return self.upstream.get(TENCENT_QUOTE_URL + ','.join(symbols), source='tencent').content
+
+    def spot(self):
+        self._count('spot')
+        return self.upstream.call('spot', self._ak('stock_zh_a_spot_em'))
+
+    def dividends(self):
+        self._count('dividends')
+        return self.upstream.call('dividend', self._ak('stock_history_dividend'))
+
+    def daily_bars(self, code, start_date, end_date):
+        self._count('daily_bars')
+        return self.upstream.call(
+            'hist',
+            self._ak('stock_zh_a_hist'),
+            symbol=code,
+            period="daily",
+            start_date=start_date,
+            end_date=end_date,
+            adjust="qfq",
+            timeout=self.upstream.timeout[1]
+        )
+
+    def trade_dates(self):
+        self._count('trade_dates')
+        return self.upstream.call('calendar', self._ak('tool_trade_date_hist_sina'))['trade_date'].tolist()
+
+
+# 腾讯财经报价接口的回放传输层：挂载到上游客户端的连接池上，代替真实的 HTTP 请求
+class _FixtureQuoteAdapter(BaseAdapter):
+    def __init__(self, provider):
+        super().__init__()
+        self.provider = provider
+
+    def send(self, request, **kwargs):
+        self.provider._wait()
+        symbols = request.url[len(TENCENT_QUOTE_URL):].split(',')
+        lines = self.provider._quote_lines
+        response = Response()
+        response.status_code = 200
+        response.url = request.url
+        response.request = request
+        response._content = '\n'.join(lines[symbol] for symbol in symbols if symbol in lines).encode(QUOTE_ENCODING)
+        return response
+
+    def close(self):
+        pass
+
+
+# 离线回放数据源：从录制的文件中读取数据，每次上游调用按 latency 秒模拟延迟
+# 只替换最底层的 HTTP 请求和 akshare 函数，请求仍经过上游客户端（请求合并、并发上限、重试和指标），
+# 与在线数据源的调用路径相同
+# 目录结构：
+#   quotes.txt         腾讯财经报价原文，每行一个 v_sh600031="...";
+#   spot.csv           全市场快照
+#   dividend.csv       全市场分红数据
+#   kline/<代码>.csv    前复权日K线
+#   trade_dates.csv    交易日历（可选）
+class FixtureProvider(LiveProvider):
+    name = 'fixture'
+
+    def __init__(self, upstream, fixture_dir, latency=0):
+        super().__init__(upstream)
+        self.fixture_dir = fixture_dir
+        self.latency = latency
+        self._quote_lines = {}
+        with open(os.path.join(fixture_dir, 'quotes.txt'), encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('v_'):
+                    self._quote_lines[line[2:line.index('=')]] = line
+        self._frames = {}
+        self._frames_lock = threading.Lock()
+        self._functions = {
+            'stock_zh_a_spot_em': self._spot_em,
+            'stock_history_dividend': self._history_dividend,
+            'stock_zh_a_hist': self._hist,
+            'tool_trade_date_hist_sina': self._trade_date_hist
+        }
+        upstream.session.mount(TENCENT_QUOTE_URL, _FixtureQuoteAdapter(self))
+
+    def _ak(self, name):
+        return self._functions[name]
+
+    def _wait(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def _read_csv(self, name):
+        with self._frames_lock:
+            if name not in self._frames:
+                pd = _pandas()
+                path = os.path.join(self.fixture_dir, name)
+                self._frames[name] = pd.read_csv(path, dtype={'代码': str}) if os.path.exists(path) \
+                    else pd.DataFrame()
+            return self._frames[name]
+
+    # 以下与对应的 akshare 函数同名、同参数，返回录制的数据
+
+    def _spot_em(self):
+        self._wait()
+        return self._read_csv('spot.csv')
+
+    def _history_dividend(self):
+        self._wait()
+        return self._read_csv('dividend.csv')
+
+    def _hist(self, symbol, period, start_date, end_date, adjust, timeout=None):
+        self._wait()
+        bars = self._read_csv(os.path.join('kline', f'{symbol}.csv'))
+        if bars.empty:
+            return bars
+        dates = _pandas().to_datetime(bars['日期']).dt.strftime('%Y%m%d')
+        return bars[(dates >= start_date) & (dates <= end_date)].reset_index(drop=True)
+
+    def _trade_date_hist(self):
+        self._wait()
+        pd = _pandas()
+        dates = self._read_csv('trade_dates.csv')
+        if dates.empty:
+            return pd.DataFrame({'trade_date': []})
+        return pd.DataFrame({'trade_date': pd.to_datetime(dates['trade_date']).dt.date})
+
+
+# 根据环境变量创建数据源：MARKET_DATA_PROVIDER=live|fixture，
+# 回放数据源从 MARKET_DATA_FIXTURES 目录读取数据，FIXTURE_LATENCY_MS 指定模拟延迟
+def create_provider(upstream):
+    kind = os.getenv('MARKET_DATA_PROVIDER', 'live')
+    if kind == 'fixture':
+        fixture_dir = os.getenv('MARKET_DATA_FIXTURES', os.path.join(os.path.dirname(__file__), 'fixtures'))
+        latency = float(os.getenv('FIXTURE_LATENCY_MS', 0)) / 1000
+        logger.info("Using fixture market data from %s (latency %ss)", fixture_dir, latency)
+        return FixtureProvider(upstream, fixture_dir, latency)
+    return LiveProvider(upstream)
+
+
+# 从数据源录制回放数据
+def record_fixtures(provider, codes, fixture_dir, start_date='20150101'):
+    os.makedirs(os.path.join(fixture_dir, 'kline'), exist_ok=True)
+    symbols = [f'sh{code}' if code.startswith(('6', '5')) else f'sz{code}' for code in codes]
+    with open(os.path.join(fixture_dir, 'quotes.txt'), 'w', encoding='utf-8') as f:
+        for line in decode_payload(provider.quotes(symbols)).split(';'):
+            if line.strip():
+                f.write(line.strip() + ';\n')
+    provider.spot().to_csv(os.path.join(fixture_dir, 'spot.csv'), index=False)
+    provider.dividends().to_csv(os.path.join(fixture_dir, 'dividend.csv'), index=False)
+    end_date = time.strftime('%Y%m%d')
+    for code in codes:
+        provider.daily_bars(code, start_date, end_date).to_csv(
+            os.path.join(fixture_dir, 'kline', f'{code}.csv'), index=False
+        )
+    _pandas().DataFrame({'trade_date': provider.trade_dates()}).to_csv(
+        os.path.join(fixture_dir, 'trade_dates.csv'), index=False
+    )
+    print(f"Recorded fixtures for {len(codes)} stocks to {fixture_dir}")
+
+
+# 录制回放数据：python providers.py <目录> 600031 000651 ...
+if __name__ == '__main__':
+    from upstream import UpstreamClient
+    if len(sys.argv) < 3:
+        print('Usage: python providers.py <fixture_dir> <code> [<code> ...]')
+        sys.exit(1)
+    record_fixtures(LiveProvider(UpstreamClient()), sys.argv[2:], sys.argv[1])
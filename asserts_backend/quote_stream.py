@@ -0,0 +1,84 @@
+import queue
+import threading
+
+
+# 单个推送订阅者，closed 为 True 时表示已被推送中心断开
+class Subscriber:
+    def __init__(self, max_pending):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.closed = False
+
+    # 等待下一批变化，超时返回None
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+# 实时行情推送中心
+# 保存每只跟踪股票最近一次的行情字段，发布新数据时只把发生变化的字段推送给所有订阅者，
+# 多个浏览器标签页共享同一个上游轮询
+class QuoteHub:
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self._latest = {}
+        self._tracked = set()
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    # 设置需要推送的股票代码，不再跟踪的股票同时清除缓存
+    def set_tracked(self, codes):
+        with self._lock:
+            self._tracked = set(codes)
+            for code in list(self._latest):
+                if code not in self._tracked:
+                    del self._latest[code]
+
+    def tracked(self):
+        with self._lock:
+            return set(self._tracked)
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def subscribe(self):
+        subscriber = Subscriber(self.max_pending)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    # 当前所有跟踪股票的完整行情
+    def snapshot(self):
+        with self._lock:
+            return {code: dict(fields) for code, fields in self._latest.items()}
+
+    # 发布一批行情 {代码: 字段}，返回实际发生变化的部分 {代码: 变化字段}
+    def publish(self, results, fields):
+        changes = {}
+        with self._lock:
+            for code, result in results.items():
+                if code not in self._tracked or not result or 'error' in result:
+                    continue
+                latest = self._latest.setdefault(code, {})
+                changed = {
+                    field: result[field] for field in fields
+                    if field in result and latest.get(field) != result[field]
+                }
+                if changed:
+                    latest.update(changed)
+                    changes[code] = changed
+
+            if changes:
+                for subscriber in list(self._subscribers):
+                    try:
+                        subscriber.queue.put_nowait(changes)
+                    except queue.Full:
+                        # 消费太慢的订阅者直接断开，客户端重连后会重新收到完整快照
+                        self._subscribers.discard(subscriber)
+                        subscriber.closed = True
+        return changes
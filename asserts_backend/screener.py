@@ -0,0 +1,128 @@
+import numpy as np
+
+# 可筛选、排序的字段（与实时数据接口的字段名一致）
+SCREEN_FIELDS = ['currentPrice', 'pe', 'pb', 'totalMarketValue', 'circulationMarketValue', 'dividendYield']
+
+# 快照列 -> 接口字段
+SPOT_COLUMNS = {
+    '最新价': 'currentPrice',
+    '市盈率-动态': 'pe',
+    '市净率': 'pb',
+    '总市值': 'totalMarketValue',
+    '流通市值': 'circulationMarketValue'
+}
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+# 选股条件
+# ranges 为 {字段: (下限, 上限)}，above_ma/below_ma 为要求现价高于/低于的均线窗口
+class ScreenQuery:
+    def __init__(self, ranges=None, above_ma=(), below_ma=(), sort=None, descending=False, limit=DEFAULT_LIMIT):
+        self.ranges = ranges or {}
+        self.above_ma = list(above_ma)
+        self.below_ma = list(below_ma)
+        self.sort = sort
+        self.descending = descending
+        self.limit = limit
+
+    # 需要计算的均线窗口
+    def ma_windows(self):
+        return sorted(set(self.above_ma) | set(self.below_ma))
+
+
+def _float_arg(args, name):
+    value = args.get(name)
+    if value is None or value == '':
+        return None
+    return float(value)
+
+
+def _windows_arg(args, name):
+    windows = []
+    for item in (args.get(name) or '').split(','):
+        item = item.strip()
+        if item:
+            window = int(item)
+            if window <= 0:
+                raise ValueError(f'Invalid moving average window: {item}')
+            windows.append(window)
+    return windows
+
+
+# 解析查询参数：min<字段>/max<字段>（如 minPe=0&maxPe=15&minDividendYield=3）、
+# aboveMa/belowMa（如 aboveMa=250 表示现价高于250日均线）、sort（字段名，前缀 - 表示降序）和 limit；
+# 参数不合法时抛出 ValueError
+def parse_screen_query(args):
+    ranges = {}
+    for field in SCREEN_FIELDS:
+        suffix = field[0].upper() + field[1:]
+        low = _float_arg(args, 'min' + suffix)
+        high = _float_arg(args, 'max' + suffix)
+        if low is not None or high is not None:
+            ranges[field] = (low, high)
+
+    sort = args.get('sort') or None
+    descending = False
+    if sort:
+        descending = sort.startswith('-')
+        sort = sort.lstrip('-')
+        if sort not in SCREEN_FIELDS:
+            raise ValueError(f'Unsupported sort field: {sort}')
+
+    limit = int(args.get('limit') or DEFAULT_LIMIT)
+    if limit <= 0:
+        raise ValueError('limit must be positive')
+
+    return ScreenQuery(
+        ranges=ranges,
+        above_ma=_windows_arg(args, 'aboveMa'),
+        below_ma=_windows_arg(args, 'belowMa'),
+        sort=sort,
+        descending=descending,
+        limit=min(limit, MAX_LIMIT)
+    )
+
+
+# 从快照列式副本构建 {接口字段: 数组}，股息率为百分比
+def build_columns(table, annual_dividends):
+    columns = {
+        field: table.columns.get(column, np.zeros(len(table)))
+        for column, field in SPOT_COLUMNS.items()
+    }
+    prices = columns['currentPrice']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        columns['dividendYield'] = np.where(prices > 0, annual_dividends / prices * 100, 0.0)
+    return columns
+
+
+# 按数值区间筛选，返回布尔掩码（没有成交价的停牌、退市股票不参与筛选）
+def range_mask(columns, query):
+    mask = columns['currentPrice'] > 0
+    for field, (low, high) in query.ranges.items():
+        values = columns[field]
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+    return mask
+
+
+# 按现价与均线的关系筛选，averages 为 {窗口: 与 prices 对齐的均线数组}，均线未知（NaN）的股票不满足条件
+def ma_mask(prices, averages, query):
+    mask = np.ones(len(prices), dtype=bool)
+    for window in query.above_ma:
+        mask &= prices > averages[window]
+    for window in query.below_ma:
+        mask &= prices < averages[window]
+    return mask
+
+
+# 对满足条件的行排序并截取前 limit 个，返回行号数组
+def order_rows(columns, rows, query):
+    if query.sort:
+        values = columns[query.sort][rows]
+        order = np.argsort(-values if query.descending else values, kind='stable')
+        rows = rows[order]
+    return rows[:query.limit]
@@ -0,0 +1,1047 @@
+import argparse
+import bisect
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from metrics import CACHE_REQUESTS, JSON_READ_BYTES, JSON_READ_SECONDS, JSON_WRITE_BYTES, JSON_WRITE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+# 读取JSON文件数据
+def read_json_file(file_path, max_retries=3, retry_delay=1):
+    file_name = os.path.basename(file_path)
+    for attempt in range(max_retries):
+        try:
+            if os.path.exists(file_path):
+                logger.debug("Reading file: %s (attempt %d)", file_path, attempt + 1)
+                started = time.perf_counter()
+
+                # 使用更安全的方式打开文件
+                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                    content = f.read()
+                    logger.debug("File content length: %d", len(content))
+                    JSON_READ_BYTES.inc(os.fstat(f.fileno()).st_size, file=file_name)
+
+                    if not content:
+                        logger.debug("File is empty: %s", file_path)
+                        return []
+
+                    # 尝试解析JSON
+                    try:
+                        data = json.loads(content)
+                        JSON_READ_SECONDS.observe(time.perf_counter() - started, file=file_name)
+                        return data
+                    except json.JSONDecodeError as json_err:
+                        logger.warning("JSON decode error in %s on attempt %d: %s", file_path, attempt + 1, json_err)
+                        logger.debug("First 50 chars: %s", content[:50])
+                        logger.debug("Last 50 chars: %s", content[-50:])
+
+                        # 尝试清理内容
+                        cleaned_content = content.strip()
+                        if not cleaned_content:
+                            return []
+
+                        # 如果是简单的JSON数组格式问题，尝试修复
+                        if cleaned_content.startswith('[') and not cleaned_content.endswith(']'):
+                            cleaned_content += ']'
+                            logger.warning("Fixed %s by adding closing bracket", file_path)
+                            return json.loads(cleaned_content)
+                        elif cleaned_content.startswith('{') and not cleaned_content.endswith('}'):
+                            cleaned_content += '}'
+                            logger.warning("Fixed %s by adding closing brace", file_path)
+                            return json.loads(cleaned_content)
+
+                        # 如果修复失败，继续重试
+                        raise
+            logger.debug("File not found: %s", file_path)
+            return []
+        except Exception as e:
+            logger.warning("Error reading file %s on attempt %d: %s: %s", file_path, attempt + 1, type(e).__name__, e)
+
+            if attempt < max_retries - 1:
+                logger.warning("Retrying in %s second(s)...", retry_delay)
+                time.sleep(retry_delay)
+            else:
+                logger.exception("Max retries exceeded for file: %s", file_path)
+                return []
+
+    # 理论上不会到达这里，但为了安全返回空列表
+    return []
+
+
+# 与目标文件同目录、按进程和线程区分的临时文件名
+def _temp_path(file_path):
+    return f'{file_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+
+# 写入JSON文件数据
+def write_json_file(file_path, data):
+    file_name = os.path.basename(file_path)
+    try:
+        # 使用os模块确保目录存在
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        started = time.perf_counter()
+
+        # 先写入名字唯一的临时文件（多个进程、线程同时写入不会共用临时文件），落盘后用 os.replace 原子替换，
+        # 替换前后文件始终完整存在
+        temp_file = _temp_path(file_path)
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+                size = f.tell()
+            os.replace(temp_file, file_path)
+        except BaseException:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+
+        JSON_WRITE_BYTES.inc(size, file=file_name)
+        JSON_WRITE_SECONDS.observe(time.perf_counter() - started, file=file_name)
+        logger.debug("Successfully wrote to file: %s (%d bytes)", file_path, size)
+    except Exception as e:
+        logger.exception("Error writing to file %s: %s: %s", file_path, type(e).__name__, e)
+        raise
+
+
+# 文件的身份标识：inode、修改时间和大小，任何一个变化都说明文件被替换或修改过
+def _file_signature(file_path):
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+# 数据文件的锁文件 <文件>.lock
+# 修改期间对它加排他的 flock，多个 worker 进程对同一文件的读取-修改-写入串行执行，不会丢失更新；
+# 文件开头 8 字节是写入计数，每次修改加一。inode 会被复用、修改时间的精度有限，
+# 短时间内的两次写入可能得到相同的文件标识，计数保证其他进程一定能发现修改。
+# 之后 8 字节是创建锁文件时生成的随机标识（epoch），锁文件被删除重建、计数从头开始时随之改变
+class _LockFile:
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._pid = None
+        self._lock = threading.RLock()
+        self._depth = 0
+
+    # 每个进程打开一次，fork 出的 worker 重新打开，不与父进程共用文件描述（否则 flock 互不排斥）
+    def _descriptor(self):
+        if self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+            self._depth = 0
+        return self._fd
+
+    def generation(self):
+        return int.from_bytes(os.pread(self._descriptor(), 8, 0).ljust(8, b'\0'), 'little')
+
+    def bump(self):
+        os.pwrite(self._descriptor(), (self.generation() + 1).to_bytes(8, 'little'), 0)
+
+    def epoch(self):
+        value = os.pread(self._descriptor(), 8, 8)
+        if len(value) == 8 and any(value):
+            return value.hex()
+        with self.locked():
+            value = os.pread(self._descriptor(), 8, 8)
+            if len(value) < 8 or not any(value):
+                value = os.urandom(8)
+                os.pwrite(self._descriptor(), self.generation().to_bytes(8, 'little') + value, 0)
+            return value.hex()
+
+    # 可重入：已持有锁时（修改过程中）直接执行，最外层退出时才释放 flock
+    @contextmanager
+    def locked(self):
+        with self._lock:
+            fd = self._descriptor()
+            if self._depth == 0:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+# 基于数据文件的存储后端，修改在锁文件的排他锁内进行，写入计数即仓库的版本号
+class _FileBackend:
+    # 整理时需要在锁内读取当前数据
+    compact_in_transaction = True
+
+    def __init__(self):
+        self._lock_files = {}
+        self._lock_files_lock = threading.Lock()
+
+    def _lock_file(self, collection):
+        with self._lock_files_lock:
+            lock_file = self._lock_files.get(collection.file_path)
+            if lock_file is None:
+                lock_file = self._lock_files[collection.file_path] = _LockFile(collection.file_path + '.lock')
+            return lock_file
+
+    def transaction(self, collection):
+        return self._lock_file(collection).locked()
+
+    # 单调递增的版本号，每次修改加一
+    def version(self, collection):
+        return self._lock_file(collection).generation()
+
+    # 版本号所属的序列，版本号重新从头计数时改变
+    def epoch(self, collection):
+        return self._lock_file(collection).epoch()
+
+    # 数据在存储后端之外被修改（手工编辑、git pull）时为它分配新的版本号；
+    # 版本号仍是 seen 时才加一，多个进程同时发现同一次修改只加一次
+    def mark_changed(self, collection, seen):
+        lock_file = self._lock_file(collection)
+        with lock_file.locked():
+            if lock_file.generation() == seen:
+                lock_file.bump()
+            return lock_file.generation()
+
+
+# JSON 文件存储（默认）：每个仓库一个文件，每次修改整体重写
+class JsonFileBackend(_FileBackend):
+    # 数据的版本标识，变化时仓库重新加载
+    def signature(self, collection):
+        return (_file_signature(collection.file_path), self._lock_file(collection).generation())
+
+    def load(self, collection):
+        return read_json_file(collection.file_path)
+
+    # 保存修改后的数据，返回新的版本标识
+    def save(self, collection, data, ops):
+        write_json_file(collection.file_path, data)
+        self._lock_file(collection).bump()
+        return self.signature(collection)
+
+    # 后台整理，返回新的版本标识，没有整理时返回 None
+    def compact(self, collection, data):
+        return None
+
+
+# 文件内容的摘要，文件不存在时为 None
+def _file_digest(file_path):
+    try:
+        with open(file_path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+# 日志存储（STORAGE_BACKEND=journal）：JSON 文件作为快照，每次修改只向 <文件>.journal 追加一行操作（NDJSON）并 fsync，
+# 写入量与历史长度无关；加载时读取快照并按顺序重放日志，后台任务定期把日志合并进快照（compact）。
+# 日志第一行记录它所基于的快照内容摘要，快照被替换（合并时中途退出、git pull 等）后旧日志不再重放，
+# 其中还有修改时改名为 <文件>.journal.stale-<毫秒时间戳> 保留下来并记录警告
+class JournalBackend(_FileBackend):
+    def __init__(self):
+        super().__init__()
+        # 文件路径 -> 当前日志所基于的快照摘要，日志不存在或已失效时没有记录
+        self._bases = {}
+        # 文件路径 -> 日志中尚未合并的修改次数
+        self._pending = {}
+
+    def _journal_path(self, collection):
+        return collection.file_path + '.journal'
+
+    def signature(self, collection):
+        return (
+            _file_signature(collection.file_path),
+            _file_signature(self._journal_path(collection)),
+            self._lock_file(collection).generation()
+        )
+
+    # 读取基于 base 的日志中的各次修改，日志基于其他快照时返回 None；
+    # 末尾不完整的一行（写入时进程退出）被截掉，之后追加的修改才能被重放
+    def _read_journal(self, collection, base):
+        journal_path = self._journal_path(collection)
+        try:
+            with open(journal_path, 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        entries = []
+        offset = 0
+        for line in content.splitlines(keepends=True):
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+            offset += len(line)
+        if not entries or entries[0].get('base') != base:
+            if len(entries) > 1:
+                # 快照在日志之外被替换（如 git pull），日志中的修改无法安全重放，移到一边留待人工处理，不被新日志覆盖
+                stale_path = f'{journal_path}.stale-{int(time.time() * 1000)}'
+                os.replace(journal_path, stale_path)
+                logger.warning("Snapshot %s no longer matches its journal: %d changes not replayed, journal moved to %s",
+                               collection.file_path, len(entries) - 1, stale_path)
+            return None
+        if offset < len(content):
+            logger.warning("Truncating incomplete journal line in %s", journal_path)
+            os.truncate(journal_path, offset)
+        return [entry['ops'] for entry in entries[1:]]
+
+    def load(self, collection):
+        base = _file_digest(collection.file_path)
+        data = read_json_file(collection.file_path) if base is not None else None
+        data = collection._wrap(data if data else collection._default())
+        batches = self._read_journal(collection, base)
+        self._bases.pop(collection.file_path, None)
+        self._pending[collection.file_path] = 0
+        if batches is not None:
+            for ops in batches:
+                data = collection._apply(data, ops)
+            self._bases[collection.file_path] = base
+            self._pending[collection.file_path] = len(batches)
+        return data
+
+    # 写入只有头部的新日志（先写临时文件再替换）
+    def _start_journal(self, collection, base):
+        journal_path = self._journal_path(collection)
+        temp_file = _temp_path(journal_path)
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'base': base}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, journal_path)
+        self._bases[collection.file_path] = base
+        self._pending[collection.file_path] = 0
+
+    def save(self, collection, data, ops):
+        if collection.file_path not in self._bases:
+            self._start_journal(collection, _file_digest(collection.file_path))
+        with open(self._journal_path(collection), 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'ops': ops}, ensure_ascii=False, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._pending[collection.file_path] += 1
+        self._lock_file(collection).bump()
+        return self.signature(collection)
+
+    # 把日志合并进快照：写入新快照后换上基于它的空日志
+    def compact(self, collection, data):
+        if not self._pending.get(collection.file_path):
+            return None
+        write_json_file(collection.file_path, data)
+        self._start_journal(collection, _file_digest(collection.file_path))
+        self._lock_file(collection).bump()
+        logger.info("Compacted journal into %s", collection.file_path)
+        return self.signature(collection)
+
+
+SQLITE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS versions (
+    collection TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS records (
+    seq INTEGER PRIMARY KEY,
+    collection TEXT NOT NULL,
+    id TEXT,
+    date TEXT,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_id ON records (collection, id);
+CREATE INDEX IF NOT EXISTS records_date ON records (collection, date);
+CREATE TABLE IF NOT EXISTS documents (
+    collection TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (collection, key)
+);
+CREATE TABLE IF NOT EXISTS document_entries (
+    collection TEXT NOT NULL,
+    key TEXT NOT NULL,
+    subkey TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (collection, key, subkey)
+);
+'''
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+# SQLite 存储（STORAGE_BACKEND=sqlite）：所有仓库共用一个数据库文件，WAL 模式
+# 记录列表每条记录一行（按 id、日期建索引），修改只写入受影响的行；
+# 对象按前两层键拆分为多行（如 monthly/2025-12、readingTimes/<id>），修改只重写操作路径所在的行；
+# versions 表记录每个仓库的版本号，每次修改加一，其他进程的修改通过版本号变化发现。
+# 仓库第一次使用时，如果数据库中还没有该仓库而对应的 JSON 文件存在，自动导入 JSON 文件
+class SqliteBackend:
+    # WAL checkpoint 不能在写事务内执行
+    compact_in_transaction = False
+
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    # 每个线程一个连接，自动提交模式，事务由 transaction() 显式开启
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SQLITE_SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    # 修改期间持有数据库写锁，读取版本、加载、写入在同一个事务中完成，多个进程同时修改不会丢失更新；
+    # 已在事务中时（修改时首次加载并导入 JSON 文件）直接使用外层事务
+    @contextmanager
+    def transaction(self, collection):
+        connection = self._connection()
+        if connection.in_transaction:
+            yield connection
+            return
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _version(self, connection, name):
+        row = connection.execute('SELECT version FROM versions WHERE collection = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def _bump(self, connection, name):
+        connection.execute(
+            'INSERT INTO versions (collection, version) VALUES (?, 1) '
+            'ON CONFLICT (collection) DO UPDATE SET version = version + 1',
+            (name,)
+        )
+        return self._version(connection, name)
+
+    def signature(self, collection):
+        return self._version(self._connection(), collection.name)
+
+    def version(self, collection):
+        return self._version(self._connection(), collection.name) or 0
+
+    # 数据库的随机标识，创建数据库时生成，所有仓库共用
+    def epoch(self, collection):
+        connection = self._connection()
+        row = connection.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()
+        if row is None:
+            connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)", (os.urandom(8).hex(),))
+            row = connection.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()
+        return row[0]
+
+    # 数据库中的数据只由本后端修改，版本号总会随修改变化，这里只为与文件存储保持一致
+    def mark_changed(self, collection, seen):
+        with self.transaction(collection) as connection:
+            if (self._version(connection, collection.name) or 0) == seen:
+                self._bump(connection, collection.name)
+            return self._version(connection, collection.name) or 0
+
+    def load(self, collection):
+        connection = self._connection()
+        if self._version(connection, collection.name) is None:
+            self._import_json(collection)
+        if isinstance(collection, RecordCollection):
+            return self._load_records(connection, collection)
+        return self._load_document(connection, collection)
+
+    def save(self, collection, data, ops):
+        connection = self._connection()
+        if isinstance(collection, RecordCollection):
+            self._save_record_ops(connection, collection.name, ops)
+        else:
+            self._save_document_ops(connection, collection.name, data, ops)
+        return self._bump(connection, collection.name)
+
+    # 把 WAL 中的内容写回数据库文件；有其他连接正在读写时只写回能写回的部分，下次整理时继续
+    def compact(self, collection, data):
+        busy, pages, written = self._connection().execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+        if busy:
+            logger.debug("WAL checkpoint of %s incomplete: %d of %d pages", self.path, written, pages)
+        return None
+
+    # 导入仓库对应的 JSON 文件（只在数据库中还没有该仓库时导入），返回导入的条目数
+    def _import_json(self, collection):
+        with self.transaction(collection) as connection:
+            if self._version(connection, collection.name) is not None:
+                return 0
+            data = read_json_file(collection.file_path) if os.path.exists(collection.file_path) else None
+            if isinstance(collection, RecordCollection):
+                self._write_records(connection, collection.name, data or [])
+            else:
+                self._write_document(connection, collection.name, data or collection._default())
+            self._bump(connection, collection.name)
+            logger.info("Imported %s into %s: %d entries", collection.file_path, self.path, len(data or []))
+            return len(data or [])
+
+    def _load_records(self, connection, collection):
+        rows = connection.execute(
+            'SELECT body FROM records WHERE collection = ? ORDER BY seq', (collection.name,)
+        ).fetchall()
+        records = [json.loads(body) for body, in rows]
+        # 与内存中的顺序一致：按排序键和 id 排序，没有排序键时为写入顺序
+        if collection.sort_key is not None:
+            records.sort(key=collection._key)
+        return records
+
+    def _insert_record(self, connection, name, record):
+        date = record.get('date')
+        connection.execute(
+            'INSERT INTO records (collection, id, date, body) VALUES (?, ?, ?, ?)',
+            (name, record.get('id'), date if isinstance(date, str) else None, _dumps(record))
+        )
+
+    def _write_records(self, connection, name, records):
+        connection.execute('DELETE FROM records WHERE collection = ?', (name,))
+        for record in records:
+            self._insert_record(connection, name, record)
+
+    # 按操作逐条写入，每个操作只访问 (collection, id) 索引上的一行
+    def _save_record_ops(self, connection, name, ops):
+        for op in ops:
+            kind = op[0]
+            if kind == 'insert':
+                self._insert_record(connection, name, op[1])
+            elif kind == 'update':
+                row = connection.execute(
+                    'SELECT seq, body FROM records WHERE collection = ? AND id = ? ORDER BY seq LIMIT 1',
+                    (name, op[1])
+                ).fetchone()
+                if row is None:
+                    continue
+                record = {**json.loads(row[1]), **op[2]}
+                date = record.get('date')
+                connection.execute(
+                    'UPDATE records SET id = ?, date = ?, body = ? WHERE seq = ?',
+                    (record.get('id'), date if isinstance(date, str) else None, _dumps(record), row[0])
+                )
+            elif kind == 'delete':
+                connection.execute('DELETE FROM records WHERE collection = ? AND id = ?', (name, op[1]))
+            elif kind == 'replace':
+                self._write_records(connection, name, op[1])
+
+    def _load_document(self, connection, collection):
+        document = {}
+        for key, value in connection.execute(
+            'SELECT key, value FROM documents WHERE collection = ? ORDER BY rowid', (collection.name,)
+        ):
+            document[key] = json.loads(value) if value is not None else {}
+        for key, subkey, value in connection.execute(
+            'SELECT key, subkey, value FROM document_entries WHERE collection = ? ORDER BY rowid', (collection.name,)
+        ):
+            document[key][subkey] = json.loads(value)
+        return document
+
+    # 写入顶层键：对象的每个子键一行，其他值直接保存
+    def _write_key(self, connection, name, key, value):
+        connection.execute('DELETE FROM document_entries WHERE collection = ? AND key = ?', (name, key))
+        connection.execute(
+            'INSERT INTO documents (collection, key, value) VALUES (?, ?, ?) '
+            'ON CONFLICT (collection, key) DO UPDATE SET value = excluded.value',
+            (name, key, None if isinstance(value, dict) else _dumps(value))
+        )
+        if isinstance(value, dict):
+            connection.executemany(
+                'INSERT INTO document_entries (collection, key, subkey, value) VALUES (?, ?, ?, ?)',
+                [(name, key, subkey, _dumps(item)) for subkey, item in value.items()]
+            )
+
+    def _write_document(self, connection, name, document):
+        connection.execute('DELETE FROM documents WHERE collection = ?', (name,))
+        connection.execute('DELETE FROM document_entries WHERE collection = ?', (name,))
+        for key, value in document.items():
+            self._write_key(connection, name, key, value)
+
+    # 按操作路径写入：路径为空时重写整个对象，只有一层时重写该顶层键，否则只重写第二层的一行
+    def _save_document_ops(self, connection, name, document, ops):
+        for op in ops:
+            path = op[1]
+            if not path:
+                self._write_document(connection, name, document)
+                continue
+            key = path[0]
+            if key not in document:
+                connection.execute('DELETE FROM documents WHERE collection = ? AND key = ?', (name, key))
+                connection.execute('DELETE FROM document_entries WHERE collection = ? AND key = ?', (name, key))
+            elif len(path) == 1 or not isinstance(document[key], dict):
+                self._write_key(connection, name, key, document[key])
+            else:
+                # 路径上缺少的顶层对象由操作自动创建
+                connection.execute(
+                    'INSERT INTO documents (collection, key, value) VALUES (?, ?, NULL) '
+                    'ON CONFLICT (collection, key) DO UPDATE SET value = NULL',
+                    (name, key)
+                )
+                subkey = path[1]
+                if subkey in document[key]:
+                    connection.execute(
+                        'INSERT INTO document_entries (collection, key, subkey, value) VALUES (?, ?, ?, ?) '
+                        'ON CONFLICT (collection, key, subkey) DO UPDATE SET value = excluded.value',
+                        (name, key, subkey, _dumps(document[key][subkey]))
+                    )
+                else:
+                    connection.execute(
+                        'DELETE FROM document_entries WHERE collection = ? AND key = ? AND subkey = ?',
+                        (name, key, subkey)
+                    )
+
+
+# 根据 STORAGE_BACKEND 环境变量创建存储后端：json（默认）、journal 或 sqlite，
+# SQLite 数据库文件默认为 <DATA_DIR>/store.sqlite3，可通过 STORAGE_SQLITE_FILE 指定
+def create_backend(data_dir):
+    kind = os.getenv('STORAGE_BACKEND', 'json')
+    if kind == 'sqlite':
+        path = os.path.join(data_dir, os.getenv('STORAGE_SQLITE_FILE', 'store.sqlite3'))
+        logger.info("Using SQLite storage: %s", path)
+        return SqliteBackend(path)
+    if kind == 'journal':
+        logger.info("Using journal storage")
+        return JournalBackend()
+    return JsonFileBackend()
+
+
+# 每个仓库在内存中保留的修改记录条数（每次修改一条），更早版本的客户端需要重新获取全部数据
+CHANGE_LOG_SIZE = int(os.getenv('STORAGE_CHANGE_LOG_SIZE', 1000))
+
+_MISSING = object()
+
+
+# 比较 old、new 两个 {键: 条目} 中 keys 对应的条目（keys 为 None 时比较全部），返回 {键: 修改类型}，
+# 修改类型为 inserted、updated 或 deleted；没有修改的条目在修改后的数据中仍是同一个对象，先按对象身份比较
+def _diff_entries(old, new, keys=None):
+    if keys is None:
+        keys = list(old) + [key for key in new if key not in old]
+    changes = {}
+    for key in keys:
+        before = old.get(key, _MISSING)
+        after = new.get(key, _MISSING)
+        if before is _MISSING and after is not _MISSING:
+            changes[key] = 'inserted'
+        elif before is not _MISSING and after is _MISSING:
+            changes[key] = 'deleted'
+        elif before is not after and before != after:
+            changes[key] = 'updated'
+    return changes
+
+
+# 把较晚的一组修改合并到较早的修改上，得到两次修改合起来的净效果
+# （插入后删除的条目不出现，删除后重新插入的条目记为修改）
+def _merge_changes(changes, later):
+    for key, kind in later.items():
+        earlier = changes.get(key)
+        if earlier == 'inserted':
+            if kind == 'deleted':
+                del changes[key]
+        elif earlier is not None and kind == 'inserted':
+            changes[key] = 'updated'
+        else:
+            changes[key] = kind
+    return changes
+
+
+# 数据仓库
+# 每个数据文件一个实例，进程内保存解析后的数据，读取时只检查数据的版本标识（JSON 文件为一次 stat 和
+# 锁文件计数的读取，SQLite 为一次按主键的查询），不重新读取数据；数据被其他进程或外部修改（如部署脚本 git pull）后自动重新加载。
+# 修改通过 update(fn) 进行：在进程内的锁和存储后端的跨进程锁（事务）内重新检查版本，用当前数据调用 fn 得到一组操作，在数据的副本上应用，
+# 由存储后端持久化后才替换内存中的数据（写穿）。get() 返回的数据在进程内共享，调用方不能修改
+# version 为单调递增的版本号（与 epoch 一起唯一确定数据内容），并在内存中记录最近各版本修改了哪些条目，
+# changes_since() 返回某个版本之后的修改，客户端据此增量同步
+class Collection:
+    def __init__(self, file_path, backend=None):
+        self.file_path = file_path
+        self.name = os.path.splitext(os.path.basename(file_path))[0]
+        self.backend = backend or JsonFileBackend()
+        self.version = 0
+        self.epoch = None
+        self._data = None
+        self._signature = None
+        self._lock = threading.RLock()
+        # (起始版本, 版本, {键: 修改类型})，_changes_since 为能够提供修改记录的最早版本
+        self._changes = deque()
+        self._changes_since = None
+
+    # 数据为空或不存在时的数据
+    def _default(self):
+        raise NotImplementedError
+
+    # 在 data 的副本上应用一组操作，返回新数据，不修改 data
+    def _apply(self, data, ops):
+        raise NotImplementedError
+
+    # 把加载的原始数据转换为 _apply 使用的形式（如建立索引）
+    def _wrap(self, data):
+        return data
+
+    # 数据中的各个条目 {键: 条目}，修改记录以条目为单位
+    def _entries(self, data):
+        raise NotImplementedError
+
+    # 一组操作可能修改的条目的键，可能修改全部条目时返回 None
+    def _touched(self, ops):
+        return None
+
+    def _load(self):
+        data = self.backend.load(self)
+        return self._wrap(data if data else self._default())
+
+    # 换上新的数据和版本号并记录修改；先换数据再换版本号，不加锁读取时版本号不会比数据新
+    def _replace(self, data, version, changes):
+        self._data = data
+        if self._changes_since is None or version <= self.version:
+            self._changes.clear()
+            self._changes_since = version
+        else:
+            self._changes.append((self.version, version, changes))
+            if len(self._changes) > CHANGE_LOG_SIZE:
+                self._changes_since = self._changes.popleft()[1]
+        self.version = version
+
+    # 版本标识变化时重新加载；加载在存储后端的事务内进行，读到的数据与版本号一致
+    def _refresh(self):
+        signature = self.backend.signature(self)
+        if self._data is not None and signature == self._signature:
+            CACHE_REQUESTS.inc(cache=self.name, result='hit')
+            return self._data
+        with self._lock, self.backend.transaction(self):
+            if self._data is None or self.backend.signature(self) != self._signature:
+                CACHE_REQUESTS.inc(cache=self.name, result='miss')
+                previous = self._data
+                data = self._load()
+                # 加载后再读取版本标识（SQLite 首次加载时导入 JSON 文件会改变版本号）
+                signature = self.backend.signature(self)
+                version = self.backend.version(self)
+                epoch = self.backend.epoch(self)
+                if epoch != self.epoch:
+                    # 版本号重新计数（锁文件或数据库被重建），之前的修改记录不再适用
+                    self._changes_since = None
+                    self.epoch = epoch
+                elif previous is not None and version == self.version:
+                    # 数据在存储后端之外被修改，版本号没有变化
+                    version = self.backend.mark_changed(self, version)
+                    signature = self.backend.signature(self)
+                changes = _diff_entries(self._entries(previous), self._entries(data)) if previous is not None else {}
+                self._replace(data, version, changes)
+                self._signature = signature
+            return self._data
+
+    def get(self):
+        return self._refresh()
+
+    # 当前数据的强 ETag：<epoch>-<版本号>，数据变化时一定改变
+    def etag(self):
+        self._refresh()
+        return f'{self.epoch}-{self.version}'
+
+    # 版本 since 之后的修改：返回 (当前版本号, {键: 修改类型})；
+    # since 早于内存中保留的修改记录或不是当前序列的版本时修改为 None，需要重新获取全部数据
+    def changes_since(self, since):
+        self._refresh()
+        with self._lock:
+            if since == self.version:
+                return self.version, {}
+            if self._changes_since is None or not self._changes_since <= since < self.version:
+                return self.version, None
+            changes = {}
+            for start, end, later in self._changes:
+                if end > since:
+                    _merge_changes(changes, later)
+            return self.version, changes
+
+    # 原子地修改数据：fn(当前数据) 返回操作列表，返回修改后的数据
+    def update(self, fn):
+        with self._lock, self.backend.transaction(self):
+            ops = fn(self._refresh())
+            if not ops:
+                return self._data
+            previous = self._data
+            data = self._apply(previous, ops)
+            self._signature = self.backend.save(self, data, ops)
+            changes = _diff_entries(self._entries(previous), self._entries(data), self._touched(ops))
+            self._replace(data, self.backend.version(self), changes)
+            return data
+
+    def apply(self, *ops):
+        return self.update(lambda data: list(ops))
+
+    # 由存储后端整理已持久化的数据（日志合并进快照等），不改变数据内容
+    def compact(self):
+        if not self.backend.compact_in_transaction:
+            self.backend.compact(self, None)
+            return
+        with self._lock, self.backend.transaction(self):
+            data = self._refresh()
+            signature = self.backend.compact(self, data)
+            if signature is not None:
+                self._signature = signature
+                self._replace(data, self.backend.version(self), {})
+
+
+# 带索引的记录列表：keys 为与记录一一对应、已排序的 (排序键, id)（没有排序键时为 None），
+# by_id 为 id -> 记录（id 重复时为第一条）；本身仍是普通的 list，可以直接序列化
+class RecordList(list):
+    def __init__(self, records=(), keys=None, by_id=None):
+        super().__init__(records)
+        self.keys = keys
+        self.by_id = by_id if by_id is not None else {}
+
+
+# 以 id 标识的记录列表（资产、生活费、股票等）
+# 操作：('insert', 记录) 追加、('update', id, 字段) 合并字段、('delete', id) 删除、('replace', 记录列表) 整体替换；
+# sort_key 不为空时记录按该键保持有序，键相同的记录按 id 排序（id 为创建时间戳，即按创建顺序），
+# 顺序只由记录内容决定，不同进程、不同存储方式加载后的顺序都相同；插入和修改时用二分查找定位，不重新排序，
+# 并且可以用 between() 按排序键的范围查询；按 id 查找记录通过 by_id 哈希表完成
+class RecordCollection(Collection):
+    def __init__(self, file_path, sort_key=None, backend=None):
+        super().__init__(file_path, backend)
+        self.sort_key = sort_key
+
+    def _default(self):
+        return []
+
+    # 记录在有序列表中的位置依据
+    def _key(self, record):
+        return (self.sort_key(record), str(record['id']))
+
+    # 为记录建立索引，记录未按排序键排好时先稳定排序
+    def _index(self, records):
+        if isinstance(records, RecordList):
+            return records
+        records = list(records)
+        keys = None
+        if self.sort_key is not None:
+            keys = [self._key(record) for record in records]
+            if any(keys[i] > keys[i + 1] for i in range(len(keys) - 1)):
+                order = sorted(range(len(records)), key=keys.__getitem__)
+                records = [records[i] for i in order]
+                keys = [keys[i] for i in order]
+        by_id = {}
+        for record in records:
+            by_id.setdefault(record['id'], record)
+        return RecordList(records, keys, by_id)
+
+    def _wrap(self, data):
+        return self._index(data)
+
+    def _entries(self, data):
+        return data.by_id
+
+    # 插入、修改、删除只涉及操作中的 id（修改 id 字段时包括新旧两个 id），整体替换涉及全部记录
+    def _touched(self, ops):
+        keys = []
+        for op in ops:
+            if op[0] == 'insert':
+                keys.append(op[1]['id'])
+            elif op[0] == 'update':
+                keys.append(op[1])
+                if 'id' in op[2]:
+                    keys.append(op[2]['id'])
+            elif op[0] == 'delete':
+                keys.append(op[1])
+            else:
+                return None
+        return list(dict.fromkeys(keys))
+
+    # 记录在列表中的位置：有排序键时在相同键的范围内查找，否则顺序查找
+    def _position(self, records, keys, record):
+        start = bisect.bisect_left(keys, self._key(record)) if keys is not None else 0
+        for i in range(start, len(records)):
+            if records[i] is record:
+                return i
+        raise ValueError(f"Record {record['id']} is not indexed")
+
+    # 复制记录列表和索引，修改副本不影响共享的数据
+    def _unpack(self, data):
+        return list(data), list(data.keys) if data.keys is not None else None, dict(data.by_id)
+
+    def _apply(self, data, ops):
+        records, keys, by_id = self._unpack(data)
+        for op in ops:
+            kind = op[0]
+            if kind == 'insert':
+                record = op[1]
+                if keys is not None:
+                    key = self._key(record)
+                    i = bisect.bisect_right(keys, key)
+                    records.insert(i, record)
+                    keys.insert(i, key)
+                else:
+                    records.append(record)
+                if record['id'] in by_id:
+                    # 重复的 id 指向列表中的第一条
+                    by_id[record['id']] = next(item for item in records if item['id'] == record['id'])
+                else:
+                    by_id[record['id']] = record
+            elif kind in ('update', 'delete') and len(by_id) != len(records):
+                # 有重复的 id 时（只可能来自手工编辑的数据）按列表顺序处理后重建索引
+                if kind == 'update':
+                    i = next((i for i, record in enumerate(records) if record['id'] == op[1]), None)
+                    if i is not None:
+                        records[i] = {**records[i], **op[2]}
+                else:
+                    records = [record for record in records if record['id'] != op[1]]
+                records, keys, by_id = self._unpack(self._index(records))
+            elif kind == 'update':
+                old = by_id.get(op[1])
+                if old is None:
+                    continue
+                record = {**old, **op[2]}
+                i = self._position(records, keys, old)
+                if keys is not None and self._key(record) != keys[i]:
+                    key = self._key(record)
+                    del records[i], keys[i]
+                    i = bisect.bisect_right(keys, key)
+                    records.insert(i, record)
+                    keys.insert(i, key)
+                else:
+                    records[i] = record
+                del by_id[op[1]]
+                if record['id'] in by_id:
+                    records, keys, by_id = self._unpack(self._index(records))
+                else:
+                    by_id[record['id']] = record
+            elif kind == 'delete':
+                old = by_id.pop(op[1], None)
+                if old is None:
+                    continue
+                i = self._position(records, keys, old)
+                del records[i]
+                if keys is not None:
+                    del keys[i]
+            elif kind == 'replace':
+                records, keys, by_id = self._unpack(self._index(op[1]))
+            else:
+                raise ValueError(f'Unknown record operation: {kind}')
+        return RecordList(records, keys, by_id)
+
+    def find(self, id):
+        return self.get().by_id.get(id)
+
+    # 指定 id 的当前记录，不存在的 id 跳过
+    def pick(self, keys):
+        by_id = self.get().by_id
+        return [by_id[key] for key in keys if key in by_id]
+
+    # 排序键在 [low, high) 范围内的记录，low/high 为 None 表示不限
+    def between(self, low=None, high=None):
+        records = self.get()
+        start = bisect.bisect_left(records.keys, (low,)) if low is not None else 0
+        end = bisect.bisect_left(records.keys, (high,)) if high is not None else len(records)
+        return records[start:end]
+
+    def insert(self, record):
+        return self.apply(('insert', record))
+
+    def update_record(self, id, changes):
+        return self.apply(('update', id, changes))
+
+    def delete(self, id):
+        return self.apply(('delete', id))
+
+    def clear(self):
+        return self.apply(('replace', []))
+
+
+# 单个JSON对象（预算设置、推荐元数据）
+# 操作按路径（键列表）修改嵌套对象，路径上缺少的对象自动创建：
+# ('set', 路径, 值)、('delete', 路径)、('incr', 路径, 增量)、('append', 路径, 值)，路径为空时 set 替换整个对象
+class DocumentCollection(Collection):
+    def __init__(self, file_path, default_factory=dict, backend=None):
+        super().__init__(file_path, backend)
+        self.default_factory = default_factory
+
+    def _default(self):
+        return self.default_factory()
+
+    # 以顶层的键为条目，修改嵌套的值（如 monthly/2025-12）时整个顶层键（monthly）记为修改
+    def _entries(self, data):
+        return data if isinstance(data, dict) else {}
+
+    def _touched(self, ops):
+        if any(not op[1] for op in ops):
+            return None
+        return list(dict.fromkeys(op[1][0] for op in ops))
+
+    # 指定顶层键的当前值，不存在的键跳过
+    def pick(self, keys):
+        data = self.get()
+        return {key: data[key] for key in keys if key in data}
+
+    def _apply(self, data, ops):
+        for op in ops:
+            kind, path = op[0], op[1]
+            if not path:
+                if kind != 'set':
+                    raise ValueError(f'Operation {kind} requires a path')
+                data = op[2]
+                continue
+            # 只复制路径上的对象，其余部分与旧数据共享
+            root = dict(data)
+            parent = root
+            for key in path[:-1]:
+                child = parent.get(key)
+                parent[key] = dict(child) if isinstance(child, dict) else {}
+                parent = parent[key]
+            key = path[-1]
+            if kind == 'set':
+                parent[key] = op[2]
+            elif kind == 'delete':
+                parent.pop(key, None)
+            elif kind == 'incr':
+                parent[key] = (parent.get(key) or 0) + op[2]
+            elif kind == 'append':
+                parent[key] = list(parent.get(key) or []) + [op[2]]
+            else:
+                raise ValueError(f'Unknown document operation: {kind}')
+            data = root
+        return data
+
+
+# 把数据目录中的 JSON 文件一次性导入 SQLite 数据库：python storage.py [--data-dir data]
+# JSON 数组导入为记录列表，对象导入为单个对象；数据库中已有的仓库不会被覆盖。
+# 导入后原 JSON 文件保持不变，设置 STORAGE_BACKEND=sqlite 后不再使用
+def migrate_json_files(data_dir, backend):
+    imported = 0
+    for file_name in sorted(os.listdir(data_dir)):
+        file_path = os.path.join(data_dir, file_name)
+        if not file_name.endswith('.json') or not os.path.isfile(file_path):
+            continue
+        data = read_json_file(file_path)
+        collection = DocumentCollection(file_path, backend=backend) if isinstance(data, dict) \
+            else RecordCollection(file_path, backend=backend)
+        imported += backend._import_json(collection)
+    return imported
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    parser = argparse.ArgumentParser(description='Import the JSON data files into the SQLite store')
+    parser.add_argument('--data-dir', default=os.path.join(os.path.dirname(__file__), os.getenv('DATA_DIR', 'data')))
+    parser.add_argument('--database', default=os.getenv('STORAGE_SQLITE_FILE', 'store.sqlite3'),
+                        help='database file, relative to the data directory')
+    args = parser.parse_args()
+
+    backend = SqliteBackend(os.path.join(args.data_dir, args.database))
+    print(f"Imported {migrate_json_files(args.data_dir, backend)} entries into {backend.path}")
@@ -0,0 +1,144 @@
+# 腾讯财经实时报价解析
+#
+# 响应为 GBK 编码的文本，每个代码一条记录，以分号结尾：
+#   v_sh600031="1~三一重工~600031~18.50~18.32~18.40~...";
+# 记录内字段以 ~ 分隔，一次请求可包含任意多条记录
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 腾讯接口的响应编码
+QUOTE_ENCODING = 'gbk'
+
+# 一条完整记录至少包含的字段数（到跌停价为止）
+MIN_FIELDS = 49
+
+# 买卖五档在字段中的起始位置：买一价、买一量、买二价、买二量……
+BID_START = 9
+ASK_START = 19
+DEPTH = 5
+
+
+def _float(value):
+    return float(value) if value else 0.0
+
+
+def _int(value):
+    return int(value) if value else 0
+
+
+# 一只股票的实时报价
+# 使用 __slots__ 避免每条记录一个 __dict__，批量解析几百只股票时更省内存
+class TencentQuote:
+    __slots__ = (
+        'symbol',           # 带市场前缀的代码，如 sh600031
+        'name',             # 股票名称
+        'code',             # 股票代码
+        'price',            # 当前价
+        'previous_close',   # 昨收
+        'open',             # 今开
+        'volume',           # 成交量（手）
+        'outer_volume',     # 外盘（手）
+        'inner_volume',     # 内盘（手）
+        'bid_prices',       # 买一至买五价格
+        'bid_volumes',      # 买一至买五数量（手）
+        'ask_prices',       # 卖一至卖五价格
+        'ask_volumes',      # 卖一至卖五数量（手）
+        'time',             # 行情时间 YYYYMMDDHHMMSS
+        'change',           # 涨跌额
+        'change_percent',   # 涨跌幅（%）
+        'high',             # 最高
+        'low',              # 最低
+        'amount',           # 成交额（万元）
+        'turnover_rate',    # 换手率（%）
+        'pe',               # 市盈率
+        'amplitude',        # 振幅（%）
+        'float_market_cap', # 流通市值（亿元）
+        'total_market_cap', # 总市值（亿元）
+        'pb',               # 市净率
+        'limit_up',         # 涨停价
+        'limit_down',       # 跌停价
+    )
+
+    # 从 ~ 分隔的字段列表构建报价
+    @classmethod
+    def from_fields(cls, symbol, fields):
+        quote = cls()
+        quote.symbol = symbol
+        quote.name = fields[1]
+        quote.code = fields[2]
+        quote.price = _float(fields[3])
+        quote.previous_close = _float(fields[4])
+        quote.open = _float(fields[5])
+        quote.volume = _int(fields[36] or fields[6])
+        quote.outer_volume = _int(fields[7])
+        quote.inner_volume = _int(fields[8])
+        quote.bid_prices = tuple(_float(v) for v in fields[BID_START:BID_START + 2 * DEPTH:2])
+        quote.bid_volumes = tuple(_int(v) for v in fields[BID_START + 1:BID_START + 2 * DEPTH:2])
+        quote.ask_prices = tuple(_float(v) for v in fields[ASK_START:ASK_START + 2 * DEPTH:2])
+        quote.ask_volumes = tuple(_int(v) for v in fields[ASK_START + 1:ASK_START + 2 * DEPTH:2])
+        quote.time = fields[30]
+        quote.change = _float(fields[31])
+        quote.change_percent = _float(fields[32])
+        quote.high = _float(fields[33])
+        quote.low = _float(fields[34])
+        quote.amount = _float(fields[37])
+        quote.turnover_rate = _float(fields[38])
+        quote.pe = _float(fields[39])
+        quote.amplitude = _float(fields[43])
+        quote.float_market_cap = _float(fields[44])
+        quote.total_market_cap = _float(fields[45])
+        quote.pb = _float(fields[46])
+        quote.limit_up = _float(fields[47])
+        quote.limit_down = _float(fields[48])
+        return quote
+
+    # 接口返回的报价字段
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'currentPrice': self.price,
+            'open': self.open,
+            'high': self.high,
+            'low': self.low,
+            'previousClose': self.previous_close,
+            'volume': self.volume,
+            'changePercent': self.change_percent,
+            'amount': self.amount,
+            'turnoverRate': self.turnover_rate,
+            'limitUp': self.limit_up,
+            'limitDown': self.limit_down
+        }
+
+    def __repr__(self):
+        return f'TencentQuote({self.symbol!r}, {self.name!r}, price={self.price})'
+
+
+# 将响应内容解码为文本，bytes 按 GBK 解码
+def decode_payload(payload):
+    if isinstance(payload, bytes):
+        return payload.decode(QUOTE_ENCODING, errors='replace')
+    return payload
+
+
+# 解析包含多条记录的报价响应，返回 {带前缀代码: TencentQuote}
+# 字段不完整的记录（如停牌、代码不存在时返回的 v_pv_none_match="1"）直接跳过；
+# 数值字段无法解析的记录（如 '-'）记录警告后跳过，不影响同一响应中的其他记录
+def parse_quotes(payload):
+    quotes = {}
+    for record in decode_payload(payload).split(';'):
+        start = record.find('v_')
+        if start < 0:
+            continue
+        eq = record.find('=', start)
+        if eq < 0:
+            continue
+        fields = record[eq + 1:].strip().strip('"').split('~')
+        if len(fields) < MIN_FIELDS:
+            continue
+        symbol = record[start + 2:eq]
+        try:
+            quotes[symbol] = TencentQuote.from_fields(symbol, fields)
+        except ValueError as e:
+            logger.warning("Skipping malformed quote for %s: %s", symbol, e)
+    return quotes
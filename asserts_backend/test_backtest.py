@@ -0,0 +1,87 @@
+# 回测测试：收盘价对齐，以及持仓、盈亏和成交记录与逐日模拟的朴素实现一致
+#
+#     python -m pytest test_backtest.py
+import math
+import random
+
+import numpy as np
+
+from backtest import align_close_matrix, drawdown, run_backtest
+
+
+def test_align_close_matrix():
+    dates, matrix = align_close_matrix([
+        ([20250102, 20250103, 20250107], [10.0, 11.0, 12.0]),
+        ([20250103, 20250106], [5.0, 6.0]),
+        ([], [])
+    ], start=20250103)
+    assert list(dates) == [20250103, 20250106, 20250107]
+    # 停牌日沿用前一个收盘价
+    assert list(matrix[:, 0]) == [11.0, 11.0, 12.0]
+    assert list(matrix[:, 1]) == [5.0, 6.0, 6.0]
+    assert np.isnan(matrix[:, 2]).all()
+
+    dates, matrix = align_close_matrix([([20250106], [6.0]), ([20250102], [1.0])])
+    assert list(dates) == [20250102, 20250106]
+    # 上市之前为NaN
+    assert math.isnan(matrix[0, 0]) and matrix[1, 0] == 6.0
+    assert align_close_matrix([])[1].shape == (0, 0)
+
+
+def test_drawdown():
+    assert list(drawdown(np.array([100.0, 120.0, 90.0, 130.0]))) == [0.0, 0.0, -0.25, 0.0]
+    assert list(drawdown(np.array([0.0, 0.0, 10.0]))) == [0.0, 0.0, 0.0]
+
+
+# 朴素实现：逐日按规则买卖，返回持仓、累计盈亏和成交记录
+def simulate(closes, shares, buy_points, sell_points):
+    days, count = closes.shape
+    positions = np.zeros((days, count), dtype=np.int8)
+    pnl = np.zeros(days)
+    trades = []
+    for j in range(count):
+        holding = 0
+        cash = 0.0
+        for i in range(days):
+            close = closes[i, j]
+            price = 0.0 if math.isnan(close) else close
+            if close >= sell_points[j]:
+                signal = 0
+            elif close <= buy_points[j]:
+                signal = 1
+            else:
+                signal = holding
+            if signal != holding:
+                trades.append((i, j, signal - holding))
+                cash -= (signal - holding) * shares[j] * price
+                holding = signal
+            positions[i, j] = holding
+            pnl[i] += cash + holding * shares[j] * price
+    return positions, pnl, sorted(trades)
+
+
+def test_matches_day_by_day_simulation():
+    rng = random.Random(11)
+    for _ in range(30):
+        days, count = rng.randint(1, 40), rng.randint(1, 5)
+        closes = np.array([[rng.choice([math.nan] + [round(rng.uniform(5, 15), 1)] * 9) for _ in range(count)] for _ in range(days)])
+        shares = [rng.choice([100, 200, 500]) for _ in range(count)]
+        buy_points = [rng.uniform(5, 9) for _ in range(count)]
+        sell_points = [rng.uniform(11, 15) for _ in range(count)]
+
+        result = run_backtest(closes, shares, buy_points, sell_points)
+        positions, pnl, trades = simulate(closes, shares, buy_points, sell_points)
+
+        assert (result['positions'] == positions).all()
+        assert np.allclose(result['pnl'], pnl)
+        assert np.allclose(result['values'], np.nan_to_num(closes) @ np.array(shares, dtype=float))
+        rows, columns, changes = result['trades']
+        assert sorted(zip(rows.tolist(), columns.tolist(), changes.tolist())) == trades
+        assert math.isclose(result['stockPnl'].sum(), pnl[-1], abs_tol=1e-6)
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+    print('backtest: ok')
@@ -0,0 +1,97 @@
+# 本地K线存储测试（不访问网络）：首次全量同步、收盘后不再访问上游、增量追加，以及复权价格变化时重新全量同步
+#
+#     python -m pytest test_kline_store.py
+import tempfile
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from kline_store import KlineStore
+
+
+# 假的上游：按日期返回K线，记录每次请求的日期范围
+class FakeFetcher:
+    def __init__(self, closes):
+        self.closes = dict(closes)
+        self.calls = []
+
+    def __call__(self, code, start_date, end_date):
+        self.calls.append((start_date, end_date))
+        dates = sorted(day for day in self.closes if start_date <= day <= end_date)
+        return pd.DataFrame({
+            '日期': [datetime.strptime(day, '%Y%m%d') for day in dates],
+            '开盘': [self.closes[day] for day in dates],
+            '收盘': [self.closes[day] for day in dates],
+            '最高': [self.closes[day] for day in dates],
+            '最低': [self.closes[day] for day in dates],
+            '成交量': [1000.0] * len(dates)
+        })
+
+
+def make_store(base_dir, fetcher, settle):
+    return KlineStore(base_dir, fetcher=fetcher, start_date='20250101', last_settle=lambda: settle[0])
+
+
+def test_incremental_sync():
+    fetcher = FakeFetcher({'20250102': 10.0, '20250103': 11.0, '20250106': 12.0})
+    # 最近一次收盘在过去：同步后的数据一直视为最新
+    settle = [datetime.now() - timedelta(days=1)]
+    with tempfile.TemporaryDirectory() as base_dir:
+        store = make_store(base_dir, fetcher, settle)
+        assert list(store.closes('600000')) == [10.0, 11.0, 12.0]
+        assert fetcher.calls[0][0] == '20250101'
+
+        # 已经包含最近一次收盘，不再访问上游
+        assert list(store.closes('600000')) == [10.0, 11.0, 12.0]
+        assert len(fetcher.calls) == 1
+
+        # 新的收盘之后：从倒数第二根K线开始下载，最后一根用新数据覆盖
+        settle[0] = datetime.now() + timedelta(days=1)
+        fetcher.closes.update({'20250106': 12.5, '20250107': 13.0})
+        bars = store.sync('600000')
+        assert fetcher.calls[-1][0] == '20250103'
+        assert list(bars['date']) == [20250102, 20250103, 20250106, 20250107]
+        assert list(bars['close']) == [10.0, 11.0, 12.5, 13.0]
+        assert list(store.load('600000')['close']) == [10.0, 11.0, 12.5, 13.0]
+        assert store.stored_codes() == ['600000']
+
+
+def test_adjustment_change_triggers_full_sync():
+    fetcher = FakeFetcher({'20250102': 10.0, '20250103': 11.0, '20250106': 12.0})
+    settle = [datetime.now() + timedelta(days=1)]
+    with tempfile.TemporaryDirectory() as base_dir:
+        store = make_store(base_dir, fetcher, settle)
+        store.sync('000001')
+        # 除权后前复权价格整体变化
+        fetcher.closes = {day: close / 2 for day, close in fetcher.closes.items()}
+        fetcher.closes['20250107'] = 6.5
+        bars = store.sync('000001')
+        assert [call[0] for call in fetcher.calls] == ['20250101', '20250103', '20250101']
+        assert list(bars['close']) == [5.0, 5.5, 6.0, 6.5]
+
+
+def test_missing_overlap_triggers_full_sync():
+    fetcher = FakeFetcher({'20250102': 10.0, '20250103': 11.0, '20250106': 12.0})
+    settle = [datetime.now() + timedelta(days=1)]
+    with tempfile.TemporaryDirectory() as base_dir:
+        store = make_store(base_dir, fetcher, settle)
+        store.sync('000002')
+        del fetcher.closes['20250103']
+        bars = store.sync('000002')
+        assert fetcher.calls[-1][0] == '20250101'
+        assert list(bars['date']) == [20250102, 20250106]
+
+
+def test_unknown_code():
+    with tempfile.TemporaryDirectory() as base_dir:
+        store = make_store(base_dir, FakeFetcher({}), [datetime.now()])
+        assert store.load('999999') is None
+        assert len(store.closes('999999')) == 0
+        assert store.stored_codes() == []
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+    print('kline store: ok')
@@ -0,0 +1,93 @@
+# 均线计算测试：与逐窗口求平均的朴素实现对比，覆盖缺失值、长度不同的序列和数据不足的窗口
+#
+#     python -m pytest test_ma_engine.py
+import math
+import random
+
+import numpy as np
+
+from ma_engine import align_closes, latest_moving_averages, moving_averages, parse_windows
+
+
+# 朴素实现：第 end 个交易日（不含）之前 window 个收盘价的平均值，窗口内有缺失或数据不足时为NaN
+def naive_average(closes, end, window):
+    if end - window < 0:
+        return math.nan
+    values = closes[end - window:end]
+    if any(math.isnan(value) for value in values):
+        return math.nan
+    return sum(values) / window
+
+
+def same(a, b):
+    if math.isnan(a) or math.isnan(b):
+        return math.isnan(a) and math.isnan(b)
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+
+
+def random_series(rng, length, gap_rate):
+    return [math.nan if rng.random() < gap_rate else round(rng.uniform(1, 200), 2) for _ in range(length)]
+
+
+def test_matches_naive_rolling_mean():
+    rng = random.Random(7)
+    for _ in range(20):
+        series_list = [random_series(rng, rng.randint(0, 60), rng.choice([0, 0.05])) for _ in range(rng.randint(1, 6))]
+        windows = rng.sample(range(1, 40), 4)
+        tail = rng.randint(1, 70)
+        matrix = align_closes(series_list)
+        result = moving_averages(matrix, windows, tail=tail)
+        length = matrix.shape[1]
+        expected_tail = min(tail, length)
+        for window in windows:
+            assert result[window].shape == (len(series_list), expected_tail)
+            for i in range(len(series_list)):
+                row = list(matrix[i])
+                for j in range(expected_tail):
+                    end = length - expected_tail + 1 + j
+                    assert same(result[window][i, j], naive_average(row, end, window)), (window, i, end)
+
+
+def test_one_dimensional_input():
+    closes = [1.0, 2.0, 3.0, 4.0, 5.0]
+    result = moving_averages(closes, [2, 5, 6], tail=2)
+    assert np.allclose(result[2], [[3.5, 4.5]])
+    assert np.allclose(result[5][0, 1], 3.0) and math.isnan(result[5][0, 0])
+    assert np.isnan(result[6]).all()
+
+
+def test_align_closes_pads_left():
+    matrix = align_closes([[1.0, 2.0, 3.0], [4.0], []])
+    assert matrix.shape == (3, 3)
+    assert list(matrix[0]) == [1.0, 2.0, 3.0]
+    assert np.isnan(matrix[1, :2]).all() and matrix[1, 2] == 4.0
+    assert np.isnan(matrix[2]).all()
+    assert align_closes([]).shape == (0, 0)
+
+
+def test_latest_moving_averages():
+    series_list = [[10.0, 11.0, 12.333], [5.0], []]
+    latest = latest_moving_averages(series_list, [1, 3])
+    assert latest[0] == {'ma1': 12.33, 'ma3': round((10.0 + 11.0 + 12.333) / 3, 2)}
+    assert latest[1] == {'ma1': 5.0, 'ma3': 0}
+    assert latest[2] == {'ma1': 0, 'ma3': 0}
+    assert latest_moving_averages([[], []], [5]) == [{'ma5': 0}, {'ma5': 0}]
+
+
+def test_parse_windows():
+    assert parse_windows(None) == [51, 120, 250, 850]
+    assert parse_windows('60, 20,,20') == [20, 60]
+    assert parse_windows(' , ', default=(5,)) == [5]
+    for value in ('0', '-5', 'abc'):
+        try:
+            parse_windows(value)
+        except ValueError:
+            continue
+        raise AssertionError(f'{value!r} should be rejected')
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+    print('ma engine: ok')
@@ -0,0 +1,68 @@
+# 均线表测试：写入后读取、按代码查询，以及多个线程同时重建同一张表
+#
+#     python -m pytest test_ma_table.py
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from ma_table import MATable, write_ma_table
+
+CODES = ['000001', '000002', '600000']
+
+
+def make_columns(scale):
+    return {
+        'ma5': np.array([1.0, np.nan, 3.0]) * scale,
+        'close': np.array([10.0, 20.0, 30.0]) * scale,
+        'synced_at': np.array([100.0, 100.0, 50.0]),
+    }
+
+
+def test_round_trip():
+    with tempfile.TemporaryDirectory() as data_dir:
+        path = os.path.join(data_dir, 'ma_table.bin')
+        write_ma_table(path, CODES, make_columns(1), [5], built_at=123)
+        table = MATable(path)
+        assert len(table) == 3 and table.windows == [5] and table.built_at == 123
+        averages = table.averages(['600000', '999999', '000002'], [5, 10])
+        assert averages[5][0] == 3.0 and np.isnan(averages[5][1:]).all()
+        assert np.isnan(averages[10]).all()
+        assert table.fresh_averages(CODES, [5], since=80) == {'000001': {'ma5': 1.0}, '000002': {'ma5': 0}}
+
+        # 重新生成后读取新内容
+        write_ma_table(path, CODES, make_columns(2), [5])
+        assert table.averages(['000001'], [5])[5][0] == 2.0
+
+
+def test_concurrent_writers():
+    with tempfile.TemporaryDirectory() as data_dir:
+        path = os.path.join(data_dir, 'ma_table.bin')
+        errors = []
+
+        def writer(scale):
+            try:
+                for _ in range(20):
+                    write_ma_table(path, CODES, make_columns(scale), [5])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=writer, args=(scale,)) for scale in range(1, 5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert not errors
+        assert os.listdir(data_dir) == ['ma_table.bin']
+        # 最终文件完整，来自某一个写入者
+        ma5 = MATable(path).averages(CODES, [5])[5]
+        assert ma5[0] in (1.0, 2.0, 3.0, 4.0) and ma5[2] == ma5[0] * 3
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+    print('ma table: ok')
@@ -0,0 +1,57 @@
+# 按月份查询测试：参数解析、月末日期和 9999-12 等边界月份
+#
+#     python -m pytest test_month_range.py
+import os
+import tempfile
+from datetime import datetime
+
+# 导入 app 之前关闭后台任务，数据文件写到临时目录
+os.environ['DATA_DIR'] = tempfile.mkdtemp()
+for name in ('PORTFOLIO_REFRESH_INTERVAL', 'STREAM_POLL_INTERVAL', 'STORAGE_COMPACT_INTERVAL'):
+    os.environ[name] = '0'
+
+import app  # noqa: E402
+
+
+def test_next_month_start():
+    assert app.next_month_start(datetime(2025, 1, 31)) == datetime(2025, 2, 1)
+    assert app.next_month_start(datetime(2025, 12, 1)) == datetime(2026, 1, 1)
+    assert app.next_month_start(datetime(9999, 12, 1)) == datetime.max
+
+
+def test_month_end_date():
+    assert app.month_end_date('2024-02') == '2024-02-29'
+    assert app.month_end_date('2025-02') == '2025-02-28'
+    assert app.month_end_date('2025-12') == '2025-12-31'
+    assert app.month_end_date('9999-12') == '9999-12-31'
+
+
+def test_parse_month_range():
+    assert app.parse_month_range({'from': '2025-01', 'to': '2025-06'}) == (datetime(2025, 1, 1), datetime(2025, 7, 1))
+    assert app.parse_month_range({'year': '2025', 'to': '2025-03'}) == (datetime(2025, 1, 1), datetime(2025, 4, 1))
+    assert app.parse_month_range({'to': '9999-12'}) == (None, datetime.max)
+    assert app.parse_month_range({'year': '9999'}) == (datetime(9999, 1, 1), datetime.max)
+
+
+def test_expense_queries_at_the_last_month():
+    client = app.app.test_client()
+    client.delete('/api/expenses')
+    client.post('/api/expenses', json={'month': '9999-12', 'amount': 1})
+    client.post('/api/expenses', json={'month': '2025-06', 'amount': 2})
+
+    response = client.get('/api/expenses?to=9999-12')
+    assert response.status_code == 200
+    assert len(response.get_json()) == 2
+    response = client.get('/api/expenses?year=9999')
+    assert response.status_code == 200
+    assert [record['date'] for record in response.get_json()] == ['9999-12-31']
+    assert [record['amount'] for record in client.get('/api/expenses?from=2025-01&to=2025-12').get_json()] == [2]
+    for query in ('to=10000-01', 'to=2025-13', 'year=10000', 'year=abc'):
+        assert client.get(f'/api/expenses?{query}').status_code == 400, query
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+    print('month range: ok')
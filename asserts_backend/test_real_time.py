@@ -0,0 +1,145 @@
+# 实时数据接口测试（不访问网络）：数据源替换为本地的假数据，检查时间预算和分红数据加载失败时的处理
+#
+#     python -m pytest test_real_time.py
+import os
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+# 导入 app 之前关闭后台任务，数据文件写到临时目录
+os.environ['DATA_DIR'] = tempfile.mkdtemp()
+for name in ('PORTFOLIO_REFRESH_INTERVAL', 'STREAM_POLL_INTERVAL', 'STORAGE_COMPACT_INTERVAL'):
+    os.environ[name] = '0'
+
+import app  # noqa: E402
+from market_cache import DividendIndex, SpotSnapshotCache, TTLCache  # noqa: E402
+from tencent_quote import QUOTE_ENCODING, MIN_FIELDS  # noqa: E402
+
+
+def quote_payload(symbols):
+    records = []
+    for symbol in symbols:
+        fields = ['0'] * (MIN_FIELDS + 4)
+        fields[0], fields[1], fields[2], fields[3] = '1', '测试', symbol[2:], '10.00'
+        fields[30] = '20251201150000'
+        records.append(f'v_{symbol}="' + '~'.join(fields) + '";')
+    return '\n'.join(records).encode(QUOTE_ENCODING)
+
+
+# 用假数据替换行情数据源，返回各数据源的调用次数
+def install_provider(dividends):
+    calls = {'dividends': 0}
+    lock = threading.Lock()
+
+    def count_dividends():
+        with lock:
+            calls['dividends'] += 1
+        return dividends()
+
+    provider = app.market_data
+    provider.quotes = quote_payload
+    provider.spot = lambda: pd.DataFrame({
+        '代码': ['600000'], '名称': ['测试'], '最新价': [10.0], '市盈率-动态': [5.0],
+        '市净率': [0.5], '总市值': [1e10], '流通市值': [1e10]
+    })
+    provider.dividends = count_dividends
+    provider.daily_bars = lambda code, start_date, end_date: None
+    provider.trade_dates = lambda: []
+
+    app.quote_cache = TTLCache('quotes')
+    app.spot_cache = SpotSnapshotCache(loader=app.spot_cache.loader, lifetime=app.spot_cache.lifetime)
+    app.dividend_index = DividendIndex(loader=app.dividend_index.loader, lifetime=app.dividend_index.lifetime)
+    return calls
+
+
+def get(url):
+    started = time.monotonic()
+    response = app.app.test_client().get(url)
+    return response, time.monotonic() - started
+
+
+def test_dividend_failure_is_reported_not_retried():
+    def failing_dividends():
+        time.sleep(0.6)
+        raise RuntimeError('dividend upstream down')
+
+    calls = install_provider(failing_dividends)
+    response, elapsed = get('/api/stocks/real-time/600000?budget_ms=1000')
+    data = response.get_json()
+    assert response.status_code == 200
+    assert data['failedSources'] == ['dividend']
+    assert 'dividendYield' not in data and 'pendingSources' not in data
+    assert data['pe'] == 5.0
+    assert calls['dividends'] == 1
+    assert elapsed < 0.95
+
+    # 失败后的退避期内不再同步下载分红数据
+    response, elapsed = get('/api/stocks/real-time/600000?budget_ms=1000')
+    assert response.get_json()['failedSources'] == ['dividend']
+    assert calls['dividends'] == 1
+    assert elapsed < 0.3
+
+
+def test_slow_dividends_are_pending():
+    release = threading.Event()
+
+    def slow_dividends():
+        release.wait(5)
+        return pd.DataFrame({'代码': ['600000'], '年均股息': [0.5]})
+
+    install_provider(slow_dividends)
+    try:
+        response, elapsed = get('/api/stocks/real-time/600000?budget_ms=200')
+        data = response.get_json()
+        assert data['pendingSources'] == ['dividend']
+        assert 'dividendYield' not in data
+        assert elapsed < 1
+    finally:
+        release.set()
+
+    # 超出预算的加载在后台完成后，之后的请求直接使用
+    deadline = time.monotonic() + 5
+    while app.dividend_index.loaded() is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    data = get('/api/stocks/real-time/600000?budget_ms=200')[0].get_json()
+    assert data['dividendYield'] == 5.0
+    assert 'pendingSources' not in data
+
+
+
+def test_calendar_refresh_does_not_block_requests():
+    install_provider(lambda: pd.DataFrame({'代码': ['600000'], '年均股息': [0.5]}))
+    release = threading.Event()
+
+    def slow_trade_dates():
+        release.wait(3)
+        return []
+
+    app.market_data.trade_dates = slow_trade_dates
+    # 模拟跨天：交易日历需要重新加载
+    app.trading_calendar._loaded_on = None
+    try:
+        response, elapsed = get('/api/stocks/real-time/600000?budget_ms=300')
+        assert response.status_code == 200
+        assert elapsed < 1
+    finally:
+        release.set()
+
+def test_budget_validation():
+    install_provider(lambda: pd.DataFrame({'代码': ['600000'], '年均股息': [0.5]}))
+    for value in ('inf', 'nan', '-1', '1e400', 'abc'):
+        assert get(f'/api/stocks/real-time/600000?budget_ms={value}')[0].status_code == 400
+    assert app.parse_budget('1e300') == app.MAX_REAL_TIME_BUDGET_MS / 1000
+    assert app.parse_budget('0') == app.MAX_REAL_TIME_BUDGET_MS / 1000
+    assert app.parse_budget('1500') == 1.5
+    # 未指定时使用有限的默认预算
+    assert app.parse_budget(None) == float(os.getenv('REAL_TIME_BUDGET_MS', 2000)) / 1000
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+    print('real-time: ok')
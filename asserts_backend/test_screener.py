@@ -0,0 +1,89 @@
+# 选股测试：查询参数解析，以及区间、均线条件和排序与逐行筛选的朴素实现一致
+#
+#     python -m pytest test_screener.py
+import random
+
+import numpy as np
+
+from screener import MAX_LIMIT, ScreenQuery, build_columns, ma_mask, order_rows, parse_screen_query, range_mask
+
+
+# 快照列式副本的最小替身
+class FakeTable:
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        return len(next(iter(self.columns.values())))
+
+
+def test_parse_screen_query():
+    query = parse_screen_query({
+        'minPe': '0', 'maxPe': '15', 'minDividendYield': '3', 'aboveMa': '250, 51', 'belowMa': '',
+        'sort': '-dividendYield', 'limit': '20'
+    })
+    assert query.ranges == {'pe': (0.0, 15.0), 'dividendYield': (3.0, None)}
+    assert query.above_ma == [250, 51] and query.below_ma == []
+    assert query.ma_windows() == [51, 250]
+    assert query.sort == 'dividendYield' and query.descending and query.limit == 20
+
+    assert parse_screen_query({}).limit == 50
+    assert parse_screen_query({'limit': '100000'}).limit == MAX_LIMIT
+    for args in ({'sort': 'name'}, {'limit': '0'}, {'aboveMa': '-5'}, {'minPe': 'abc'}):
+        try:
+            parse_screen_query(args)
+        except ValueError:
+            continue
+        raise AssertionError(f'{args} should be rejected')
+
+
+def test_build_columns():
+    table = FakeTable({'最新价': np.array([10.0, 0.0, 20.0]), '市盈率-动态': np.array([5.0, 6.0, 7.0])})
+    columns = build_columns(table, np.array([0.5, 1.0, 0.0]))
+    assert list(columns['dividendYield']) == [5.0, 0.0, 0.0]
+    assert list(columns['pe']) == [5.0, 6.0, 7.0]
+    assert list(columns['pb']) == [0.0, 0.0, 0.0]
+
+
+def test_matches_row_by_row_filter():
+    rng = random.Random(3)
+    fields = ['currentPrice', 'pe', 'pb', 'totalMarketValue', 'circulationMarketValue', 'dividendYield']
+    for _ in range(20):
+        count = rng.randint(0, 80)
+        columns = {field: np.array([rng.choice([0.0, rng.uniform(-20, 100)]) for _ in range(count)]) for field in fields}
+        averages = {window: np.array([rng.choice([np.nan, rng.uniform(0, 100)]) for _ in range(count)]) for window in (20, 60)}
+        ranges = {}
+        for field in rng.sample(fields, 2):
+            ranges[field] = (rng.choice([None, rng.uniform(-10, 50)]), rng.choice([None, rng.uniform(50, 100)]))
+        query = ScreenQuery(
+            ranges=ranges, above_ma=rng.sample([20, 60], rng.randint(0, 1)), below_ma=rng.sample([20, 60], rng.randint(0, 1)),
+            sort=rng.choice([None, 'pe', 'dividendYield']), descending=rng.random() < 0.5, limit=rng.randint(1, 30)
+        )
+
+        mask = range_mask(columns, query) & ma_mask(columns['currentPrice'], averages, query)
+        rows = order_rows(columns, np.nonzero(mask)[0], query)
+
+        # 朴素实现：逐行判断（与 NaN 比较总是不满足条件），再按稳定排序截取
+        expected = []
+        for i in range(count):
+            price = columns['currentPrice'][i]
+            if not price > 0:
+                continue
+            if any((low is not None and not columns[field][i] >= low) or (high is not None and not columns[field][i] <= high)
+                   for field, (low, high) in ranges.items()):
+                continue
+            if any(not price > averages[window][i] for window in query.above_ma):
+                continue
+            if any(not price < averages[window][i] for window in query.below_ma):
+                continue
+            expected.append(i)
+        if query.sort:
+            expected.sort(key=lambda i: -columns[query.sort][i] if query.descending else columns[query.sort][i])
+        assert list(rows) == expected[:query.limit]
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+    print('screener: ok')
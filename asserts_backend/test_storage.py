@@ -0,0 +1,300 @@
+# 数据存储的多进程并发测试（不访问网络）
+#
+# 多个进程（模拟 gunicorn worker）各自用多个线程同时修改同一组数据文件，
+# 检查每一次修改都被保留（没有丢失更新），写入过程中数据文件始终完整可读，
+# 并且各进程看到的版本号和修改记录一致：
+#
+#     python test_storage.py [--workers 4] [--threads 4] [--writes 25]
+#
+# 也可以用 pytest 运行：python -m pytest test_storage.py
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+
+from storage import RecordCollection, DocumentCollection, JsonFileBackend, JournalBackend, SqliteBackend, \
+    write_json_file
+
+WORKERS = 4
+THREADS = 4
+WRITES = 25
+
+BACKENDS = ['json', 'journal', 'sqlite']
+
+
+def create_backend(kind, data_dir):
+    if kind == 'sqlite':
+        return SqliteBackend(os.path.join(data_dir, 'store.sqlite3'))
+    if kind == 'journal':
+        return JournalBackend()
+    return JsonFileBackend()
+
+
+def open_collections(kind, data_dir):
+    backend = create_backend(kind, data_dir)
+    records = RecordCollection(os.path.join(data_dir, 'records.json'), backend=backend)
+    counters = DocumentCollection(os.path.join(data_dir, 'counters.json'), backend=backend)
+    return records, counters
+
+
+# 一个 worker 进程：threads 个线程各自执行 writes 次插入和计数加一
+def run_worker(kind, data_dir, worker, threads, writes):
+    sys.stdout = open(os.devnull, 'w')
+    records, counters = open_collections(kind, data_dir)
+
+    def write(thread):
+        for i in range(writes):
+            records.insert({'id': f'{worker}-{thread}-{i}', 'worker': worker})
+            counters.apply(('incr', ['total'], 1), ('incr', ['workers', str(worker)], 1))
+
+    pool = [threading.Thread(target=write, args=(thread,)) for thread in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+
+def run_concurrent_writes(kind, workers=WORKERS, threads=THREADS, writes=WRITES):
+    with tempfile.TemporaryDirectory(prefix='test_storage_') as data_dir:
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=run_worker, args=(kind, data_dir, worker, threads, writes))
+            for worker in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            assert process.exitcode == 0, f'worker exited with {process.exitcode}'
+
+        # 用新的进程内实例重新读取，结果来自持久化的数据而不是某个 worker 的内存
+        records, counters = open_collections(kind, data_dir)
+        expected = workers * threads * writes
+        ids = [record['id'] for record in records.get()]
+        assert len(ids) == expected, f'{kind}: {len(ids)} records, expected {expected}'
+        assert len(set(ids)) == expected, f'{kind}: duplicate records'
+        assert counters.get()['total'] == expected, f'{kind}: total {counters.get()["total"]}, expected {expected}'
+        assert counters.get()['workers'] == {str(worker): threads * writes for worker in range(workers)}
+        return expected
+
+
+def test_no_lost_updates_json():
+    run_concurrent_writes('json')
+
+
+def test_no_lost_updates_journal():
+    run_concurrent_writes('journal')
+
+
+def test_no_lost_updates_sqlite():
+    run_concurrent_writes('sqlite')
+
+
+# 另一个进程修改数据后，本进程通过版本号变化得到同样的版本号和修改记录
+def run_change_feed(kind):
+    with tempfile.TemporaryDirectory(prefix='test_storage_') as data_dir:
+        records, counters = open_collections(kind, data_dir)
+        for i in range(5):
+            records.insert({'id': str(i)})
+        since = records.changes_since(0)[0]
+
+        def modify():
+            sys.stdout = open(os.devnull, 'w')
+            other, _ = open_collections(kind, data_dir)
+            other.insert({'id': 'new'})
+            other.insert({'id': 'gone'})
+            other.delete('gone')
+            other.update_record('1', {'value': 1})
+            other.delete('2')
+
+        process = multiprocessing.get_context('fork').Process(target=modify)
+        process.start()
+        process.join()
+        assert process.exitcode == 0, f'worker exited with {process.exitcode}'
+
+        version, changes = records.changes_since(since)
+        assert version == since + 5, f'{kind}: version {version}, expected {since + 5}'
+        assert changes == {'new': 'inserted', '1': 'updated', '2': 'deleted'}, f'{kind}: {changes}'
+        assert records.etag() == open_collections(kind, data_dir)[0].etag()
+        assert records.changes_since(version) == (version, {})
+        # 早于内存中修改记录的版本需要重新获取全部数据
+        assert records.changes_since(-1) == (version, None)
+
+
+def test_change_feed_json():
+    run_change_feed('json')
+
+
+def test_change_feed_journal():
+    run_change_feed('journal')
+
+
+def test_change_feed_sqlite():
+    run_change_feed('sqlite')
+
+
+def by_date(record):
+    return record['date']
+
+
+# 修改日期使记录移动到日期相同的其他记录之间后，新进程加载得到的顺序与修改进程内存中的顺序相同
+# （同一版本的 ETag 对应同一份响应内容），各存储方式的顺序也相同
+def test_order_after_moving_update():
+    orders = {}
+    for kind in BACKENDS:
+        with tempfile.TemporaryDirectory(prefix='test_storage_') as data_dir:
+            backend = create_backend(kind, data_dir)
+            records = RecordCollection(os.path.join(data_dir, 'records.json'), sort_key=by_date, backend=backend)
+            for i, date in enumerate(['2025-01-02', '2025-01-01', '2025-01-02', '2025-01-03', '2025-01-01']):
+                records.insert({'id': f'{100 + i}', 'date': date})
+            records.update_record('101', {'date': '2025-01-02'})
+            records.update_record('103', {'date': '2025-01-02'})
+            records.update_record('100', {'date': '2025-01-01'})
+            in_memory = [record['id'] for record in records.get()]
+
+            reloaded = RecordCollection(records.file_path, sort_key=by_date, backend=create_backend(kind, data_dir))
+            assert [record['id'] for record in reloaded.get()] == in_memory, f'{kind}: order differs after reload'
+            assert reloaded.etag() == records.etag()
+            orders[kind] = in_memory
+    assert orders['json'] == orders['journal'] == orders['sqlite'] == ['100', '104', '101', '102', '103'], orders
+
+
+# 不用索引的参照实现：按列表顺序执行操作，修改后整体按 (排序键, id) 稳定排序
+def reference_apply(records, ops, sort_key):
+    records = list(records)
+    for op in ops:
+        if op[0] == 'insert':
+            records.append(op[1])
+        elif op[0] == 'update':
+            i = next((i for i, record in enumerate(records) if record['id'] == op[1]), None)
+            if i is not None:
+                records[i] = {**records[i], **op[2]}
+        elif op[0] == 'delete':
+            records = [record for record in records if record['id'] != op[1]]
+        elif op[0] == 'replace':
+            records = list(op[1])
+    if sort_key is not None:
+        records.sort(key=lambda record: (sort_key(record), record['id']))
+    return records
+
+
+def random_op(rng, records, step):
+    ids = [record['id'] for record in records] or ['missing']
+    kind = rng.choice(['insert'] * 4 + ['update'] * 3 + ['delete'] * 2 + ['replace'] * (step % 50 == 0))
+    if kind == 'insert':
+        # id 范围较小，会出现重复的 id
+        return ('insert', {'id': str(rng.randint(0, 60)), 'date': f'2020-{rng.randint(1, 12):02d}', 'v': step})
+    if kind == 'update':
+        return ('update', rng.choice(ids), rng.choice([{'v': step}, {'date': f'2020-{rng.randint(1, 12):02d}'}]))
+    if kind == 'delete':
+        return ('delete', rng.choice(ids))
+    return ('replace', [{'id': str(i), 'date': f'2020-{rng.randint(1, 12):02d}'} for i in range(rng.randint(0, 8))])
+
+
+# 随机的增删改序列：带索引的增量修改与参照实现的结果相同，按日期的范围查询与顺序扫描的结果相同
+def test_index_matches_linear_scan():
+    rng = random.Random(1)
+    for sort_key in (None, by_date):
+        for _ in range(10):
+            with tempfile.TemporaryDirectory(prefix='test_storage_') as data_dir:
+                records = RecordCollection(os.path.join(data_dir, 'records.json'), sort_key=sort_key)
+                expected = []
+                for step in range(150):
+                    ops = [random_op(rng, expected, step)]
+                    if rng.random() < 0.2:
+                        ops.append(('insert', {'id': f'm{step}', 'date': '2020-05'}))
+                    expected = reference_apply(expected, ops, sort_key)
+                    assert list(records.apply(*ops)) == expected, ops
+                    if sort_key is None:
+                        continue
+                    low, high = sorted(f'2020-{rng.randint(1, 13):02d}' for _ in range(2))
+                    assert records.between(low, high) == [r for r in expected if low <= r['date'] < high]
+                    assert records.between(low) == [r for r in expected if low <= r['date']]
+                    assert records.between(high=high) == [r for r in expected if r['date'] < high]
+                # 重新从文件加载得到同样的结果
+                reloaded = RecordCollection(records.file_path, sort_key=sort_key)
+                assert list(reloaded.get()) == expected
+
+
+# SQLite 整理在写事务之外把 WAL 写回数据库文件，整理后数据不变
+def test_compact_sqlite():
+    with tempfile.TemporaryDirectory(prefix='test_storage_') as data_dir:
+        records, counters = open_collections('sqlite', data_dir)
+        for i in range(20):
+            records.insert({'id': str(i)})
+            counters.apply(('incr', ['total'], 1))
+        records.compact()
+        counters.compact()
+        assert os.path.getsize(os.path.join(data_dir, 'store.sqlite3-wal')) == 0, 'WAL not checkpointed'
+        records, counters = open_collections('sqlite', data_dir)
+        assert [record['id'] for record in records.get()] == [str(i) for i in range(20)]
+        assert counters.get() == {'total': 20}
+
+
+# 快照在日志之外被替换（如 git pull）时，日志不再重放，但其中的修改保留在 .stale 文件中，不被新日志覆盖
+def test_stale_journal_kept():
+    with tempfile.TemporaryDirectory(prefix='test_storage_') as data_dir:
+        records, _ = open_collections('journal', data_dir)
+        records.insert({'id': 'a'})
+        records.insert({'id': 'b'})
+        write_json_file(records.file_path, [{'id': 'pulled'}])
+
+        records, _ = open_collections('journal', data_dir)
+        assert [record['id'] for record in records.get()] == ['pulled']
+        records.insert({'id': 'c'})
+
+        stale = [name for name in os.listdir(data_dir) if '.journal.stale-' in name]
+        assert len(stale) == 1, f'stale journals: {stale}'
+        with open(os.path.join(data_dir, stale[0]), encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f]
+        assert [entry['ops'][0][1]['id'] for entry in entries[1:]] == ['a', 'b']
+        records, _ = open_collections('journal', data_dir)
+        assert [record['id'] for record in records.get()] == ['pulled', 'c']
+
+
+# 一个进程反复重写文件，另一个进程不加锁地反复读取，任何时刻文件都存在且是完整的JSON
+def test_atomic_replace():
+    with tempfile.TemporaryDirectory(prefix='test_storage_') as data_dir:
+        file_path = os.path.join(data_dir, 'records.json')
+        write_json_file(file_path, [])
+        stop = multiprocessing.get_context('fork').Event()
+
+        def rewrite():
+            sys.stdout = open(os.devnull, 'w')
+            i = 0
+            while not stop.is_set():
+                write_json_file(file_path, [{'id': str(n)} for n in range(i % 50)])
+                i += 1
+
+        writer = multiprocessing.get_context('fork').Process(target=rewrite)
+        writer.start()
+        try:
+            for _ in range(2000):
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    json.load(f)
+        finally:
+            stop.set()
+            writer.join()
+        leftovers = [name for name in os.listdir(data_dir) if name.endswith('.tmp')]
+        assert not leftovers, f'temporary files left behind: {leftovers}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Concurrent multi-process storage test')
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--threads', type=int, default=THREADS)
+    parser.add_argument('--writes', type=int, default=WRITES, help='writes per thread')
+    args = parser.parse_args()
+
+    for kind in BACKENDS:
+        count = run_concurrent_writes(kind, args.workers, args.threads, args.writes)
+        print(f"[{kind}] {args.workers} workers x {args.threads} threads: {count} writes, no lost updates")
+    test_atomic_replace()
+    print("atomic replace: file always complete")
+    for kind in BACKENDS:
+        run_change_feed(kind)
+    print("change feed: versions and changes agree across processes")
@@ -0,0 +1,67 @@
+# 腾讯财经报价解析测试（不访问网络），用构造的响应原文检查 GBK 解码、不完整记录和格式错误的字段：
+#
+#     python -m pytest test_tencent_quote.py
+from tencent_quote import QUOTE_ENCODING, MIN_FIELDS, parse_quotes
+
+
+# 构造一条报价记录，overrides 为 {字段位置: 值}
+def make_record(symbol, name, code, price, overrides=None, count=MIN_FIELDS + 4):
+    fields = ['0'] * count
+    fields[0] = '1'
+    fields[1] = name
+    fields[2] = code
+    fields[3] = price
+    fields[30] = '20251201150000'
+    for index, value in (overrides or {}).items():
+        fields[index] = value
+    return f'v_{symbol}="' + '~'.join(fields) + '";'
+
+
+def test_gbk_payload():
+    payload = '\n'.join([
+        make_record('sh600031', '三一重工', '600031', '18.50', {36: '123456', 46: '2.1'}),
+        make_record('sz000651', '格力电器', '000651', '40.12')
+    ]).encode(QUOTE_ENCODING)
+    quotes = parse_quotes(payload)
+    assert set(quotes) == {'sh600031', 'sz000651'}
+    quote = quotes['sh600031']
+    assert quote.name == '三一重工'
+    assert quote.price == 18.5
+    assert quote.volume == 123456
+    assert quote.pb == 2.1
+    assert quotes['sz000651'].name == '格力电器'
+
+
+def test_short_records_skipped():
+    payload = '\n'.join([
+        'v_pv_none_match="1";',
+        make_record('sh600000', '浦发银行', '600000', '8.00', count=MIN_FIELDS - 1),
+        make_record('sh600036', '招商银行', '600036', '35.00'),
+        'garbage without a record'
+    ]).encode(QUOTE_ENCODING)
+    assert list(parse_quotes(payload)) == ['sh600036']
+
+
+def test_malformed_fields_skip_only_that_record():
+    payload = '\n'.join([
+        make_record('sh600031', '三一重工', '600031', '-'),
+        make_record('sh600036', '招商银行', '600036', '35.00', {36: '12.5'}),
+        make_record('sz000001', '平安银行', '000001', '11.20', {10: 'abc'}),
+        make_record('sz000651', '格力电器', '000651', '40.12', {3: ''})
+    ]).encode(QUOTE_ENCODING)
+    quotes = parse_quotes(payload)
+    assert list(quotes) == ['sz000651']
+    # 空字段按 0 处理
+    assert quotes['sz000651'].price == 0.0
+
+
+def test_text_payload():
+    quotes = parse_quotes(make_record('sh600031', '三一重工', '600031', '18.50'))
+    assert quotes['sh600031'].code == '600031'
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+    print('tencent quote parser: ok')
@@ -0,0 +1,153 @@
+# 交易日历测试（不访问网络）：交易时段边界、午休、收盘后 15:00-15:05 的确认时间，以及超出已加载范围的日期
+#
+#     python -m pytest test_trading_calendar.py
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from trading_calendar import SHANGHAI_TZ, TradingCalendar, PRE_OPEN, TRADING, LUNCH_BREAK, CLOSED
+
+# 2025-09-01 至 2025-10-31 的交易日：工作日，国庆节 10-01 至 10-08 休市
+HOLIDAYS = {date(2025, 10, 1) + timedelta(days=i) for i in range(8)}
+TRADE_DAYS = [
+    date(2025, 9, 1) + timedelta(days=i) for i in range(61)
+    if (date(2025, 9, 1) + timedelta(days=i)).weekday() < 5 and date(2025, 9, 1) + timedelta(days=i) not in HOLIDAYS
+]
+
+
+def at(day, hour, minute, second=0):
+    return datetime(day.year, day.month, day.day, hour, minute, second, tzinfo=SHANGHAI_TZ)
+
+
+def make_calendar(now, loader=lambda: TRADE_DAYS):
+    calendar = TradingCalendar(loader=loader)
+    calendar.now = lambda: now
+    calendar.refresh()
+    return calendar
+
+
+TUESDAY = date(2025, 9, 30)
+
+
+def test_session_boundaries():
+    calendar = make_calendar(at(TUESDAY, 10, 0))
+    expected = [
+        ((9, 14, 59), CLOSED),
+        ((9, 15, 0), PRE_OPEN),
+        ((9, 29, 59), PRE_OPEN),
+        ((9, 30, 0), TRADING),
+        ((11, 29, 59), TRADING),
+        ((11, 30, 0), LUNCH_BREAK),
+        ((12, 59, 59), LUNCH_BREAK),
+        ((13, 0, 0), TRADING),
+        ((14, 59, 59), TRADING),
+        ((15, 0, 0), CLOSED),
+    ]
+    for (hour, minute, second), state in expected:
+        assert calendar.session_state(at(TUESDAY, hour, minute, second)) == state, (hour, minute, second)
+
+
+def test_lunch_break_caches_until_afternoon_open():
+    calendar = make_calendar(at(TUESDAY, 12, 0))
+    assert calendar.next_open(at(TUESDAY, 12, 0)) == at(TUESDAY, 13, 0)
+    assert calendar.quote_ttl(5, at(TUESDAY, 12, 0)) == 3600
+    # 午休结束前一秒仍至少缓存 active_ttl
+    assert calendar.quote_ttl(5, at(TUESDAY, 12, 59, 59)) == 5
+
+
+def test_settle_window():
+    calendar = make_calendar(at(TUESDAY, 15, 0))
+    # 15:00-15:05 行情仍可能变化，按交易时段缓存
+    assert calendar.quote_ttl(5, at(TUESDAY, 15, 0)) == 5
+    assert calendar.quote_ttl(5, at(TUESDAY, 15, 4, 59)) == 5
+    # 15:05 之后缓存到下一个交易日（节后 10-09）的集合竞价
+    assert calendar.quote_ttl(5, at(TUESDAY, 15, 5)) == (at(date(2025, 10, 9), 9, 15) - at(TUESDAY, 15, 5)).total_seconds()
+
+    monday = date(2025, 9, 29)
+    assert calendar.last_settle(at(TUESDAY, 15, 4, 59)) == at(monday, 15, 5)
+    assert calendar.last_settle(at(TUESDAY, 15, 5)) == at(TUESDAY, 15, 5)
+    assert calendar.next_settle(at(TUESDAY, 15, 4, 59)) == at(TUESDAY, 15, 5)
+    assert calendar.next_settle(at(TUESDAY, 15, 5)) == at(date(2025, 10, 9), 15, 5)
+    assert calendar.daily_ttl(at(TUESDAY, 15, 4)) == 60
+
+
+def test_holidays():
+    national_day = date(2025, 10, 1)
+    calendar = make_calendar(at(national_day, 10, 0))
+    assert not calendar.is_trading_day(national_day)
+    assert calendar.session_state(at(national_day, 10, 0)) == CLOSED
+    assert calendar.next_open(at(national_day, 10, 0)) == at(date(2025, 10, 9), 9, 15)
+    # 节假日期间最近一次收盘是节前最后一个交易日
+    assert calendar.last_settle(at(date(2025, 10, 5), 10, 0)) == at(TUESDAY, 15, 5)
+
+
+def test_dates_outside_loaded_range_fall_back_to_weekdays():
+    calendar = make_calendar(at(date(2025, 11, 3), 10, 0))
+    assert calendar.is_trading_day(date(2025, 11, 3))
+    assert not calendar.is_trading_day(date(2025, 11, 1))
+    assert calendar.is_trading_day(date(2025, 1, 1))  # 早于已加载范围，无法识别元旦
+    assert calendar.session_state(at(date(2025, 11, 3), 10, 0)) == TRADING
+    # 已加载范围最后一天收盘后，下一次开盘按工作日推算
+    assert calendar.next_open(at(date(2025, 10, 31), 16, 0)) == at(date(2025, 11, 3), 9, 15)
+
+
+def test_loader_failure_falls_back_to_weekdays():
+    calls = []
+
+    def failing_loader():
+        calls.append(1)
+        raise RuntimeError('upstream down')
+
+    calendar = make_calendar(at(date(2025, 10, 1), 10, 0), loader=failing_loader)
+    assert calendar.is_trading_day(date(2025, 10, 1))
+    assert calendar.is_trading_day(date(2025, 10, 2))
+    # 当天不再重试
+    assert len(calls) == 1
+
+
+
+def test_refresh_does_not_block_callers():
+    release = threading.Event()
+    calls = []
+
+    def slow_loader():
+        calls.append(1)
+        release.wait(5)
+        return TRADE_DAYS
+
+    national_day = date(2025, 10, 1)
+    calendar = TradingCalendar(loader=slow_loader)
+    calendar.now = lambda: at(national_day, 10, 0)
+    try:
+        # 加载期间按工作日处理，不等待上游
+        started = time.monotonic()
+        assert calendar.is_trading_day(national_day)
+        assert calendar.quote_ttl(5) == 5
+        assert time.monotonic() - started < 0.5
+    finally:
+        release.set()
+    deadline = time.monotonic() + 5
+    while calendar.is_trading_day(national_day) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not calendar.is_trading_day(national_day)
+    assert len(calls) == 1
+
+    # 第二天刷新期间继续使用前一天加载的交易日
+    release.clear()
+    calendar.now = lambda: at(date(2025, 10, 2), 10, 0)
+    try:
+        started = time.monotonic()
+        assert not calendar.is_trading_day(date(2025, 10, 2))
+        assert time.monotonic() - started < 0.5
+    finally:
+        release.set()
+    deadline = time.monotonic() + 5
+    while len(calls) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(calls) == 2
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+    print('trading calendar: ok')
@@ -0,0 +1,106 @@
+# 上游客户端测试（不访问网络）：调用总时限、合并请求的等待时限、重试和卡住的调用占用的并发名额
+#
+#     python -m pytest test_upstream.py
+import threading
+import time
+
+from upstream import UpstreamClient, UpstreamTimeoutError
+
+
+def make_client(**kwargs):
+    options = {'retries': 2, 'backoff': 0.01, 'max_per_host': 2, 'call_timeout': 0.3, 'call_timeouts': {}}
+    options.update(kwargs)
+    return UpstreamClient(**options)
+
+
+def elapsed(fn):
+    started = time.monotonic()
+    try:
+        fn()
+    except UpstreamTimeoutError:
+        return time.monotonic() - started
+    raise AssertionError('expected UpstreamTimeoutError')
+
+
+def test_hung_call_times_out():
+    release = threading.Event()
+    client = make_client()
+    try:
+        assert elapsed(lambda: client.call('dividend', release.wait)) < 0.6
+    finally:
+        release.set()
+
+
+def test_per_source_timeout():
+    release = threading.Event()
+    client = make_client(call_timeout=5, call_timeouts={'calendar': 0.2})
+    try:
+        assert elapsed(lambda: client.call('calendar', release.wait)) < 0.5
+    finally:
+        release.set()
+
+
+def test_followers_do_not_wait_forever():
+    release = threading.Event()
+    client = make_client()
+    errors = []
+
+    def caller():
+        try:
+            client.call('dividend', release.wait, 10)
+        except UpstreamTimeoutError as e:
+            errors.append(e)
+
+    try:
+        threads = [threading.Thread(target=caller) for _ in range(4)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(2)
+        assert time.monotonic() - started < 1
+        assert len(errors) == 4
+    finally:
+        release.set()
+
+
+def test_retries_within_deadline():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError('reset')
+        return 'ok'
+
+    assert make_client().call('hist', flaky) == 'ok'
+    assert len(attempts) == 3
+
+
+def test_hung_calls_keep_their_slots():
+    release = threading.Event()
+    client = make_client(max_per_host=1)
+    try:
+        elapsed(lambda: client.call('hist', release.wait, 1))
+        # 卡住的调用仍占用唯一的名额，下一次调用等不到名额时同样在时限内失败
+        calls = []
+        assert elapsed(lambda: client.call('hist', calls.append, 2)) < 0.6
+        assert not calls
+    finally:
+        release.set()
+    # 卡住的调用结束后名额释放
+    result = None
+    deadline = time.monotonic() + 2
+    while result is None and time.monotonic() < deadline:
+        try:
+            result = client.call('hist', lambda: 'ok')
+        except UpstreamTimeoutError:
+            pass
+    assert result == 'ok'
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+    print('upstream: ok')
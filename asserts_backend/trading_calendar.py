@@ -0,0 +1,141 @@
+import logging
+import threading
+from datetime import datetime, time, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+# 沪深交易所使用北京时间（无夏令时）
+SHANGHAI_TZ = timezone(timedelta(hours=8))
+
+# 交易时段：集合竞价 9:15 开始，连续竞价 9:30-11:30、13:00-15:00
+AUCTION_OPEN = time(9, 15)
+MORNING_OPEN = time(9, 30)
+MORNING_CLOSE = time(11, 30)
+AFTERNOON_OPEN = time(13, 0)
+AFTERNOON_CLOSE = time(15, 0)
+
+# 收盘后等待行情数据最终确定的时间
+SETTLE_DELAY = timedelta(minutes=5)
+
+# 会话状态
+PRE_OPEN = 'pre_open'
+TRADING = 'trading'
+LUNCH_BREAK = 'lunch_break'
+CLOSED = 'closed'
+
+
+# 沪深交易日历
+# 根据当前所处的交易时段推导各类缓存的有效期：
+# 交易时段内行情只缓存几秒，休市期间缓存到下一次开盘，分红和日K线每个交易日收盘后更新一次
+class TradingCalendar:
+    def __init__(self, loader=None):
+        # loader 返回交易日列表；未提供或加载失败时按工作日处理（无法识别节假日）
+        self.loader = loader
+        # (交易日集合, 第一天, 最后一天)，整体替换，读取时不需要加锁
+        self._loaded = None
+        self._loaded_on = None
+        self._lock = threading.Lock()
+
+    def now(self):
+        return datetime.now(SHANGHAI_TZ)
+
+    # 同步加载交易日历，加载失败时保留之前的数据
+    def refresh(self):
+        self._loaded_on = self.now().date()
+        try:
+            days = set(self.loader())
+        except Exception as e:
+            logger.warning("Error loading trading calendar, keeping previous days or weekdays: %s", e)
+            return
+        if days:
+            self._loaded = (days, min(days), max(days))
+
+    # 每天第一次使用时在后台线程刷新，请求线程不等待上游：
+    # 刷新完成前继续使用之前加载的交易日（或按工作日处理）；刷新失败时当天不再重试
+    def _ensure_loaded(self):
+        today = self.now().date()
+        if self.loader is None or self._loaded_on == today:
+            return
+        with self._lock:
+            if self._loaded_on == today:
+                return
+            self._loaded_on = today
+        threading.Thread(target=self.refresh, name='trading-calendar', daemon=True).start()
+
+    def is_trading_day(self, day):
+        self._ensure_loaded()
+        loaded = self._loaded
+        if loaded is not None and loaded[1] <= day <= loaded[2]:
+            return day in loaded[0]
+        return day.weekday() < 5
+
+    def _at(self, day, moment):
+        return datetime.combine(day, moment, tzinfo=SHANGHAI_TZ)
+
+    # 从 day 开始（含）的下一个交易日
+    def next_trading_day(self, day):
+        while not self.is_trading_day(day):
+            day += timedelta(days=1)
+        return day
+
+    # 当前交易时段
+    def session_state(self, now=None):
+        now = now or self.now()
+        if not self.is_trading_day(now.date()):
+            return CLOSED
+        moment = now.timetz().replace(tzinfo=None)
+        if AUCTION_OPEN <= moment < MORNING_OPEN:
+            return PRE_OPEN
+        if MORNING_OPEN <= moment < MORNING_CLOSE or AFTERNOON_OPEN <= moment < AFTERNOON_CLOSE:
+            return TRADING
+        if MORNING_CLOSE <= moment < AFTERNOON_OPEN:
+            return LUNCH_BREAK
+        return CLOSED
+
+    # 行情下一次可能变化的时间（集合竞价开始或午后开盘）
+    def next_open(self, now=None):
+        now = now or self.now()
+        day = now.date()
+        if self.is_trading_day(day):
+            moment = now.timetz().replace(tzinfo=None)
+            if moment < AUCTION_OPEN:
+                return self._at(day, AUCTION_OPEN)
+            if MORNING_CLOSE <= moment < AFTERNOON_OPEN:
+                return self._at(day, AFTERNOON_OPEN)
+        return self._at(self.next_trading_day(day + timedelta(days=1)), AUCTION_OPEN)
+
+    # 下一次收盘数据确定的时间
+    def next_settle(self, now=None):
+        now = now or self.now()
+        day = now.date()
+        if self.is_trading_day(day) and now < self._at(day, AFTERNOON_CLOSE) + SETTLE_DELAY:
+            return self._at(day, AFTERNOON_CLOSE) + SETTLE_DELAY
+        return self._at(self.next_trading_day(day + timedelta(days=1)), AFTERNOON_CLOSE) + SETTLE_DELAY
+
+    # 最近一次收盘数据确定的时间
+    def last_settle(self, now=None):
+        now = now or self.now()
+        day = now.date()
+        if not (self.is_trading_day(day) and now >= self._at(day, AFTERNOON_CLOSE) + SETTLE_DELAY):
+            day -= timedelta(days=1)
+            while not self.is_trading_day(day):
+                day -= timedelta(days=1)
+        return self._at(day, AFTERNOON_CLOSE) + SETTLE_DELAY
+
+    # 实时行情类数据的缓存时间（秒）：
+    # 交易时段（含收盘后的确认时间）内为 active_ttl，其余时间缓存到下一次开盘
+    def quote_ttl(self, active_ttl, now=None):
+        now = now or self.now()
+        state = self.session_state(now)
+        if state in (PRE_OPEN, TRADING):
+            return active_ttl
+        if state == CLOSED and self.is_trading_day(now.date()):
+            close = self._at(now.date(), AFTERNOON_CLOSE)
+            if close <= now < close + SETTLE_DELAY:
+                return active_ttl
+        return max((self.next_open(now) - now).total_seconds(), active_ttl)
+
+    # 日级数据（分红、日K线）的缓存时间（秒）：缓存到下一次收盘数据确定
+    def daily_ttl(self, now=None):
+        now = now or self.now()
+        return max((self.next_settle(now) - now).total_seconds(), 1)
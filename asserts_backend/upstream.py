@@ -0,0 +1,213 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import UPSTREAM_CALLS, UPSTREAM_ERRORS, UPSTREAM_RETRIES, UPSTREAM_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# 请求上游行情接口时默认使用的请求头
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# 上游返回这些状态码时自动重试
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+# call() 的默认总时限（秒），全市场快照分页下载五十多页、页间随机等待，正常也需要一分钟左右
+DEFAULT_CALL_TIMEOUT = 60
+DEFAULT_CALL_TIMEOUTS = {'spot': 180}
+
+
+# 上游调用（含重试）超过总时限，或等待进行中的相同调用超时
+class UpstreamTimeoutError(TimeoutError):
+    pass
+
+
+# 将调用参数转换为可哈希的合并键
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+# 一次进行中的上游调用
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# 相同请求合并（single-flight）
+# 同一个 key 同时只执行一次，并发的调用方等待这次执行并共享同一个结果（或异常），
+# 共享的结果不能被调用方修改；等待超过 timeout 秒时抛出 UpstreamTimeoutError，
+# 不会因为执行方卡住而一直等待
+class SingleFlight:
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, timeout, fn, *args, **kwargs):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+
+        if not leader:
+            if not flight.done.wait(timeout):
+                raise UpstreamTimeoutError(f'Timed out after {timeout}s waiting for an in-flight upstream call')
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn(*args, **kwargs)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+
+# 在守护线程中执行函数，返回对应的 Future；调用方超时后不再等待，卡住的线程不会阻止进程退出
+def _run_in_thread(name, fn, args, kwargs):
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+    return future
+
+
+# 上游行情数据客户端
+# 所有行情请求共用一个保持长连接的连接池，并限制每个上游的并发数、设置连接/读取超时、
+# 失败时按指数退避有限次重试，避免某个上游卡死时拖住整个worker；
+# 参数相同的并发请求合并为一次上游调用。
+# 自行发起HTTP请求的第三方函数（akshare）不一定设置超时，call() 另有总时限：
+# call_timeout 秒（call_timeouts 可按数据源单独设置）内没有返回则抛出 UpstreamTimeoutError
+class UpstreamClient:
+    def __init__(self, connect_timeout=3, read_timeout=10, retries=2, backoff=0.5,
+                 pool_size=10, max_per_host=4, headers=DEFAULT_HEADERS, call_timeout=DEFAULT_CALL_TIMEOUT, call_timeouts=DEFAULT_CALL_TIMEOUTS):
+        self.timeout = (connect_timeout, read_timeout)
+        self.call_timeout = call_timeout
+        self.call_timeouts = dict(call_timeouts)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_per_host = max_per_host
+        self._limits = {}
+        self._limits_guard = threading.Lock()
+        self._flight = SingleFlight()
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=frozenset(['GET'])
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+    # 每个上游（主机名或数据源名称）一个信号量，限制同时进行的请求数
+    def _limit(self, key):
+        with self._limits_guard:
+            if key not in self._limits:
+                self._limits[key] = threading.BoundedSemaphore(self.max_per_host)
+            return self._limits[key]
+
+    # 通过连接池发起GET请求，超时和重试由连接池适配器处理；source 为指标中的上游名称，默认为主机名
+    def get(self, url, source=None, **kwargs):
+        source = source or urlsplit(url).hostname
+        return self._flight.do(('GET', url, _freeze(kwargs)), self.call_timeout, self._get, url, source, **kwargs)
+
+    def _get(self, url, source, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        UPSTREAM_CALLS.inc(source=source)
+        try:
+            with self._limit(urlsplit(url).hostname), UPSTREAM_SECONDS.time(source=source):
+                response = self.session.get(url, **kwargs)
+            response.raise_for_status()
+        except Exception:
+            UPSTREAM_ERRORS.inc(source=source)
+            raise
+        return response
+
+    # 调用自行发起HTTP请求的第三方函数（如akshare），
+    # 同样受并发上限约束，失败时按指数退避有限次重试；包括重试在内的总耗时不超过该数据源的时限
+    def call(self, source, fn, *args, **kwargs):
+        key = (source, getattr(fn, '__name__', repr(fn)), _freeze(args), _freeze(kwargs))
+        return self._flight.do(key, self._timeout_for(source), self._call, source, fn, *args, **kwargs)
+
+    def _timeout_for(self, source):
+        return self.call_timeouts.get(source, self.call_timeout)
+
+    def _call(self, source, fn, *args, **kwargs):
+        UPSTREAM_CALLS.inc(source=source)
+        timeout = self._timeout_for(source)
+        deadline = time.monotonic() + timeout
+        with UPSTREAM_SECONDS.time(source=source):
+            for attempt in range(self.retries + 1):
+                try:
+                    return self._attempt(source, timeout, deadline, fn, args, kwargs)
+                except UpstreamTimeoutError:
+                    UPSTREAM_ERRORS.inc(source=source)
+                    raise
+                except Exception as e:
+                    delay = self.backoff * (2 ** attempt)
+                    if attempt >= self.retries or time.monotonic() + delay >= deadline:
+                        UPSTREAM_ERRORS.inc(source=source)
+                        raise
+                    UPSTREAM_RETRIES.inc(source=source)
+                    logger.warning("Upstream %s failed (attempt %d): %s, retrying in %ss", source, attempt + 1, e, delay)
+                    time.sleep(delay)
+
+    # 在单独的线程中执行一次调用，最多等待到 deadline；
+    # 超时后调用方不再等待，仍在执行的调用继续占用该上游的并发名额直到结束，卡住的调用不会无限增加
+    def _attempt(self, source, timeout, deadline, fn, args, kwargs):
+        limit = self._limit(source)
+        if not limit.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            raise UpstreamTimeoutError(f'Upstream {source} did not free a slot within {timeout}s')
+        try:
+            future = _run_in_thread(f'upstream-{source}', fn, args, kwargs)
+        except BaseException:
+            limit.release()
+            raise
+        future.add_done_callback(lambda _: limit.release())
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+        except TimeoutError:
+            # 函数自身抛出的超时异常按普通失败处理
+            if future.done():
+                raise
+            raise UpstreamTimeoutError(f'Upstream {source} did not respond within {timeout}s') from None
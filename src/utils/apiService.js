@@ -33,11 +33,26 @@ class ApiService {
     }
   }
 
+  // 按月份查询的参数
+  rangeQuery(range) {
+    if (!range) {
+      return '';
+    }
+    const params = new URLSearchParams();
+    ['from', 'to', 'year'].forEach(key => {
+      if (range[key]) {
+        params.set(key, range[key]);
+      }
+    });
+    const query = params.toString();
+    return query ? `?${query}` : '';
+  }
+
   // 资产记录相关方法
 
-  // 获取所有资产记录
-  async getAssets() {
-    return await this.request('/assets');
+  // 获取资产记录，range 可选：{ from: 'YYYY-MM', to: 'YYYY-MM' } 或 { year: 'YYYY' }，不传时返回全部记录
+  async getAssets(range = null) {
+    return await this.request('/assets' + this.rangeQuery(range));
   }
 
   // 添加资产记录
@@ -89,9 +104,9 @@ class ApiService {
   
   // 生活费记录相关方法
   
-  // 获取所有生活费记录
-  async getExpenses() {
-    return await this.request('/expenses');
+  // 获取生活费记录，range 可选：{ from: 'YYYY-MM', to: 'YYYY-MM' } 或 { year: 'YYYY' }，不传时返回全部记录
+  async getExpenses(range = null) {
+    return await this.request('/expenses' + this.rangeQuery(range));
   }
   
   // 添加生活费记录
@@ -224,6 +239,18 @@ class ApiService {
   async deleteBudgetHistoryRecord(id) {
     return await this.request(`/budgets/history/${id}`, 'DELETE');
   }
+
+  // 增量同步
+
+  // 获取版本 since 之后的修改，collection 为 'assets'、'expenses'、'budgets/history' 等；
+  // epoch、since 取自上一次返回的 epoch、version，返回 reset 为 true 时需要重新获取全部数据
+  async getChanges(collection, since, epoch = null) {
+    const params = new URLSearchParams({ since });
+    if (epoch) {
+      params.set('epoch', epoch);
+    }
+    return await this.request(`/${collection}/changes?${params}`);
+  }
 }
 
 export default new ApiService();
\ No newline at end of file
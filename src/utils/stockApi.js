@@ -57,6 +57,50 @@ class StockApi {
       throw new Error('API返回了错误信息或无法获取股票数据');
     }
   }
+
+  // 批量获取多只股票的完整数据，一次请求返回 {股票代码: 数据}
+  async getBatchStockData(symbols) {
+    const cleanSymbols = symbols.map(symbol => symbol.replace(/^(sh|sz)/, '').replace(/\..*$/, ''));
+    const url = `${this.baseUrl}/real-time?symbols=${cleanSymbols.join(',')}`;
+    const response = await fetch(url);
+    
+    if (!response.ok) {
+      throw new Error(`API请求失败: ${response.status}`);
+    }
+    
+    const results = await response.json();
+    
+    // 缓存成功获取的数据
+    Object.entries(results).forEach(([code, stockData]) => {
+      if (!stockData.error) {
+        this.stockCache[`stock_${code}`] = {
+          data: stockData,
+          timestamp: Date.now()
+        };
+      }
+    });
+    
+    return results;
+  }
+
+  // 订阅跟踪股票的实时行情推送，onChange 收到 {股票代码: 变化字段}
+  // 返回 EventSource，组件卸载时需要调用 close()
+  subscribeStockStream(onChange) {
+    const eventSource = new EventSource(`${this.baseUrl}/stream`);
+    
+    eventSource.addEventListener('snapshot', (event) => {
+      onChange(JSON.parse(event.data));
+    });
+    eventSource.onmessage = (event) => {
+      onChange(JSON.parse(event.data));
+    };
+    eventSource.onerror = (error) => {
+      // EventSource 会自动重连，这里只记录错误
+      console.error('实时行情推送连接异常:', error);
+    };
+    
+    return eventSource;
+  }
 }
 
 export default new StockApi();